@@ -0,0 +1,406 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+# Metrics compared by 'compare' - (name, True if a higher value is worse)
+COMPARE_METRICS = [('cpu_s', True), ('frame_ms_p99', True), ('alloc_peak_kib', True), ('fps', False)]
+
+
+def grid_layout(count, max_buttons=8):
+    """
+    Routine to build a synthetic crystal grid laid out the same way as MainWindow does
+    :param count: INT - Number of crystals
+    :param max_buttons: INT - Maximum number of buttons per row
+    :return: DICT - rows, columns, pixels, max_rows, max_cols, full_row & num_pixels for compile_stage_plans
+    """
+    max_cols = max_buttons - 1
+    rows, columns, pixels = [], [], []
+    row = 0
+    col = 0
+    full_row = 0
+    for pos in range(count):
+        full_row = 0
+        rows.append(row)
+        columns.append(col)
+        pixels.append(pos if pos % 12 != 11 else -1)    # every 12th crystal has no neo pixel, like the 8 ball stands
+        col += 1
+        if col > max_cols:
+            col = 0
+            row += 1
+            full_row = 1
+    return {'rows': rows, 'columns': columns, 'pixels': pixels, 'max_rows': row, 'max_cols': max_cols,
+            'full_row': full_row, 'num_pixels': max(pixels) + 1}
+
+
+def bench_plans(sizes, repeat):
+    """
+    Routine to time building the stage plans for each grid size
+    :param sizes: LIST - Crystal counts to benchmark
+    :param repeat: INT - Number of builds to time for each size
+    :return: None
+    """
+    from Plans import compile_stage_plans
+
+    print("%10s %12s %12s" % ("crystals", "best (ms)", "mean (ms)"))
+    for size in sizes:
+        layout = grid_layout(size)
+        times = timeit.repeat(lambda: compile_stage_plans(**layout), number=1, repeat=repeat)
+        print("%10d %12.3f %12.3f" % (size, min(times) * 1000, sum(times) / len(times) * 1000))
+
+
+def load_sqlite(path):
+    """
+    Routine to load the database the way MainWindow does, with the sqlite3 loader
+    :param path: STRING - Path to the SQLite database file
+    :return: None
+    """
+    from Database import Database
+    data = Database(path).load()
+    colours = {row.name: row for row in data.colours}
+    for row in data.crystals:
+        colours.get(row.colour.lower())
+
+
+def load_pandas(path):
+    """
+    Routine to load the database the way MainWindow used to, with pandas & SQLAlchemy
+    :param path: STRING - Path to the SQLite database file
+    :return: None
+    """
+    import pandas as pd
+    from sqlalchemy import create_engine
+
+    engine = create_engine('sqlite:///' + path)
+    crystals = pd.read_sql("Select * FROM Crystals Order By Pos ASC", engine)
+    pd.read_sql("Select Name, Value FROM Config", engine)
+    colours_df = pd.read_sql("Select * FROM Colours", engine)
+    pd.read_sql("Select Name, Value FROM Timers", engine)
+    pd.read_sql("Select ID, Name, Enable, Routine FROM Sequences WHERE Enable=1", engine)
+
+    colours = {}
+    for index, df_row in colours_df.iterrows():
+        colours[df_row.Name] = {'red': df_row.Red, 'green': df_row.Green, 'blue': df_row.Blue, 'white': df_row.White}
+    for index, df_row in crystals.iterrows():
+        colours.get(str.lower(df_row.Colour))
+
+
+def startup_child(loader, path):
+    """
+    Routine run in a fresh interpreter to time one database load, including module imports. Prints the result as JSON
+    :param loader: STRING - 'sqlite' or 'pandas'
+    :param path: STRING - Path to the SQLite database file
+    :return: None
+    """
+    start = time.perf_counter()
+    try:
+        if loader == 'sqlite':
+            load_sqlite(path)
+        else:
+            load_pandas(path)
+    except ImportError as e:
+        print(json.dumps({'error': str(e)}))
+        return
+    elapsed = time.perf_counter() - start
+
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak_rss = float('nan')
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_rss}))
+
+
+def bench_startup(path, repeat):
+    """
+    Routine to compare start up load time & memory for the sqlite3 loader against the old pandas path. Each load runs
+    in a fresh interpreter so module import time is included
+    :param path: STRING - Path to the SQLite database file
+    :param repeat: INT - Number of loads to time for each path
+    :return: None
+    """
+    print("%8s %14s %14s %14s" % ("loader", "median (ms)", "best (ms)", "peak RSS (MB)"))
+    for loader in ('sqlite', 'pandas'):
+        results = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, __file__, '_startup_child', loader, path],
+                                    capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        if 'error' in results[0]:
+            print("%8s   skipped - %s" % (loader, results[0]['error']))
+            continue
+        times = [result['seconds'] * 1000 for result in results]
+        print("%8s %14.1f %14.1f %14.1f" % (loader, statistics.median(times), min(times),
+                                            max(result['peak_rss_mb'] for result in results)))
+
+
+def build_database(source, path, count, time_scale=1.0, max_buttons=8):
+    """
+    Routine to make a copy of the database with a synthetic grid of crystals, laid out like grid_layout. Colours cycle
+    through the Colours table (every 9th crystal is cracked) and every timer is scaled so large grids finish in a
+    sensible time
+    :param source: STRING - Path to the database to copy settings, colours & sequences from
+    :param path: STRING - Path for the new database
+    :param count: INT - Number of crystals
+    :param time_scale: FLOAT - Multiplier for every value in the Timers table
+    :param max_buttons: INT - Maximum number of buttons per row
+    :return: None
+    """
+    shutil.copyfile(source, path)
+    layout = grid_layout(count, max_buttons)
+    connection = sqlite3.connect(path)
+    try:
+        colours = [row[0] for row in connection.execute("Select Name FROM Colours WHERE Name != 'black'")]
+        crystals = []
+        for pos, pixel in enumerate(layout['pixels']):
+            cracked = pos % 9 == 4
+            crystals.append((pos + 1, "Crystal %d" % pos, 1, pixel, pos, "", colours[pos % len(colours)].title(),
+                             int(cracked), colours[(pos + 1) % len(colours)].title() if cracked else None))
+
+        connection.execute("DELETE FROM Crystals")
+        connection.executemany("INSERT INTO Crystals (ID, Character, Series, Pixel, Pos, Description, Colour, Cracked, "
+                               "Cracked_Colour) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", crystals)
+        connection.execute("UPDATE Timers SET Value = Value * ?", (time_scale,))
+        connection.execute("UPDATE Config SET Value = ? WHERE Name = 'Max Buttons'", (max_buttons,))
+        connection.execute("UPDATE Config SET Value = 0 WHERE Name IN ('Reload Interval', 'Metrics Port')")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def sequence_routines(path):
+    """
+    Routine to list every routine in the Sequences table, enabled or not
+    :param path: STRING - Path to the SQLite database file
+    :return: LIST - Routine names
+    """
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute("Select Routine FROM Sequences ORDER BY ID")]
+    finally:
+        connection.close()
+
+
+def percentile(values, fraction):
+    """
+    Routine to pick a percentile from a list of values (nearest rank)
+    :param values: LIST - Values
+    :param fraction: FLOAT - Percentile as a fraction (0-1)
+    :return: FLOAT - Value at the percentile (0 if there are no values)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def run_sequence(display, routine, trace=False, timeout=600.0):
+    """
+    Routine to run one sequence on a headless display & measure it. The run ends once the last crystal has
+    finished animating (the idle time before the sequence end callback is not counted)
+    :param display: OBJ - Headless Display, with its pixel thread running on the fake output
+    :param routine: STRING - Sequence routine name
+    :param trace: BOOLEAN - Measure allocations with tracemalloc (slows the run, so done as a separate pass)
+    :param timeout: FLOAT - Longest time in seconds to wait for the sequence to finish
+    :return: DICT - Measurements for the run
+    """
+    display.engine.cancel()
+    display.__sequence_end__()
+    display.driver.frames.clear()
+    display.driver.times.clear()
+    display.driver.commit_times.clear()
+    writes = display.driver.writes
+    unchanged = display.driver.unchanged
+    rate_limited = display.driver.rate_limited
+    skipped = display.led_clock.skipped
+    peak_threads = threading.active_count()
+
+    if trace:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+
+    getattr(display, routine)()
+    while display.engine.drawing():
+        peak_threads = max(peak_threads, threading.active_count())
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("%s did not finish within %.0f seconds" % (routine, timeout))
+        time.sleep(0.005)
+
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'alloc_peak_kib': peak / 1024, 'alloc_retained_kib': current / 1024}
+
+    times = list(display.driver.commit_times)
+    frame_ms = [(b - a) * 1000 for a, b in zip(times, times[1:])]
+    return {'wall_s': wall,
+            'frames': len(times),
+            'fps': len(times) / wall if wall else 0.0,
+            'pixel_writes': display.driver.writes - writes,
+            'unchanged_frames': display.driver.unchanged - unchanged,
+            'rate_limited_frames': display.driver.rate_limited - rate_limited,
+            'frame_ms_p50': percentile(frame_ms, 0.50),
+            'frame_ms_p95': percentile(frame_ms, 0.95),
+            'frame_ms_p99': percentile(frame_ms, 0.99),
+            'frame_ms_max': max(frame_ms, default=0.0),
+            'missed_frames': display.led_clock.skipped - skipped,
+            'peak_threads': peak_threads,
+            'cpu_s': cpu}
+
+
+def git_commit():
+    """
+    Routine to find the current git commit, to label results
+    :return: STRING - Short commit hash (None if not in a git checkout)
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_sequences(source, sizes, routines, time_scale, seed, out):
+    """
+    Routine to run every sequence routine headless against the fake pixel output, for each grid size. Each routine is
+    run twice - once for timing & once with tracemalloc for allocations
+    :param source: STRING - Path to the database to copy settings, colours & sequences from
+    :param sizes: LIST - Crystal counts to benchmark
+    :param routines: LIST - Routine names to run (None runs every routine in the Sequences table)
+    :param time_scale: FLOAT - Multiplier for every value in the Timers table
+    :param seed: INT - Random seed, so random start points are the same between runs
+    :param out: STRING - Path to write the JSON results to (None to only print them)
+    :return: None
+    """
+    from Main import Display
+
+    routines = routines or sequence_routines(source)
+    results = []
+    print("%-24s %8s %8s %8s %8s %8s %8s %8s %10s" % ("routine", "crystals", "wall s", "fps", "p50 ms", "p99 ms",
+                                                       "threads", "cpu s", "alloc KiB"))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            path = os.path.join(folder, "bench_%d.db" % size)
+            build_database(source, path, size, time_scale)
+            display = Display(output='fake', database=path)
+            display.start()
+            try:
+                for routine in routines:
+                    random.seed(seed)
+                    result = run_sequence(display, routine)
+                    random.seed(seed)
+                    result.update(run_sequence(display, routine, trace=True))
+                    result.update({'routine': routine, 'crystals': size})
+                    results.append(result)
+                    print("%-24s %8d %8.2f %8.1f %8.2f %8.2f %8d %8.2f %10.1f" % (
+                        routine, size, result['wall_s'], result['fps'], result['frame_ms_p50'],
+                        result['frame_ms_p99'], result['peak_threads'], result['cpu_s'], result['alloc_peak_kib']))
+            finally:
+                display.stop()
+
+    if out:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'machine': platform.machine(),
+                  'time_scale': time_scale,
+                  'seed': seed,
+                  'results': results}
+        with open(out, 'w') as file:
+            json.dump(report, file, indent=1)
+        print("Results written to %s" % out)
+
+
+def compare_results(base_path, new_path, tolerance):
+    """
+    Routine to compare two sets of sequence results, flagging any metric that got worse by more than the tolerance
+    :param base_path: STRING - Path to the baseline JSON results
+    :param new_path: STRING - Path to the new JSON results
+    :param tolerance: FLOAT - Allowed change as a fraction (0.1 = 10%)
+    :return: INT - Number of regressions found
+    """
+    with open(base_path) as file:
+        base = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    if base.get('time_scale') != new.get('time_scale'):
+        print("Warning - results were run with different time scales (%s & %s)"
+              % (base.get('time_scale'), new.get('time_scale')))
+
+    baseline = {(result['routine'], result['crystals']): result for result in base['results']}
+    regressions = 0
+    print("%s -> %s" % (base.get('commit'), new.get('commit')))
+    print("%-24s %8s %16s %12s %12s %8s" % ("routine", "crystals", "metric", "base", "new", "change"))
+    for result in new['results']:
+        old = baseline.get((result['routine'], result['crystals']))
+        if old is None:
+            continue
+        for metric, higher_is_worse in COMPARE_METRICS:
+            if not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            regressions += worse
+            print("%-24s %8d %16s %12.3f %12.3f %+7.1f%%%s" % (result['routine'], result['crystals'], metric,
+                                                               old[metric], result[metric], change * 100,
+                                                               "  REGRESSION" if worse else ""))
+    print("%d regression(s) beyond %.0f%%" % (regressions, tolerance * 100))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Kyber Crystal Display benchmarks")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    plans = sub.add_parser('plans', help="time building the wave stage plans")
+    plans.add_argument('--sizes', type=int, nargs='+', default=[35, 100, 250, 500])
+    plans.add_argument('--repeat', type=int, default=20)
+
+    startup = sub.add_parser('startup', help="compare database load time for the sqlite3 & pandas paths")
+    startup.add_argument('--db', default='Crystals.db')
+    startup.add_argument('--repeat', type=int, default=5)
+
+    sequences = sub.add_parser('sequences', help="run every sequence headless against the fake pixel output")
+    sequences.add_argument('--db', default='Crystals.db')
+    sequences.add_argument('--sizes', type=int, nargs='+', default=[35, 100, 250, 500])
+    sequences.add_argument('--routines', nargs='+', default=None, help="routines to run (default: all)")
+    sequences.add_argument('--time-scale', type=float, default=0.25, help="multiplier for the Timers table")
+    sequences.add_argument('--seed', type=int, default=1)
+    sequences.add_argument('--out', default=None, help="write JSON results to this file")
+
+    compare = sub.add_parser('compare', help="compare two JSON results files from 'sequences'")
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--tolerance', type=float, default=0.10)
+
+    child = sub.add_parser('_startup_child')
+    child.add_argument('loader', choices=['sqlite', 'pandas'])
+    child.add_argument('db')
+
+    args = parser.parse_args()
+    if args.bench == 'plans':
+        bench_plans(args.sizes, args.repeat)
+    elif args.bench == 'startup':
+        bench_startup(args.db, args.repeat)
+    elif args.bench == 'sequences':
+        bench_sequences(args.db, args.sizes, args.routines, args.time_scale, args.seed, args.out)
+    elif args.bench == 'compare':
+        sys.exit(1 if compare_results(args.base, args.new, args.tolerance) else 0)
+    elif args.bench == '_startup_child':
+        startup_child(args.loader, args.db)
@@ -0,0 +1,313 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import os
+import sqlite3
+from collections import namedtuple
+from Engine import PULSE_CURVES
+from Plans import ORDERINGS
+
+
+class ConfigError(Exception):
+    """
+    Raised when the Config or Timers table is missing a setting, or a Config, Timers, Crystals or Patterns table value
+    can't be used
+    """
+
+
+REQUIRED = object()
+GPIO_PINS = (10, 12, 18, 21)        # pins a neo pixel chain can be connected to
+
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Settings read from the Config & Timers tables - attribute name: (database Name, type, default, check)
+CONFIG_FIELDS = {
+    'gpio_pin': ('GPIO Pin', int, REQUIRED, lambda value: value in GPIO_PINS),
+    'random_crystal_pulses': ('Random Crystal Pulses', int, REQUIRED, lambda value: value >= 0),
+    'illuminate_buttons': ('Illuminate buttons', bool, REQUIRED, None),
+    'led_fps': ('LED FPS', float, 60.0, lambda value: value > 0),
+    'gui_fps': ('GUI FPS', float, 30.0, lambda value: value > 0),
+    'reload_interval': ('Reload Interval', float, 1.0, lambda value: value >= 0),
+    'metrics_port': ('Metrics Port', int, 0, lambda value: 0 <= value <= 65535),
+    'metrics_interval': ('Metrics Dump Interval', float, 0.0, lambda value: value >= 0),
+    'output_process': ('Output Process', bool, False, None),
+    'press_ducking': ('Press Ducking', float, 0.5, lambda value: 0 <= value <= 1),
+    'network_universe': ('Network Universe', int, 1, lambda value: 0 <= value <= 63999),
+    'network_delta': ('Network Delta', bool, False, None),
+    'network_sync_universe': ('Network Sync Universe', int, 0, lambda value: 0 <= value <= 63999),
+    'brightness': ('Brightness', float, REQUIRED, lambda value: 0 <= value <= 1),
+    'max_buttons': ('Max Buttons', int, REQUIRED, lambda value: value > 0),
+}
+
+TIMER_FIELDS = {}
+for _timer in ('left wave', 'right wave', 'top wave', 'bottom wave', 'top left wave', 'top right wave',
+               'bottom left wave', 'bottom right wave', 'raindrop wave', 'forward chain', 'backward chain',
+               'centre chain'):
+    TIMER_FIELDS[_timer.replace(' ', '_') + '_stages'] = (_timer + ' stages', float, REQUIRED, lambda value: value >= 0)
+    TIMER_FIELDS[_timer.replace(' ', '_') + '_pulses'] = (_timer + ' pulses', float, REQUIRED, lambda value: value > 0)
+TIMER_FIELDS.update({
+    'button_press_pulses': ('button press pulses', float, REQUIRED, lambda value: value > 0),
+    'random_stages': ('random stages', float, REQUIRED, lambda value: value >= 0),
+    'cracked_stages': ('cracked stages', float, REQUIRED, lambda value: value >= 0),
+    'min_between_sequences': ('min between sequences', float, REQUIRED, lambda value: value >= 0),
+    'max_between_sequences': ('max between sequences', float, REQUIRED, lambda value: value >= 0),
+})
+
+Config = namedtuple('Config', CONFIG_FIELDS)
+Timers = namedtuple('Timers', TIMER_FIELDS)
+
+
+def load_settings(rows, fields, settings_type, table):
+    """
+    Routine to turn Name/Value rows into a frozen settings object, converting each value to its type. Fails on the
+    first missing or invalid setting so problems show at start up rather than part way through a sequence
+    :param rows: LIST - (Name, Value) pairs from the table
+    :param fields: DICT - Field definitions (CONFIG_FIELDS or TIMER_FIELDS)
+    :param settings_type: CLASS - namedtuple class to build (Config or Timers)
+    :param table: STRING - Table name, for error messages
+    :return: Settings object with one attribute per field
+    """
+    values = dict(rows)
+    settings = {}
+    for attribute, (name, value_type, default, check) in fields.items():
+        if name in values and values[name] is not None:
+            try:
+                value = value_type(values[name])
+            except (TypeError, ValueError):
+                raise ConfigError("%s '%s' must be %s, got %r" % (table, name, value_type.__name__, values[name]))
+        elif default is not REQUIRED:
+            value = default
+        else:
+            raise ConfigError("%s table is missing '%s'" % (table, name))
+
+        if check is not None and not check(value):
+            raise ConfigError("%s '%s' has an invalid value: %r" % (table, name, value))
+        settings[attribute] = value
+
+    if settings_type is Timers and settings['min_between_sequences'] > settings['max_between_sequences']:
+        raise ConfigError("Timers 'min between sequences' is greater than 'max between sequences'")
+    return settings_type(**settings)
+
+
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Typed rows for the Crystals, Colours, Sequences & Patterns tables
+CrystalRow = namedtuple('CrystalRow', ['id', 'character', 'series', 'pixel', 'pos', 'description', 'colour',
+                                       'cracked', 'cracked_colour', 'pin', 'x', 'y'])
+ColourRow = namedtuple('ColourRow', ['name', 'red', 'green', 'blue', 'white',
+                                     'glow_red', 'glow_green', 'glow_blue', 'glow_white'])
+SequenceRow = namedtuple('SequenceRow', ['id', 'name', 'enable', 'routine'])
+PatternRow = namedtuple('PatternRow', ['id', 'name', 'enable', 'origin', 'ordering', 'stage_interval', 'pulse_timer',
+                                       'curve', 'colour', 'repeat'])
+
+DisplayData = namedtuple('DisplayData', ['crystals', 'colours', 'config', 'timers', 'sequences', 'patterns'])
+
+
+class Database:
+    """
+    Class for reading the display's tables with the standard library sqlite3 module
+    """
+
+    def __init__(self, path='Crystals.db'):
+        """
+        Routine to initialise the database reader
+        :param path: STRING - Path to the SQLite database file
+        """
+        self.path = path
+
+    def connect(self):
+        """
+        Routine to open a new connection to the database
+        :return: OBJ - sqlite3 connection
+        """
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def read_crystals(connection):
+        """
+        Routine to read every crystal, in display position order. The Pin column picks the neo pixel chain a crystal
+        is on - crystals with no pin (or databases without the column) use the Config GPIO Pin. The X & Y columns
+        give a crystal's physical position on the wall (None if not set or the database has no such columns)
+        :param connection: OBJ - sqlite3 connection
+        :return: LIST - CrystalRow for each crystal
+        """
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(Crystals)")}
+        optional = ", ".join(name if name in columns else "NULL" for name in ("Pin", "X", "Y"))
+        query = "Select ID, Character, Series, Pixel, Pos, Description, Colour, Cracked, Cracked_Colour, %s " \
+                "FROM Crystals Order By Pos ASC" % optional
+        crystals = [CrystalRow(int(row[0]), row[1], int(row[2]), int(row[3]), -1 if row[4] is None else int(row[4]),
+                               row[5] or "", row[6] or "", bool(row[7]), row[8] or "",
+                               None if row[9] is None else int(row[9]),
+                               None if row[10] is None else float(row[10]),
+                               None if row[11] is None else float(row[11]))
+                    for row in connection.execute(query)]
+        for crystal in crystals:
+            if crystal.pin is not None and crystal.pin not in GPIO_PINS:
+                raise ConfigError("Crystal '%s' has Pin %d, expected one of: %s"
+                                  % (crystal.character, crystal.pin, ", ".join(map(str, GPIO_PINS))))
+        return crystals
+
+    @staticmethod
+    def read_colours(connection):
+        """
+        Routine to read every colour
+        :param connection: OBJ - sqlite3 connection
+        :return: LIST - ColourRow for each colour
+        """
+        query = "Select Name, Red, Green, Blue, White, Glow_Red, Glow_Green, Glow_Blue, Glow_White FROM Colours"
+        return [ColourRow(row[0], *[int(value) for value in row[1:]]) for row in connection.execute(query)]
+
+    @staticmethod
+    def read_config(connection):
+        """
+        Routine to read the Config table
+        :param connection: OBJ - sqlite3 connection
+        :return: Config - Settings from the Config table
+        """
+        return load_settings(connection.execute("Select Name, Value FROM Config"), CONFIG_FIELDS, Config, 'Config')
+
+    @staticmethod
+    def read_timers(connection):
+        """
+        Routine to read the Timers table
+        :param connection: OBJ - sqlite3 connection
+        :return: Timers - Settings from the Timers table
+        """
+        return load_settings(connection.execute("Select Name, Value FROM Timers"), TIMER_FIELDS, Timers, 'Timers')
+
+    @staticmethod
+    def read_sequences(connection):
+        """
+        Routine to read the enabled sequences
+        :param connection: OBJ - sqlite3 connection
+        :return: LIST - SequenceRow for each enabled sequence
+        """
+        query = "Select ID, Name, Enable, Routine FROM Sequences WHERE Enable=1"
+        return [SequenceRow(int(row[0]), row[1], bool(row[2]), row[3]) for row in connection.execute(query)]
+
+    @staticmethod
+    def read_patterns(connection):
+        """
+        Routine to read the enabled patterns - sequences described by their settings rather than a routine. Origin is
+        a named origin (see Plans.ORIGINS), a crystal's character or 'random' (the default), Curve defaults to
+        'triangle' & Repeat to 1. Databases without the Patterns table have no patterns
+        :param connection: OBJ - sqlite3 connection
+        :return: LIST - PatternRow for each enabled pattern
+        """
+        tables = {row[0] for row in connection.execute("Select name FROM sqlite_master WHERE type='table'")}
+        if 'Patterns' not in tables:
+            return []
+
+        query = "Select ID, Name, Origin, Ordering, Stage_Interval, Pulse_Timer, Curve, Colour, Repeat FROM Patterns " \
+                "WHERE Enable=1"
+        patterns = []
+        for row in connection.execute(query):
+            name = row[1] or "Pattern %d" % row[0]
+            ordering = str.lower(row[3] or "")
+            curve = str.lower(row[6] or 'triangle')
+            if ordering not in ORDERINGS:
+                raise ConfigError("Pattern '%s' has Ordering %r, expected one of: %s"
+                                  % (name, row[3], ", ".join(ORDERINGS)))
+            if curve not in PULSE_CURVES:
+                raise ConfigError("Pattern '%s' has Curve %r, expected one of: %s"
+                                  % (name, row[6], ", ".join(PULSE_CURVES)))
+            try:
+                stage_interval, pulse_timer = float(row[4]), float(row[5])
+                repeat = 1 if row[8] is None else int(row[8])
+            except (TypeError, ValueError):
+                raise ConfigError("Pattern '%s' must have a number for Stage_Interval, Pulse_Timer & Repeat" % name)
+            if stage_interval < 0 or pulse_timer <= 0 or repeat < 1:
+                raise ConfigError("Pattern '%s' has an invalid Stage_Interval, Pulse_Timer or Repeat" % name)
+
+            patterns.append(PatternRow(int(row[0]), name, True, (row[2] or "").strip() or 'random', ordering,
+                                       stage_interval, pulse_timer, curve, str.lower(row[7] or ""), repeat))
+        return patterns
+
+    def load(self):
+        """
+        Routine to read all of the display's tables in one go
+        :return: DisplayData - Crystals, colours, config, timers, sequences & patterns
+        """
+        connection = self.connect()
+        try:
+            return DisplayData(self.read_crystals(connection), self.read_colours(connection),
+                               self.read_config(connection), self.read_timers(connection),
+                               self.read_sequences(connection), self.read_patterns(connection))
+        finally:
+            connection.close()
+
+    def settings(self):
+        """
+        Routine to read just the Config & Timers tables
+        :return:
+            config - Config - Settings from the Config table
+            timers - Timers - Settings from the Timers table
+        """
+        connection = self.connect()
+        try:
+            return self.read_config(connection), self.read_timers(connection)
+        finally:
+            connection.close()
+
+
+class DatabaseWatcher:
+    """
+    Class to spot changes to the database file while the display is running. Edits made through another connection
+    bump SQLite's data_version, a replaced or restored file shows up as a new modified time or inode
+    """
+
+    def __init__(self, database):
+        """
+        Routine to initialise the watcher, taking the current state of the file as unchanged
+        :param database: OBJ - Database to watch
+        """
+        self.database = database
+        self.connection = database.connect()
+        self.version = self.__data_version__()
+        self.stamp = self.__file_stamp__()
+
+    def __data_version__(self):
+        """
+        Routine to read SQLite's data version for the watcher's connection
+        :return: INT - Data version, changes whenever another connection commits to the file
+        """
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def __file_stamp__(self):
+        """
+        Routine to read the database file's identity & modified time
+        :return: TUPLE - (inode, modified time in ns, size), None if the file is missing
+        """
+        try:
+            stat = os.stat(self.database.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def changed(self):
+        """
+        Routine to check if the database has changed since the last check
+        :return: BOOLEAN - Database has changed
+        """
+        stamp = self.__file_stamp__()
+        if stamp is None:
+            # File missing part way through being replaced - check again once it is back
+            self.stamp = None
+            return False
+        if stamp != self.stamp:
+            # File replaced - reopen so data_version follows the new file
+            self.stamp = stamp
+            self.connection.close()
+            self.connection = self.database.connect()
+            self.version = self.__data_version__()
+            return True
+
+        version = self.__data_version__()
+        if version != self.version:
+            self.version = version
+            return True
+        return False
+
+    def close(self):
+        """
+        Routine to close the watcher's connection
+        :return: None
+        """
+        self.connection.close()
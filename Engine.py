@@ -0,0 +1,561 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import math
+import time
+import heapq
+import itertools
+import threading
+import numpy as np
+
+# Pulse shapes - the level (0 off up to 1 full colour) at each point through a pulse (0 at the start, 1 at the end)
+PULSE_CURVES = {
+    'triangle': lambda cycle: 2 * cycle if cycle <= 0.5 else 2 * (1.0 - cycle),     # straight up & down
+    'sine': lambda cycle: 0.5 - 0.5 * math.cos(2 * math.pi * cycle),                # eases in & out
+    'square': lambda cycle: 1.0 if cycle < 0.5 else 0.0,                            # on, then off
+    'flash': lambda cycle: 1.0 - cycle,                                             # full colour fading out
+    'swell': lambda cycle: cycle,                                                   # fading up, then off
+}
+
+# Compositor layers, bottom to top, & how each is blended over the layers below it - max keeps the brighter of each
+# channel, add sums the channels & alpha covers the layers below wherever the layer has a colour. Nothing is ever
+# blended darker than the ambient layer, so each crystal's idle glow stays the floor
+BLEND_MODES = ('max', 'add', 'alpha')
+LAYERS = (('ambient', 'max'), ('sequence', 'max'), ('press', 'alpha'))
+
+
+class FrameClock:
+    """
+    Class for fixed rate frame timing. Deadlines are stepped from the previous deadline (not from when the frame
+    finished) so timing does not drift, and whole frames are skipped if the loop falls behind
+    """
+
+    def __init__(self, fps, clock=time.monotonic):
+        """
+        Routine to initialise a new frame clock
+        :param fps: FLOAT - Target frames per second
+        :param clock: FUNCTION - Monotonic time source in seconds
+        """
+        self.clock = clock
+        self.period = 1.0 / fps
+        self.next_frame = clock()
+        self.frames = 0
+        self.skipped = 0
+
+    def set_fps(self, fps):
+        """
+        Routine to change the target frame rate, takes effect from the next frame
+        :param fps: FLOAT - Target frames per second
+        :return: None
+        """
+        self.period = 1.0 / fps
+
+    def due(self, now=None):
+        """
+        Routine to check if the next frame deadline has been reached
+        :param now: FLOAT - Current time, read from the clock if not given
+        :return: BOOLEAN - Frame is due
+        """
+        if now is None:
+            now = self.clock()
+        return now >= self.next_frame
+
+    def remaining(self, now=None):
+        """
+        Routine to get the time left until the next frame deadline
+        :param now: FLOAT - Current time, read from the clock if not given
+        :return: FLOAT - Seconds until the next frame (0 if already due)
+        """
+        if now is None:
+            now = self.clock()
+        return max(self.next_frame - now, 0.0)
+
+    def tick(self, now=None):
+        """
+        Routine to mark the current frame as started and step the deadline on by one period. If the loop has fallen
+        a whole frame or more behind, the missed frames are dropped rather than run back to back
+        :param now: FLOAT - Current time, read from the clock if not given
+        :return: INT - Number of frames skipped
+        """
+        if now is None:
+            now = self.clock()
+        self.frames += 1
+        self.next_frame += self.period
+        missed = 0
+        if now >= self.next_frame:
+            missed = int((now - self.next_frame) / self.period) + 1
+            self.next_frame += missed * self.period
+            self.skipped += missed
+        return missed
+
+    def wait(self):
+        """
+        Routine to sleep until the next frame deadline
+        :return: None
+        """
+        delay = self.remaining()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateCounter:
+    """
+    Class to count events and report them as a rate per second, over one second windows
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Routine to initialise a new rate counter
+        :param clock: FUNCTION - Monotonic time source in seconds
+        """
+        self.clock = clock
+        self.count = 0
+        self.total = 0
+        self.rate = 0.0
+        self.window_start = clock()
+
+    def add(self, count=1):
+        """
+        Routine to add events to the counter, rolling the rate over once a second has passed
+        :param count: INT - Number of events to add
+        :return: BOOLEAN - A new rate value was calculated
+        """
+        self.count += count
+        self.total += count
+        now = self.clock()
+        elapsed = now - self.window_start
+        if elapsed < 1.0:
+            return False
+        self.rate = self.count / elapsed
+        self.count = 0
+        self.window_start = now
+        return True
+
+
+def pulse_peak(colour):
+    """
+    Routine to work out how many steps a colour takes to pulse from off up to full brightness
+    :param colour: LIST - Full colour red, green, blue & white values
+    :return: INT - Step number of the pulse peak
+    """
+    peak_colour = max(colour)
+    return int(253 * 255 / peak_colour) + 1 if peak_colour > 0 else 255
+
+
+def pulse_duration(step_time):
+    """
+    Routine to convert a pulse timer from the Timers table (time per colour step) into the time for one whole pulse.
+    Every colour uses the step count of a full brightness colour, so all colours pulse in the same time
+    :param step_time: FLOAT - Time for each colour step
+    :return: FLOAT - Time in seconds for one pulse (off to full & back to off)
+    """
+    return 2 * pulse_peak([255]) * step_time
+
+
+class ColourRamps:
+    """
+    Class holding the pulse ramp for every colour in one flat table. Entry 0 is a crystal that is off, then each
+    colour's ramp runs from step 0 up to its peak step, followed by one entry holding the full colour. Crystals only
+    store an index into the table - the pixel colour, button hex & text hex for every entry are worked out once when
+    the table is built
+    """
+
+    def __init__(self, colours):
+        """
+        Routine to build the ramp table
+        :param colours: DICT - Colour values, keyed by colour name then channel name
+        """
+        self.names = {}         # colour number for each colour name
+        self.offset = []        # table entry for step 0 of each colour
+        self.peak = []          # peak step of each colour
+        self.full = []          # table entry holding each colour at full brightness
+        self.glow = []          # idle glow of each colour
+
+        button = [np.zeros((1, 4))]
+        entries = 1
+        for name, values in colours.items():
+            colour = np.array([values['red'], values['green'], values['blue'], values['white']], dtype=float)
+            peak = pulse_peak(colour)
+            self.names[name] = len(self.offset)
+            self.offset.append(entries)
+            self.peak.append(peak)
+            self.full.append(entries + peak + 1)
+            self.glow.append((values['glow red'], values['glow green'], values['glow blue'], values['glow white']))
+
+            levels = np.arange(peak + 1)[:, np.newaxis]
+            button.append(colour / 255 * levels)
+            button.append(colour[np.newaxis])
+            entries += peak + 2
+
+        self.button = np.clip(np.concatenate(button), 0, 255).astype(np.uint8)
+        white = self.button[:, 3:4]
+        self.bg = np.where(white > 0, white, self.button[:, :3])
+        self.text = 255 - self.bg
+        self.bg_hex = ["#%02x%02x%02x" % tuple(rgb) for rgb in self.bg.tolist()]
+        self.text_hex = ["#%02x%02x%02x" % tuple(rgb) for rgb in self.text.tolist()]
+
+    def __len__(self):
+        return len(self.button)
+
+
+class Layer:
+    """
+    Class for one compositor layer - a ColourRamps table entry & a glow colour for every crystal. Where a crystal has
+    no entry (0) & no glow the layers below show through
+    """
+
+    def __init__(self, name, count, mode='max', opacity=1.0):
+        """
+        Routine to initialise an empty layer
+        :param name: STRING - Layer name
+        :param count: INT - Number of crystal slots
+        :param mode: STRING - Blend mode, one of BLEND_MODES
+        :param opacity: FLOAT - Strength the layer is blended with, 0 to 1
+        """
+        if mode not in BLEND_MODES:
+            raise ValueError("Blend mode %r, expected one of: %s" % (mode, ", ".join(BLEND_MODES)))
+        self.name = name
+        self.mode = mode
+        self.opacity = opacity
+        self.entry = np.zeros(count, dtype=np.intp)                 # ramp table entry (0 = none)
+        self.glow = np.zeros((count, 4), dtype=np.uint8)            # floor for the neo pixel colour
+
+    def reset(self, slot):
+        """
+        Routine to clear a crystal from the layer
+        :param slot: INT - Crystal slot
+        :return: None
+        """
+        self.entry[slot] = 0
+        self.glow[slot] = 0
+
+
+class ColourStore:
+    """
+    Class holding the colour state for every crystal in NumPy arrays, indexed by crystal slot. Pulse routines only set
+    each crystal's entry in the ColourRamps table on one of the compositor layers (see LAYERS), render() then looks up
+    everything else & blends the layers for all crystals in one pass
+    """
+
+    def __init__(self, count, ramps):
+        """
+        Routine to initialise the colour arrays
+        :param count: INT - Number of crystal slots
+        :param ramps: OBJ - ColourRamps table the entries index into
+        """
+        self.count = count
+        self.ramps = ramps
+        self.layers = {name: Layer(name, count, mode) for name, mode in LAYERS}
+        self.idle_glow = self.layers['ambient'].glow                # idle illumination for the neo pixel
+        self.pixel_index = np.full(count, -1)                       # position of the crystal's neo pixel in the chain
+
+        self.shown = np.zeros(count, dtype=np.intp)                 # entries used for the last render
+        self.button = np.zeros((count, 4), dtype=np.uint8)          # red, green, blue, white
+        self.bg = np.zeros((count, 3), dtype=np.uint8)              # button colour
+        self.text = np.full((count, 3), 255, dtype=np.uint8)        # button text colour
+        self.pixel = np.zeros((count, 4), dtype=np.uint8)           # neo pixel colour
+
+        self.drawn = np.full(count, -1, dtype=np.intp)              # entries last drawn on the buttons (-1 = redraw)
+
+    def render(self, colours=None):
+        """
+        Routine to blend the layers into the pixel colours & look up the button & text colours for all crystals in a
+        single vectorised pass. Buttons show the top most layer with an entry
+        :param colours: DICT - (crystals, 4) colours to use for a layer in place of its own entries & glow, e.g. a
+        recording being replayed as the sequence layer
+        :return: None
+        """
+        layers = list(self.layers.values())
+        entries = np.stack([layer.entry for layer in layers])
+        layer_colours = np.maximum(self.ramps.button[entries], np.stack([layer.glow for layer in layers]))
+        covered = (entries > 0) | layer_colours.any(axis=2)
+        if colours:
+            for index, layer in enumerate(layers):
+                if layer.name in colours:
+                    entries[index] = 0
+                    layer_colours[index] = colours[layer.name]
+                    covered[index] = layer_colours[index].any(axis=1)
+
+        floor = layer_colours[0] * np.float32(layers[0].opacity)
+        pixel = floor.copy()
+        for layer, colour, cover in zip(layers[1:], layer_colours[1:], covered[1:]):
+            if layer.opacity <= 0:
+                continue
+            if layer.mode == 'max':
+                np.maximum(pixel, colour * np.float32(layer.opacity), out=pixel)
+            elif layer.mode == 'add':
+                pixel += colour * np.float32(layer.opacity)
+                np.minimum(pixel, 255, out=pixel)
+            else:
+                alpha = (cover * np.float32(layer.opacity))[:, np.newaxis]
+                pixel += (colour - pixel) * alpha
+                np.maximum(pixel, floor, out=pixel)
+        self.pixel = (pixel + 0.5).astype(np.uint8)
+
+        top = len(layers) - 1 - np.argmax(entries[::-1] > 0, axis=0)
+        entry = entries[top, np.arange(self.count)]
+        self.button = self.ramps.button[entry]
+        self.bg = self.ramps.bg[entry]
+        self.text = self.ramps.text[entry]
+        self.shown = entry
+
+    def reset(self, slot, layer='sequence'):
+        """
+        Routine to return a crystal to its idle colour on a layer
+        :param slot: INT - Crystal slot
+        :param layer: STRING - Layer name
+        :return: None
+        """
+        self.layers[layer].reset(slot)
+
+
+class Envelope:
+    """
+    Base class for anything scheduled on the animation engine. Envelopes work out their state from the time elapsed
+    since they started, so a late or dropped frame never slows an animation down
+    """
+
+    def __init__(self, slot=None, tag=None, on_end=None, layer='sequence'):
+        """
+        Routine to initialise the envelope
+        :param slot: INT - Crystal slot the envelope colours (None if it does not colour a crystal)
+        :param tag: STRING - Group name, used to cancel related envelopes together
+        :param on_end: FUNCTION - Called once the envelope has finished (not called if cancelled)
+        :param layer: STRING - Compositor layer the envelope draws on
+        """
+        self.slot = slot
+        self.tag = tag
+        self.on_end = on_end
+        self.layer = layer
+        self.start = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def length(self):
+        """
+        Time in seconds from the envelope starting until it has finished
+        """
+        return 0.0
+
+    def advance(self, now):
+        """
+        Routine to move the envelope on to the current time
+        :param now: FLOAT - Current engine time in seconds
+        :return: BOOLEAN - Envelope has finished
+        """
+        self.elapsed = now - self.start
+        return self.elapsed >= self.length
+
+    def draw(self, store):
+        """
+        Routine to write the envelope's current colour into the colour store
+        :param store: OBJ - ColourStore
+        :return: None
+        """
+
+
+class Pulse(Envelope):
+    """
+    Class for a crystal pulsing from off up to its full colour and back down, a set number of times, each pulse
+    taking a set time. The crystal's ramp table entry follows the elapsed time, whatever the frame rate, along the
+    pulse curve
+    """
+
+    def __init__(self, slot, offset, peak, pulses=1, duration=1.0, tag=None, on_end=None, phase=0.0,
+                 curve='triangle', layer='sequence'):
+        """
+        Routine to initialise the pulse
+        :param slot: INT - Crystal slot
+        :param offset: INT - ColourRamps table entry for step 0 of the crystal's colour
+        :param peak: INT - Peak step of the crystal's colour
+        :param pulses: INT - Number of times to fully illuminate and return to base level lighting
+        :param duration: FLOAT - Time in seconds for each pulse (off to full & back to off)
+        :param tag: STRING - Group name, used to cancel related envelopes together
+        :param on_end: FUNCTION - Called once the pulse has finished
+        :param phase: FLOAT - Point in the first pulse to start from (0 starts off, 0.5 starts at full colour)
+        :param curve: STRING - Pulse shape, one of PULSE_CURVES
+        :param layer: STRING - Compositor layer the pulse draws on
+        """
+        Envelope.__init__(self, slot, tag, on_end, layer)
+        self.offset = offset
+        self.peak = peak
+        self.pulses = pulses
+        self.duration = duration
+        self.phase = phase
+        self.curve = PULSE_CURVES[curve]
+
+    @property
+    def length(self):
+        return self.duration * (self.pulses - self.phase)
+
+    @property
+    def remaining(self):
+        """
+        Number of pulses still to run, including the current one
+        """
+        return self.pulses - int(self.elapsed / self.duration + self.phase)
+
+    def draw(self, store):
+        cycle = (self.elapsed / self.duration + self.phase) % 1.0
+        store.layers[self.layer].entry[self.slot] = self.offset + int(self.curve(cycle) * self.peak)
+
+
+class Keyframes(Envelope):
+    """
+    Class for a crystal stepping through fixed colours at set times, e.g. cracked crystal corruption
+    """
+
+    def __init__(self, slot, frames, length, tag=None, on_end=None, layer='sequence'):
+        """
+        Routine to initialise the keyframes
+        :param slot: INT - Crystal slot
+        :param frames: LIST - (offset in seconds, ramp table entry, glow colour) for each colour change, in time order
+        :param length: FLOAT - Time in seconds until the crystal returns to its idle colour
+        :param tag: STRING - Group name, used to cancel related envelopes together
+        :param on_end: FUNCTION - Called once the keyframes have finished
+        :param layer: STRING - Compositor layer the keyframes draw on
+        """
+        Envelope.__init__(self, slot, tag, on_end, layer)
+        self.frames = frames
+        self.end_time = length
+
+    @property
+    def length(self):
+        return self.end_time
+
+    def draw(self, store):
+        current = None
+        for frame in self.frames:
+            if frame[0] > self.elapsed:
+                break
+            current = frame
+        if current is not None:
+            layer = store.layers[self.layer]
+            layer.entry[self.slot] = current[1]
+            layer.glow[self.slot] = current[2]
+
+
+class AnimationEngine:
+    """
+    Class to run every crystal animation from the frame clock. Envelopes are queued with a start delay and all active
+    envelopes are advanced together once per frame, so the number of threads never changes. Engine time is read from
+    a monotonic clock, so sequences take the same time however many frames are dropped along the way
+    """
+
+    def __init__(self, store, clock=time.monotonic):
+        """
+        Routine to initialise the engine
+        :param store: OBJ - ColourStore to draw into
+        :param clock: FUNCTION - Monotonic time source in seconds
+        """
+        self.store = store
+        self.clock = clock
+        self.time = clock()
+        self.active = []
+        self.pending = []
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, envelope, delay=0.0):
+        """
+        Routine to queue an envelope to start after a delay
+        :param envelope: OBJ - Envelope to run
+        :param delay: FLOAT - Time in seconds before the envelope starts
+        :return: OBJ - The queued envelope
+        """
+        envelope.start = self.clock() + delay
+        with self.lock:
+            heapq.heappush(self.pending, (envelope.start, next(self.order), envelope))
+        return envelope
+
+    def pulse(self, slot, offset, peak, pulses=1, duration=1.0, delay=0.0, tag=None, on_end=None, phase=0.0,
+              curve='triangle', layer='sequence'):
+        """
+        Routine to queue a crystal pulse, see Pulse
+        :return: OBJ - The queued pulse
+        """
+        return self.add(Pulse(slot, offset, peak, pulses, duration, tag, on_end, phase, curve, layer), delay)
+
+    def keyframes(self, slot, frames, length, delay=0.0, tag=None, on_end=None, layer='sequence'):
+        """
+        Routine to queue a set of crystal colour changes, see Keyframes
+        :return: OBJ - The queued keyframes
+        """
+        return self.add(Keyframes(slot, frames, length, tag, on_end, layer), delay)
+
+    def call_later(self, delay, callback, tag=None):
+        """
+        Routine to run a function from the frame loop after a delay
+        :param delay: FLOAT - Time in seconds before the function is called
+        :param callback: FUNCTION - Function to call
+        :param tag: STRING - Group name, used to cancel related envelopes together
+        :return: OBJ - The queued envelope
+        """
+        return self.add(Envelope(tag=tag, on_end=callback), delay)
+
+    def cancel(self, tag=None):
+        """
+        Routine to stop queued & running envelopes, clearing their crystals from their layers. End callbacks are not
+        run
+        :param tag: STRING - Only cancel envelopes with this tag (None cancels everything)
+        :return: None
+        """
+        with self.lock:
+            self.pending = [item for item in self.pending if tag is not None and item[2].tag != tag]
+            heapq.heapify(self.pending)
+            cancelled = [envelope for envelope in self.active if tag is None or envelope.tag == tag]
+            self.active = [envelope for envelope in self.active if not (tag is None or envelope.tag == tag)]
+            for envelope in cancelled:
+                if envelope.slot is not None:
+                    self.store.reset(envelope.slot, envelope.layer)
+
+    def busy(self, tag=None):
+        """
+        Routine to check for queued or running envelopes
+        :param tag: STRING - Only check envelopes with this tag (None checks everything)
+        :return: BOOLEAN - Matching envelopes exist
+        """
+        with self.lock:
+            return any(tag is None or item[2].tag == tag for item in self.pending) or \
+                any(tag is None or envelope.tag == tag for envelope in self.active)
+
+    def drawing(self):
+        """
+        Routine to check for queued or running envelopes that colour a crystal (ignoring plain callbacks)
+        :return: BOOLEAN - Crystal envelopes exist
+        """
+        with self.lock:
+            return any(item[2].slot is not None for item in self.pending) or \
+                any(envelope.slot is not None for envelope in self.active)
+
+    def tick(self, now=None):
+        """
+        Routine to move the engine on to the current time: start any envelopes that are due, advance the running ones
+        and draw them into the colour store. End callbacks are run after the store has been updated
+        :param now: FLOAT - Current time, read from the clock if not given
+        :return: None
+        """
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            self.time = now
+            while self.pending and self.pending[0][0] <= now:
+                self.active.append(heapq.heappop(self.pending)[2])
+
+            running = []
+            finished = []
+            for envelope in self.active:
+                if envelope.advance(now):
+                    finished.append(envelope)
+                else:
+                    running.append(envelope)
+            self.active = running
+
+            for envelope in finished:
+                if envelope.slot is not None:
+                    self.store.reset(envelope.slot, envelope.layer)
+            for envelope in running:
+                envelope.draw(self.store)
+
+        for envelope in finished:
+            if envelope.on_end is not None:
+                envelope.on_end()
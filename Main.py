@@ -1,22 +1,29 @@
 # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 # Import Statements
 import tkinter as tk
-from threading import Thread
+import threading
+from threading import Thread, Lock
 import time
 import datetime
 import random
 import logging
 import traceback
 import os
-import pandas as pd
-from sqlalchemy import create_engine
-import math
-
-# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-# Raspberry Pi Specific Import Statements
-if os.name != 'nt':
-    import board
-    import neopixel
+import sqlite3
+import argparse
+import asyncio
+import numpy as np
+from Engine import FrameClock, RateCounter, ColourRamps, ColourStore, AnimationEngine, pulse_duration
+from Plans import compile_stage_plans, ripple_rings, compile_ripple_plans, compile_pattern_plan, anchor_slot, ORIGINS
+from Database import Database, DatabaseWatcher, ConfigError, SequenceRow
+from Output import create_output, DRIVERS, NETWORK_DRIVERS
+from Metrics import Registry, MetricsServer, MetricsDump, SEQUENCE_BUCKETS
+from Recording import FrameRecorder, FrameRecording, ramp_checksum
+from Prebake import prebake
+
+PRESS_LATENCY_TARGET = 0.030        # seconds from a button press to the crystal lighting
+PRESS_BUCKETS = (0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.25)
+PATTERN_ROUTINE = '__pattern_%d__'  # sequence routine name for each pattern in the Patterns table, by ID
 
 
 def _from_rgb(rgb):
@@ -68,6 +75,23 @@ def value_check(colour):
     return colour
 
 
+def _store_field(array, channel, writable=True):
+    """
+    Routine to build a property reading/ writing one colour channel of a crystal's row in the colour store
+    :param array: STRING - Name of the ColourStore array
+    :param channel: INT - Column of the array (0 = red, 1 = green, 2 = blue, 3 = white)
+    :param writable: BOOLEAN - Allow the value to be set through the property
+    :return: Property object
+    """
+    def getter(self):
+        return getattr(self.store, array)[self.slot, channel]
+
+    def setter(self, value):
+        getattr(self.store, array)[self.slot, channel] = value
+
+    return property(getter, setter if writable else None)
+
+
 class Popup(tk.Toplevel):
     """
     Class for pop up window to display text from crystal slips
@@ -122,11 +146,27 @@ class Popup(tk.Toplevel):
 
 
 class Crystal:
-    """ Class to hold all data relating to individual crystals
+    """ Class to hold all data relating to individual crystals. Colour values are views onto the crystal's slot in the
+    shared ColourStore
     """
 
+    red = _store_field('button', 0, writable=False)
+    green = _store_field('button', 1, writable=False)
+    blue = _store_field('button', 2, writable=False)
+    white = _store_field('button', 3, writable=False)
+
+    text_red = _store_field('text', 0, writable=False)
+    text_green = _store_field('text', 1, writable=False)
+    text_blue = _store_field('text', 2, writable=False)
+
+    pixel_red = _store_field('pixel', 0, writable=False)
+    pixel_green = _store_field('pixel', 1, writable=False)
+    pixel_blue = _store_field('pixel', 2, writable=False)
+    pixel_white = _store_field('pixel', 3, writable=False)
+
     def __init__(self, parent_frame, colour, name_, parent, pos_, pixel_,
-                 series_, row_, column_, colours_, descr_, cracked_, cracked_colour_=""):
+                 series_, row_, column_, colours_, descr_, cracked_, store_, slot_, cracked_colour_="", id_=None,
+                 pin_=None):
         """
         Routine to initialise new crystal class instance
 
@@ -135,27 +175,60 @@ class Crystal:
         :param name_: STRING - Character name for the crystal
         :param parent: OBJ - Parent class for linking button press action
         :param pos_: INT - Button position number (ordering, starting top left going left>right, top>bottom)
-        :param pixel_: INT - Pixel position number in chain
+        :param pixel_: INT - Pixel position number across all the chains (the chain's first pixel + position in chain)
         :param series_: INT - Kyber Crystal release series
         :param row_: INT - Row button sits in on display
         :param column_: INT - Column button sits in on display
         :param colours_: DICT - Dictionary of colour values
         :param descr_: STRING - Crystal description text, to be displayed in popup window on button press
         :param cracked_: BOOLEAN - Crystal is a cracked crystal or not
+        :param store_: OBJ - ColourStore holding the colour values for all crystals
+        :param slot_: INT - Crystal's row in the colour store
         :param cracked_colour_: STRING - Inner core colour for the cracked crystals
+        :param id_: INT - Crystal's ID in the Crystals table
+        :param pin_: INT - GPIO pin of the neo pixel chain the crystal is on
+        """
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Setup class variables
+        self.id = id_
+        self.text = ""
+
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Create character button (none when running headless) - command looks up the crystal's key & description when
+        # pressed, so both can be changed by a database reload
+        self.button = None
+        if parent_frame is not None:
+            self.button = tk.Button(master=parent_frame,
+                                    relief=tk.FLAT,
+                                    bg="black",
+                                    activebackground="black",
+                                    fg="white",
+                                    activeforeground="white")
+            # Pressed as soon as the screen is touched rather than on release, to keep press to light latency low
+            self.button.bind('<ButtonPress-1>', lambda event: parent.__button_press__(self.key, self.descr))
+
+        self.update(colour, name_, pos_, pixel_, series_, row_, column_, colours_, descr_, cracked_, store_, slot_,
+                    cracked_colour_, pin_)
+
+    def update(self, colour, name_, pos_, pixel_, series_, row_, column_, colours_, descr_, cracked_, store_, slot_,
+               cracked_colour_="", pin_=None):
+        """
+        Routine to set the crystal's details, used when the crystal is created and again when the database is
+        reloaded. The button is only reconfigured if its text has changed
+
+        Parameters as for __init__
+        :return: None
         """
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
         # Setup class variables
         self.colour = str.lower(colour)
-        self.red = 0
-        self.green = 0
-        self.blue = 0
-        self.white = 0
-        self.text_red = 255
-        self.text_green = 255
-        self.text_blue = 255
+        self.name = name_
+        self.key = name_ + str(pos_)
+        self.store = store_
+        self.slot = slot_
         self.pos = pos_
         self.pixel = pixel_
+        self.pin = pin_
         self.row = row_
         self.column = column_
         self.descr = descr_
@@ -163,9 +236,9 @@ class Crystal:
         self.cracked_colour = str.lower(cracked_colour_)
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup initial crystal colours
-        r, g, b, w, self.pixel_red, self.pixel_green, self.pixel_blue, self.pixel_white = colour_baselines(self.colour,
-                                                                                                           colours_)
+        # Setup idle crystal colours
+        self.store.idle_glow[self.slot] = colour_baselines(self.colour, colours_)[4:]
+        self.store.pixel_index[self.slot] = self.pixel
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
         # Split character name into rows of up to 13 characters + series number
@@ -184,465 +257,1140 @@ class Crystal:
             display_name = name_
         text = display_name + chr(13) + "Series: " + str(series_)
 
-        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup command variables & create character button
-        command_text = name_ + str(pos_)
-        self.button = tk.Button(master=parent_frame,
-                                text=text,
-                                relief=tk.FLAT,
-                                bg="black",
-                                activebackground="black",
-                                activeforeground="white",
-                                command=lambda name=command_text: parent.__button_press__(name, self.descr))
-
-
-class MainWindow(tk.Tk):
+        if text != self.text:
+            self.text = text
+            if self.button is not None:
+                self.button.configure(text=text)
+
+
+class Display:
     """
-    Class for main program & GUI window
+    Class for the display's sequencing, colour & neo pixel logic, with no GUI. Runs on its own in headless mode,
+    MainWindow adds the touch screen buttons
     """
 
-    def __init__(self, *args, **kwargs):
+    frame = None        # parent frame for the crystal buttons (None when running headless)
+
+    def __init__(self, output='neopixel', database='Crystals.db', metrics_file='metrics.prom', targets=('127.0.0.1',)):
         """
-        Routine to initialise main program class
-        :param args:
-        :param kwargs:
+        Routine to initialise the display
+        :param output: STRING - Pixel output to use, one of Output.DRIVERS
+        :param database: STRING - Path to the SQLite database file
+        :param metrics_file: STRING - Path to the rotating file for periodic metrics snapshots
+        :param targets: LIST - 'host' or 'host:port' of each receiver for the network outputs
         """
-        tk.Tk.__init__(self, *args, **kwargs)
+        # Runtime metrics - set up first so start up errors are counted too
+        self.metrics = Registry()
+        self.metrics_file = metrics_file
+        self.metrics_server = None
+        self.metrics_dump = None
+        self.current_sequence = None
+        self.__setup_metrics__()
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup GUI Window
-        w, h = self.winfo_screenwidth(), self.winfo_screenheight()
-        self.geometry("%dx%d+0+0" % (w, h))
-        self.config(bg='black')
-        self.wm_attributes('-fullscreen', 'true')
-        self.rowconfigure(0, weight=1)
-        self.columnconfigure(0, weight=1)
-
-        self.frame = tk.Frame(self, bg='black')
-        self.frame.grid(row=0, column=0, sticky="news")
-
-        self.grid = tk.Frame(self.frame, bg='black')
-        self.grid.grid(sticky="news", column=0, row=7, columnspan=2)
+        # Database connection & querying - the watcher spots edits made while the display is running
+        self.database = Database(database)
+        self.data = self.database.load()
+        self.watcher = DatabaseWatcher(self.database)
+        self.settings = self.data.config
+        self.timers = self.data.timers
 
-        self.frame.rowconfigure(7, weight=1)
-        self.frame.columnconfigure(0, weight=1)
+        # Held by the pixel thread for each frame, and while the crystals are rebuilt on a database reload
+        self.frame_lock = Lock()
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Database connection & querying
-        engine = create_engine('sqlite:///Crystals.db')
-        query = "Select * FROM Crystals Order By Pos ASC"
-        crystals = pd.read_sql(query, engine)
-
-        query = "Select Name, Value FROM Config"
-        config_df = pd.read_sql(query, engine)
-
-        query = "Select * FROM Colours"
-        colours_df = pd.read_sql(query, engine)
-
-        query = "Select Name, Value FROM Timers"
-        self.timers = pd.read_sql(query, engine)
+        # Setup dictionary tree for colours - runs quicker than querying the database each time
+        self.colours = self.__colour_tree__(self.data.colours)
+        self.ramps = ColourRamps(self.colours)
 
-        query = "Select ID, Name, Enable, Routine FROM Sequences WHERE Enable=1"
-        self.sequences = pd.read_sql(query, engine)
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Setup crystal variables, create Crystal class item for each crystal's entry
+        self.chains, chain_starts = self.__chain_layout__(self.data.crystals)
+        self.num_pixels = sum(length for _, length in self.chains)
+        self.crystals = {}
+        self.slots = []
+        self.store = ColourStore(len(self.data.crystals), self.ramps)
+        self.__build_crystals__(self.data.crystals, self.store, chain_starts)
+        self.__compile_plans__()
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
         # Setup variables for Neo Pixel Control
-        self.num_pixels = int(crystals['Pixel'].max() + 1)
-        if os.name != 'nt':
-            pins = {10: board.D10,
-                    12: board.D12,
-                    18: board.D18,
-                    21: board.D21}
-            selected_pin = int(config_df[config_df['Name'] == 'GPIO Pin']['Value'])
-            pixel_pin = pins[selected_pin]
-
-            pixel_brightness = float(config_df[config_df['Name'] == 'Brightness']['Value'])
-
-            order = neopixel.GRBW
-
-            self.pixels = neopixel.NeoPixel(
-                pixel_pin, self.num_pixels, brightness=pixel_brightness, auto_write=False, pixel_order=order
-            )
-            self.pixels[0] = (0, 255, 0)
-            self.pixels.write()
-            time.sleep(1)
-            self.pixels[0] = (0, 0, 0)
-            self.pixels.write()
+        self.output = output
+        self.targets = list(targets)
+        self.driver = None
+        self.pixel_setup = None
+        self.__setup_pixels__(test=True)
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup dictionary tree for colours - runs quicker than querying DataFrame each time
-        self.colours = {}
-
-        for index, df_row in colours_df.iterrows():
-            self.colours[df_row.Name] = {'red': df_row.Red,
-                                         'green': df_row.Green,
-                                         'blue': df_row.Blue,
-                                         'white': df_row.White,
-                                         'glow red': df_row.Glow_Red,
-                                         'glow green': df_row.Glow_Green,
-                                         'glow blue': df_row.Glow_Blue,
-                                         'glow white': df_row.Glow_White}
+        # Setup of other control variables
+        self.block = 0
+        self.button = 0
+        self.sequence = 0
+        self.target_time = datetime.datetime.now()
+        self.next_reload_check = time.monotonic()
+        self.running = False
+        self.pixel_thread = None
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup timer variables
-        self.min_between_timer = \
-            self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'min between sequences'].item()
-        self.max_between_timer = \
-            self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'max between sequences'].item()
+        # Setup frame clocks - neo pixels & GUI refresh at separate rates
+        self.led_clock = FrameClock(self.settings.led_fps)
+        self.gui_clock = FrameClock(self.settings.gui_fps)
+        self.skipped_writes = RateCounter()
+
+        # Single animation engine for every pulse, moved on to the current time once per LED frame
+        self.engine = AnimationEngine(self.store)
+
+        # Frame recording being replayed in place of the live sequences (None when running live), and the baked
+        # recordings for each sequence routine
+        self.replay = None
+        self.replay_loop = True
+        self.replay_buttons = False
+        self.replay_start = 0.0
+        self.baked = {}
+
+        # Button press queue & running sequence task for the asyncio runtime (None when using mainloop_)
+        self.presses = None
+        self.sequence_task = None
+        self.sequence_done = None
+
+        # Time of the last button press, the crystal slot waiting to light & the output frame number it was lit in,
+        # for the press to light latency
+        self.press_time = None
+        self.press_slot = None
+        self.press_frame = None
+
+    def __setup_metrics__(self):
+        """
+        Routine to create the runtime metrics - frame times, missed frames, running pulses & threads, sequences and
+        caught exceptions. Served in the Prometheus text format once started, see start()
+        :return: None
+        """
+        metrics = self.metrics
+        self.frame_times = metrics.histogram('kyber_frame_seconds', "Time taken by each stage of a frame - "
+                                             "tk_update (GUI), pixel_render (engine & colours), pixel_write (output)",
+                                             ('stage',))
+        self.missed_frames = metrics.counter('kyber_missed_frames_total',
+                                             "Frames dropped because the loop missed its deadline", ('clock',))
+        metrics.gauge('kyber_active_envelopes', "Pulses, keyframes & callbacks currently running",
+                      function=lambda: len(self.engine.active))
+        metrics.gauge('kyber_pending_envelopes', "Pulses, keyframes & callbacks waiting for their delay",
+                      function=lambda: len(self.engine.pending))
+        metrics.gauge('kyber_threads', "Python threads running", function=threading.active_count)
+        self.sequence_starts = metrics.counter('kyber_sequence_starts_total', "Sequences started", ('routine',))
+        self.sequence_ends = metrics.counter('kyber_sequence_ends_total',
+                                             "Sequences ended, by whether they completed or were interrupted",
+                                             ('routine', 'outcome'))
+        self.sequence_durations = metrics.histogram('kyber_sequence_duration_seconds', "Time each sequence ran for",
+                                                    ('routine',), SEQUENCE_BUCKETS)
+        self.exceptions = metrics.counter('kyber_exceptions_total', "Exceptions caught, by call site", ('site',))
+        self.press_latency = metrics.histogram('kyber_press_latency_seconds',
+                                               "Time from a button press to the crystal's pixel being sent lit",
+                                               buckets=PRESS_BUCKETS)
+
+    def __error__(self, site, error):
+        """
+        Routine to report an exception caught so the display keeps running - printed, logged with its traceback &
+        counted against its call site
+        :param site: STRING - Name of the call site
+        :param error: OBJ - Exception caught
+        :return: None
+        """
+        print(error)
+        logging.error(traceback.format_exc())
+        self.exceptions.inc(site)
 
-        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup crystal variables, create Crystal class item for each crystal's entry
-        self.max_cols = int(config_df[config_df['Name'] == 'Max Buttons']['Value'] - 1)
+    def __sequence_started__(self, routine):
+        """
+        Routine to record the start of a sequence
+        :param routine: STRING - Sequence routine name
+        :return: None
+        """
+        self.current_sequence = (routine, time.monotonic())
+        self.sequence_starts.inc(routine)
+        logging.info("Sequence %s started", routine)
+
+    def __sequence_stopped__(self, outcome):
+        """
+        Routine to record the end of the running sequence, if there is one
+        :param outcome: STRING - 'completed', or 'interrupted' if it was cut short
+        :return: None
+        """
+        current, self.current_sequence = self.current_sequence, None
+        if current is None:
+            return
+        routine, start = current
+        duration = time.monotonic() - start
+        self.sequence_ends.inc(routine, outcome)
+        self.sequence_durations.observe(duration, routine)
+        logging.info("Sequence %s %s after %.2f seconds", routine, outcome, duration)
+
+    def reload_settings(self):
+        """
+        Routine to re-read the Config & Timers tables. The settings objects are swapped whole, so a running sequence
+        never sees a half updated set. Max buttons changes are picked up by a full database reload
+        :return: None
+        """
+        config, timers = self.database.settings()
+        self.__apply_settings__(config, timers)
+
+    def __apply_settings__(self, config, timers):
+        """
+        Routine to switch to new Config & Timers settings, updating the frame clocks & setting the neo pixels up
+        again if the GPIO pin, brightness or output process has changed
+        :param config: Config - Settings from the Config table
+        :param timers: Timers - Settings from the Timers table
+        :return: None
+        """
+        self.settings = config
+        self.timers = timers
+        self.led_clock.set_fps(self.settings.led_fps)
+        self.gui_clock.set_fps(self.settings.gui_fps)
+        with self.frame_lock:
+            self.__setup_pixels__()
+
+    def __setup_pixels__(self, test=False):
+        """
+        Routine to create the pixel output for the current neo pixel chains & brightness. Does nothing if neither
+        has changed since the output was last created. With Output Process set the neo pixels are driven from their
+        own process at the LED FPS - the fake output always stays in this process so its frames can be read
+        :param test: BOOLEAN - Flash the first pixel of each chain green to show the chains are working
+        :return: None
+        """
+        process_fps = self.settings.led_fps if self.settings.output_process and self.output != 'fake' else None
+        options = None
+        if self.output in NETWORK_DRIVERS:
+            options = {'targets': self.targets,
+                       'universe': self.settings.network_universe,
+                       'delta': self.settings.network_delta,
+                       'sync_universe': self.settings.network_sync_universe}
+        setup = (tuple(self.chains), self.settings.brightness, process_fps, options)
+        if setup == self.pixel_setup:
+            return
+
+        if self.driver is not None:
+            self.driver.close()
+        self.driver = create_output(self.output, self.chains, self.settings.brightness, process_fps, options)
+        self.pixel_setup = setup
+        self.press_frame = None     # frame numbers start again on the new output
+
+        if test:
+            self.driver.test()
+
+    @staticmethod
+    def __colour_tree__(colour_rows):
+        """
+        Routine to build the dictionary tree of colour values from the Colours table rows
+        :param colour_rows: LIST - ColourRow for each colour
+        :return: DICT - Colour values, keyed by colour name then channel name
+        """
+        colours = {}
+        for colour_row in colour_rows:
+            colours[colour_row.name] = {'red': colour_row.red,
+                                        'green': colour_row.green,
+                                        'blue': colour_row.blue,
+                                        'white': colour_row.white,
+                                        'glow red': colour_row.glow_red,
+                                        'glow green': colour_row.glow_green,
+                                        'glow blue': colour_row.glow_blue,
+                                        'glow white': colour_row.glow_white}
+        return colours
+
+    def __chain_layout__(self, crystal_rows):
+        """
+        Routine to work out the neo pixel chains from the Crystals table - one chain for each GPIO pin in use, long
+        enough for the highest pixel number on it. Chains are joined end to end in pin order into one run of pixels
+        :param crystal_rows: LIST - CrystalRow for each crystal
+        :return: TUPLE - (GPIO pin, number of pixels) for each chain & the first pixel of each chain, keyed by pin
+        """
+        lengths = {}
+        for crystal_row in crystal_rows:
+            if crystal_row.pixel > -1:
+                pin = self.settings.gpio_pin if crystal_row.pin is None else crystal_row.pin
+                lengths[pin] = max(lengths.get(pin, 0), crystal_row.pixel + 1)
+        if not lengths:
+            lengths[self.settings.gpio_pin] = 0
+
+        chains = []
+        chain_starts = {}
+        start = 0
+        for pin in sorted(lengths):
+            chains.append((pin, lengths[pin]))
+            chain_starts[pin] = start
+            start += lengths[pin]
+        return chains, chain_starts
+
+    def __build_crystals__(self, crystal_rows, store, chain_starts):
+        """
+        Routine to lay out a Crystal for each Crystals table row. Crystals already on screen (matched by ID) keep
+        their button, so only new crystals get a button, removed crystals have theirs destroyed and buttons are only
+        re-gridded if they have moved
+        :param crystal_rows: LIST - CrystalRow for each crystal, in position order
+        :param store: OBJ - ColourStore to hold the crystals' colours
+        :param chain_starts: DICT - First pixel of each neo pixel chain, keyed by GPIO pin (see __chain_layout__)
+        :return: None
+        """
+        existing = {crystal.id: crystal for crystal in self.slots}
+        self.max_cols = self.settings.max_buttons - 1
         self.crystals = {}
+        self.slots = []
+        self.pos_slots = {}
         self.cracked_list = []
+        self.full_row = 0
         row = 0
         col = 0
 
-        for index, df_row in crystals.iterrows():
+        for crystal_row in crystal_rows:
             self.full_row = 0
-            name = df_row.Character
-            series = df_row.Series
-            pos = df_row.Pos
-            pixel = df_row.Pixel
-            key = name + str(pos)
-            descr = df_row.Description
-            cracked = df_row.Cracked
-            cracked_colour = df_row.Cracked_Colour
-            if cracked_colour is None:
-                cracked_colour = ""
-            new_crystal = Crystal(parent_frame=self.frame, colour=df_row.Colour, name_=name, parent=self, pos_=pos,
-                                  pixel_=pixel, series_=series, row_=row, column_=col, colours_=self.colours,
-                                  descr_=descr, cracked_=cracked, cracked_colour_=cracked_colour)
-            new_crystal.button.grid(row=row, column=col, padx=5, pady=5, sticky='news')
+            pin = self.settings.gpio_pin if crystal_row.pin is None else crystal_row.pin
+            pixel = crystal_row.pixel + chain_starts[pin] if crystal_row.pixel > -1 else -1
+            details = {'colour': crystal_row.colour, 'name_': crystal_row.character, 'pos_': crystal_row.pos,
+                       'pixel_': pixel, 'series_': crystal_row.series, 'row_': row, 'column_': col,
+                       'colours_': self.colours, 'descr_': crystal_row.description, 'cracked_': crystal_row.cracked,
+                       'store_': store, 'slot_': len(self.slots), 'cracked_colour_': crystal_row.cracked_colour,
+                       'pin_': pin}
+
+            crystal = existing.pop(crystal_row.id, None)
+            if crystal is None:
+                crystal = Crystal(parent_frame=self.frame, parent=self, id_=crystal_row.id, **details)
+                self.__place_crystal__(crystal)
+            else:
+                moved = (crystal.row, crystal.column) != (row, col)
+                crystal.update(**details)
+                if moved:
+                    self.__place_crystal__(crystal)
+
             col += 1
             if col > self.max_cols:
                 col = 0
                 row += 1
                 self.full_row = 1
-            self.crystals[key] = new_crystal
-            self.crystals[key].button.config(bg='black')
-            self.crystals[key].button.config(fg='white')
-            if cracked:
-                self.cracked_list.append(key)
-        self.frame.columnconfigure(tuple(range(self.max_cols + 1)), weight=1)
-        self.frame.rowconfigure(tuple(range(row + 1)), weight=1)
+            self.crystals[crystal.key] = crystal
+            self.pos_slots[crystal.pos] = len(self.slots)
+            self.slots.append(crystal)
+            if crystal.cracked:
+                self.cracked_list.append(crystal.key)
+
+        for crystal in existing.values():
+            self.__remove_crystal__(crystal)
+
         self.max_rows = row
+        self.__layout_crystals__()
 
-        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Setup of other control variables
-        self.pulses = int(config_df[config_df['Name'] == 'Random Crystal Pulses']['Value'] + 1)
-        self.kill = 0
-        self.block = 0
-        self.button = 0
-        self.sequence = 0
-        self.target_time = datetime.datetime.now()
-        self.illuminate = int(config_df[config_df['Name'] == 'Illuminate buttons']['Value'])
+    def __reload_database__(self):
+        """
+        Routine to apply changes made to the database while the display keeps running. Only the parts that changed
+        are rebuilt - settings & sequences are swapped whole and colour or crystal detail changes are written in
+        place. The colour store & stage plans are only rebuilt if crystals have been added, removed or moved, or the
+        colours have changed, which stops the running sequence
+        :return: None
+        """
+        # Try statement to read the database - a half written edit or invalid setting leaves the display as it was
+        try:
+            data = self.database.load()
+        except (sqlite3.Error, ConfigError) as e:
+            self.__error__('database_reload', e)
+            return
+
+        if data == self.data:
+            return
+
+        colour_names = {colour_row.name for colour_row in data.colours}
+        missing = {str.lower(crystal_row.colour) for crystal_row in data.crystals}
+        missing |= {str.lower(crystal_row.cracked_colour) for crystal_row in data.crystals if crystal_row.cracked}
+        missing -= colour_names
+        if missing:
+            logging.error("Database reload skipped - Colours table is missing %s", ", ".join(sorted(missing)))
+            return
+
+        logging.info("Database changed, reloading")
+        old = self.data
+        self.data = data
+        if self.baked:
+            logging.warning("Baked sequences no longer match the database, running them live until the next prebake")
+            self.baked = {}
+
+        if (data.config, data.timers) != (old.config, old.timers):
+            self.__apply_settings__(data.config, data.timers)
+        if data.colours != old.colours:
+            self.colours = self.__colour_tree__(data.colours)
+            self.ramps = ColourRamps(self.colours)
+
+        layout = [(crystal_row.id, crystal_row.pos, crystal_row.pixel, crystal_row.pin, crystal_row.x, crystal_row.y)
+                  for crystal_row in data.crystals]
+        old_layout = [(crystal_row.id, crystal_row.pos, crystal_row.pixel, crystal_row.pin, crystal_row.x,
+                       crystal_row.y) for crystal_row in old.crystals]
+        if layout != old_layout or data.colours != old.colours \
+                or (data.config.max_buttons, data.config.gpio_pin) != (old.config.max_buttons, old.config.gpio_pin):
+            # Crystal slots, neo pixel chains or ramp table change - build a new colour store, then swap it in between
+            # pixel frames
+            chains, chain_starts = self.__chain_layout__(data.crystals)
+            store = ColourStore(len(data.crystals), self.ramps)
+            self.__build_crystals__(data.crystals, store, chain_starts)
+            self.__sequence_stopped__('interrupted')
+            with self.frame_lock:
+                self.engine.cancel()
+                self.store = store
+                self.engine.store = store
+                self.chains = chains
+                self.num_pixels = sum(length for _, length in chains)
+                self.__setup_pixels__()
+            self.__compile_plans__()
+            if self.replay is not None and self.replay.num_pixels != self.num_pixels:
+                logging.error("Replay stopped - the recording no longer matches the neo pixel chain")
+                self.replay = None
+            elif self.replay is not None and self.replay.num_buttons != store.count:
+                self.replay_buttons = False
+            self.block = 0
+            self.button = 0
+            self.sequence = 0
+            self.target_time = self.__next_sequence_time__()
+        elif data.crystals != old.crystals:
+            self.__build_crystals__(data.crystals, self.store, self.__chain_layout__(data.crystals)[1])
+            self.__compile_patterns__()
+        elif (data.sequences, data.patterns) != (old.sequences, old.patterns):
+            self.__compile_patterns__()
+
+    def __next_sequence_time__(self, delay=0.0):
+        """
+        Routine to work out when the next sequence may start - a fixed delay plus a random wait between the min & max
+        between sequences timers
+        :param delay: FLOAT - Time in seconds before the random wait starts
+        :return: DATETIME - Earliest start time for the next sequence
+        """
+        wait = random.uniform(self.timers.min_between_sequences, self.timers.max_between_sequences)
+        return datetime.datetime.now() + datetime.timedelta(0, wait + delay)
 
     def __button_press__(self, item, text):
         """
-        Routine for when crystal button is pressed
+        Routine for when crystal button is pressed. Under the asyncio runtime the press is queued for the press task,
+        otherwise it is handled straight away. The press time is kept to measure how long the crystal takes to light
+        :param item: INT - Character Index Value
+        :param text: STRING - Description Text of crystal (from DB)
+        :return: None
+        """
+        self.press_time = time.monotonic()
+        if self.presses is not None:
+            self.presses.put_nowait((item, text))
+        else:
+            self.__press_crystal__(item, text)
+
+    def __press_crystal__(self, item, text):
+        """
+        Routine to pulse a pressed crystal on the press layer. A running sequence carries on underneath on the
+        sequence layer, dimmed by the Press Ducking setting. The pulse starts at full colour & an extra LED frame is
+        run straight away, so the crystal lights without waiting for the next frame or the description popup
         :param item: INT - Character Index Value
         :param text: STRING - Description Text of crystal (from DB)
         :return: None
         """
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Enable control variables to prevent sequences from running, determine character
-        self.kill = 1
-        self.block = 1
+        # Enable control variable to prevent new sequences starting while the press shows & stop an earlier press,
+        # determine character
         self.button = 1
+        self.engine.cancel(tag='button')
+        self.store.layers['sequence'].opacity = self.settings.press_ducking
         char = item
-        time.sleep(0.1)
-        self.kill = 0
-        if len(text) > 0:
-            Popup(self, text, char)
 
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Start thread to change button & pixel colours
-        pulse_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'button press pulses'].item()
-        thread = Thread(target=self.__wave_threads__, args=(char, 1, 4, pulse_timer,))
-        thread.start()
+        # Queue pulse to change button & pixel colours, then light it straight away
+        pulse_timer = self.timers.button_press_pulses
+        slot = self.crystals[char].slot
+        self.__pulse__(slot, 4, pulse_timer, tag='button', on_end=self.__button_release__, phase=0.5, layer='press')
+        self.press_slot = slot if self.slots[slot].pixel > -1 and self.press_time is not None else None
+        self.press_frame = None
+        self.__led_frame__(tick=False)
+
+        if len(text) > 0:
+            self.__show_description__(char, text)
 
-    def mainloop_(self):
+    def __start_metrics__(self):
+        """
+        Routine to start the metrics endpoint & file dump, if turned on in the Config table
+        :return: None
+        """
+        if self.settings.metrics_port:
+            # Try statement to serve the metrics - a port already in use leaves the display running without them
+            try:
+                self.metrics_server = MetricsServer(self.metrics, self.settings.metrics_port)
+                logging.info("Metrics served at http://127.0.0.1:%d/metrics", self.metrics_server.port)
+            except OSError as e:
+                self.__error__('metrics_server', e)
+        if self.settings.metrics_interval:
+            self.metrics_dump = MetricsDump(self.metrics, self.metrics_file, self.settings.metrics_interval)
+
+    def start(self):
+        """
+        Routine to start the neo pixel thread. Neo pixels run on their own thread & clock so a slow GUI repaint never
+        holds up a pixel frame. The metrics endpoint & file dump are started too
+        :return: None
+        """
+        self.__start_metrics__()
+        self.running = True
+        self.pixel_thread = Thread(target=self.__pixel_loop__, daemon=True)
+        self.pixel_thread.start()
+
+    def stop(self):
+        """
+        Routine to stop the main loop & neo pixel thread, then release the pixel output, database watcher & metrics
+        :return: None
+        """
+        self.running = False
+        if self.pixel_thread is not None:
+            self.pixel_thread.join()
+            self.pixel_thread = None
+        self.driver.close()
+        self.watcher.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.metrics_dump is not None:
+            self.metrics_dump.write()
+            self.metrics_dump.close()
+            self.metrics_dump = None
+
+    def mainloop_(self, duration=None):
         """ Routine for main GUI loop
+        :param duration: FLOAT - Time in seconds to run for before stopping (None runs until stopped)
         """
+        self.start()
+        end_time = None if duration is None else time.monotonic() + duration
+
         # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-        # Main loop to refresh GUI, determine sequences & update button/ neo pixel colours
-        while True:
-            # Loop through all characters
-            for name in self.crystals.keys():
-                # Read in character colour values (button, text & neo pixel)
-                red = int(self.crystals[name].red)
-                green = int(self.crystals[name].green)
-                blue = int(self.crystals[name].blue)
-                white = int(self.crystals[name].white)
-
-                pixel_red = int(self.crystals[name].pixel_red)
-                pixel_green = int(self.crystals[name].pixel_green)
-                pixel_blue = int(self.crystals[name].pixel_blue)
-                pixel_white = int(self.crystals[name].pixel_white)
-
-                red = value_check(red)
-                green = value_check(green)
-                blue = value_check(blue)
-                white = value_check(white)
-
-                pixel_red = value_check(pixel_red)
-                pixel_green = value_check(pixel_green)
-                pixel_blue = value_check(pixel_blue)
-                pixel_white = value_check(pixel_white)
-
-                # Try statement to update all colours (button, text and pixels)
-                try:
-                    if self.illuminate or self.button:
-                        if white > 0:
-                            self.crystals[name].button.configure(bg=_from_rgb((white,
-                                                                               white,
-                                                                               white)),
-                                                                 activebackground=_from_rgb((white,
-                                                                                             white,
-                                                                                             white))
-                                                                 )
-                        else:
-                            self.crystals[name].button.configure(bg=_from_rgb((red,
-                                                                               green,
-                                                                               blue)),
-                                                                 activebackground=_from_rgb((red,
-                                                                                             green,
-                                                                                             blue))
-
-                                                                 )
-
-                        self.crystals[name].button.configure(fg=_from_rgb((int(self.crystals[name].text_red),
-                                                                           int(self.crystals[name].text_green),
-                                                                           int(self.crystals[name].text_blue))),
-                                                             activeforeground=_from_rgb((int(self.crystals[name].text_red),
-                                                                                         int(self.crystals[
-                                                                                                 name].text_green),
-                                                                                         int(self.crystals[
-                                                                                                 name].text_blue)))
-                                                             )
-
-                    if self.num_pixels - 1 >= self.crystals[name].pixel >= 0 and \
-                            os.name != 'nt':
-                        self.pixels[self.crystals[name].pixel] = (pixel_red, pixel_green, pixel_blue, pixel_white)
+        # Main loop to refresh GUI, determine sequences & update button colours
+        while self.running:
+            self.gui_clock.wait()
+            self.__gui_frame__()
 
-                # Open exception clause to prevent program from crashing - occasional error for colours
-                except Exception as e:
-                    print(e)
-                    logging.error(traceback.format_exc())
+            seq_name = self.__due_sequence__()
+            if seq_name is not None:
+                self.__start_sequence__(seq_name)
 
-            # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-            # Check if random delay timer has lapsed and sequence not running/ button not pressed
-            if datetime.datetime.now() > self.target_time \
-                    and not self.block \
-                    and not self.button \
-                    and len(self.sequences) > 0:
+            if end_time is not None and time.monotonic() >= end_time:
+                self.stop()
 
-                # Generate random number to determine sequence to run - run generated sequences
-                no_sequences = len(self.sequences.index)-1
-                random_seq_no = random.randint(0, no_sequences)
-                seq_name = self.sequences.iloc[random_seq_no]['Routine']
+    def __gui_frame__(self):
+        """
+        Routine to run a single GUI frame - redraw changed buttons, apply database edits & update the screen
+        :return: None
+        """
+        missed = self.gui_clock.tick()
+        if missed:
+            self.missed_frames.inc('gui', amount=missed)
 
-                try:
-                    sequence = getattr(self, seq_name)
-                except AttributeError:
-                    raise NotImplementedError
+        draw_start = time.perf_counter()
+        self.__draw_crystals__()
+        draw_time = time.perf_counter() - draw_start
 
-                thread = Thread(target=sequence)
-                thread.start()
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Apply any changes made to the database since the last check
+        if self.settings.reload_interval and time.monotonic() >= self.next_reload_check:
+            self.next_reload_check = time.monotonic() + self.settings.reload_interval
+            if self.watcher.changed():
+                self.__reload_database__()
+
+        # Update screen
+        refresh_start = time.perf_counter()
+        self.__refresh__()
+        self.frame_times.observe(draw_time + time.perf_counter() - refresh_start, 'tk_update')
+
+    def __due_sequence__(self):
+        """
+        Routine to check if random delay timer has lapsed and sequence not running/ button not pressed, and if so
+        pick a random sequence to run
+        :return: STRING - Sequence routine name (None if no sequence is due)
+        """
+        if datetime.datetime.now() > self.target_time \
+                and self.replay is None \
+                and not self.block \
+                and not self.button \
+                and len(self.sequences) > 0:
+            return random.choice(self.sequences).routine
+        return None
+
+    def __start_sequence__(self, seq_name):
+        """
+        Routine to start a sequence - played from its baked recordings if there are any, otherwise run live
+        :param seq_name: STRING - Sequence routine name
+        :return: None
+        """
+        sequence = self.__sequence_routine__(seq_name)
+        if seq_name in self.baked:
+            self.__play_baked__(seq_name)
+        else:
+            sequence()
+        if self.block and self.current_sequence is None:
+            self.__sequence_started__(seq_name)
 
-            # Update screen
-            self.update()
-            if os.name != 'nt':
-                self.pixels.write()
+    def run_async(self, duration=None):
+        """
+        Routine for the asyncio runtime, an alternative to mainloop_. LED frames, GUI frames, button presses & the
+        sequence scheduler each run as a task on one event loop, so no pixel thread is needed. Each sequence runs as
+        its own task, and a button press cancels it
+        :param duration: FLOAT - Time in seconds to run for before stopping (None runs until stopped)
+        :return: None
+        """
+        asyncio.run(self.__runtime__(duration))
+
+    async def __runtime__(self, duration=None):
+        """
+        Routine to run the asyncio runtime tasks until the duration is up or one of them fails
+        :param duration: FLOAT - Time in seconds to run for before stopping (None runs until stopped)
+        :return: None
+        """
+        self.presses = asyncio.Queue()
+        self.__start_metrics__()
+        self.running = True
+        tasks = [asyncio.ensure_future(task) for task in (self.__led_task__(), self.__gui_task__(),
+                                                          self.__press_task__(), self.__scheduler_task__())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+            self.presses = None
+            self.stop()
+
+    async def __led_task__(self):
+        """
+        Routine for the asyncio LED frame task
+        :return: None
+        """
+        while self.running:
+            await asyncio.sleep(self.led_clock.remaining())
+            self.__led_frame__()
+
+    async def __gui_task__(self):
+        """
+        Routine for the asyncio GUI frame task - Tk is updated from the event loop at the GUI FPS
+        :return: None
+        """
+        while self.running:
+            await asyncio.sleep(self.gui_clock.remaining())
+            self.__gui_frame__()
 
-    def __wave_threads__(self, char=0, blocking=0, pulse_limit=1, pulse_timer=0.001):
+    async def __press_task__(self):
         """
-        Routine for calculation thread. Calculating colours for running crystals. Loops until pulse_limit is met
-        :param char: TEXT - Character name for crystal to be pulsed
-        :param blocking: BOOLEAN - To enable blocking whilst running
-        :param pulse_limit: INT - number of times to fully illuminate and return to base level lighting (pulses)
-        :param pulse_timer: FLOAT Default = 0.001 - Timer between pulse steps
+        Routine for the asyncio button press task - the running sequence task carries on under the press
         :return: None
         """
+        while self.running:
+            item, text = await self.presses.get()
+            self.__press_crystal__(item, text)
 
-        addition = 1
-        pulses = 0
-        colour = "red"
-        pulse_limit += 1
+    async def __scheduler_task__(self):
+        """
+        Routine for the asyncio sequence scheduler task - starts a sequence task once one is due & waits for it to
+        finish or be cancelled
+        :return: None
+        """
         try:
-            if self.crystals[char].pixel > -1:
-                while pulses < pulse_limit and self.kill == 0:
-
-                    if char != 1:
-                        colour = self.crystals[char].colour
-
-                        r, g, b, w, pixel_r, pixel_g, pixel_b, pixel_w = colour_baselines(colour, self.colours)
-
-                        self.crystals[char].red += ((r / 255) * addition)
-                        self.crystals[char].green += ((g / 255) * addition)
-                        self.crystals[char].blue += ((b / 255) * addition)
-                        self.crystals[char].white += ((w / 255) * addition)
-
-                        self.crystals[char].text_red = 255 - self.crystals[char].red
-                        self.crystals[char].text_green = 255 - self.crystals[char].green
-                        self.crystals[char].text_blue = 255 - self.crystals[char].blue
-
-                        if self.crystals[char].white > 0:
-                            self.crystals[char].text_red = 255 - self.crystals[char].white
-                            self.crystals[char].text_green = 255 - self.crystals[char].white
-                            self.crystals[char].text_blue = 255 - self.crystals[char].white
-
-                        if self.crystals[char].red > 253 \
-                                or self.crystals[char].green > 253 \
-                                or self.crystals[char].blue > 253 \
-                                or self.crystals[char].white > 253:
-                            addition = -1
-
-                        elif self.crystals[char].red <= 1 \
-                                and self.crystals[char].green <= 1 \
-                                and self.crystals[char].blue <= 1 \
-                                and self.crystals[char].white <= 1:
-                            addition = 1
-                            pulses += 1
-
-                        if self.crystals[char].red < pixel_r:
-                            self.crystals[char].pixel_red = pixel_r
-                        else:
-                            self.crystals[char].pixel_red = self.crystals[char].red
-
-                        if self.crystals[char].blue < pixel_b:
-                            self.crystals[char].pixel_blue = pixel_b
-                        else:
-                            self.crystals[char].pixel_blue = self.crystals[char].blue
-
-                        if self.crystals[char].green < pixel_g:
-                            self.crystals[char].pixel_green = pixel_g
-                        else:
-                            self.crystals[char].pixel_green = self.crystals[char].green
-
-                        if self.crystals[char].white < pixel_w:
-                            self.crystals[char].pixel_white = pixel_w
-                        else:
-                            self.crystals[char].pixel_white = self.crystals[char].white
-
-                        time.sleep(pulse_timer)
-        except Exception as e:
-            print(e)
-            logging.error(traceback.format_exc())
-
-        self.crystals[char].red = 0
-        self.crystals[char].green = 0
-        self.crystals[char].blue = 0
-        self.crystals[char].white = 0
-        self.crystals[char].text_red = 255
-        self.crystals[char].text_green = 255
-        self.crystals[char].text_blue = 255
-
-        r, g, b, w, \
-            self.crystals[char].pixel_red, self.crystals[char].pixel_green, self.crystals[char].pixel_blue, \
-            self.crystals[char].pixel_white = colour_baselines(colour, self.colours)
-
-        if blocking and self.kill == 0:
+            while self.running:
+                seq_name = self.__due_sequence__()
+                if seq_name is None:
+                    await asyncio.sleep(self.gui_clock.period)
+                    continue
+
+                self.sequence_task = asyncio.ensure_future(self.__sequence_task__(seq_name))
+                await asyncio.wait([self.sequence_task])
+        finally:
+            if self.sequence_task is not None:
+                self.sequence_task.cancel()
+
+    async def __sequence_task__(self, seq_name):
+        """
+        Routine to run a sequence as a task - it starts the sequence, then waits for the animation engine to end it.
+        Cancelling the task stops the sequence
+        :param seq_name: STRING - Sequence routine name
+        :return: None
+        """
+        self.sequence_done = asyncio.get_running_loop().create_future()
+        try:
+            self.__start_sequence__(seq_name)
+            if self.block:
+                await self.sequence_done
+        except asyncio.CancelledError:
+            self.__sequence_stopped__('interrupted')
+            self.engine.cancel(tag='sequence')
+            if self.replay is not None and not self.replay_loop:
+                self.replay = None
             self.block = 0
-            self.button = 0
+            self.sequence = 0
+            raise
+        finally:
+            self.sequence_done = None
+
+    def __place_crystal__(self, crystal):
+        """
+        Routine to put a new or moved crystal's button on screen. Nothing to place when running headless
+        :param crystal: OBJ - Crystal
+        :return: None
+        """
 
-    def __cracked_wave_threads__(self, char=0, blocking=0, cracked_colour='red', stages=1, stage=1):
+    def __remove_crystal__(self, crystal):
         """
-        Routine for calculation thread. Calculating colours for running crystals. Run conditions for cracked corruption
-        :param char: TEXT - Character name for crystal to be pulsed
-        :param blocking: BOOLEAN - To enable blocking whilst running
-        :param cracked_colour: INT - number of times to fully illuminate and return to base level lighting (pulses)
-        :param stages: FLOAT Default = 0.001 - Timer between pulse steps
-        :param stage: Int - Current stage number in running sequence
+        Routine to take a removed crystal's button off screen. Nothing to remove when running headless
+        :param crystal: OBJ - Crystal
         :return: None
         """
 
-        pulses = 0
+    def __layout_crystals__(self):
+        """
+        Routine to size the button grid once the crystals have been laid out. No grid when running headless
+        :return: None
+        """
 
-        og_colour = self.crystals[char].colour
+    def __draw_crystals__(self):
+        """
+        Routine to update the button colours. No buttons when running headless
+        :return: None
+        """
 
-        colour = og_colour
+    def __show_description__(self, char, text):
+        """
+        Routine to show a pressed crystal's description. Logged when running headless
+        :param char: STRING - Name of the selected character/crystal
+        :param text: STRING - Description text
+        :return: None
+        """
+        logging.info("%s: %s", char, text)
 
+    def __refresh__(self):
+        """
+        Routine to update the screen. Nothing to update when running headless
+        :return: None
+        """
+
+    def __pixel_loop__(self):
+        """
+        Routine for neo pixel refresh thread. Advances the animation engine & writes every crystal's pixel colour once
+        per LED frame
+        :return: None
+        """
+        while self.running:
+            self.led_clock.wait()
+            self.__led_frame__()
+
+    def __led_frame__(self, tick=True):
+        """
+        Routine to run a single LED frame, from the recording being replayed or the animation engine
+        :param tick: BOOLEAN - Frame is on the LED frame clock (False for an extra frame, e.g. after a button press)
+        :return: None
+        """
+        if tick:
+            missed = self.led_clock.tick()
+            if missed:
+                self.missed_frames.inc('led', amount=missed)
+
+        # Frame lock stops a database reload swapping the colour store or neo pixels part way through a frame
+        with self.frame_lock:
+            if self.replay is not None:
+                self.__replay_frame__()
+            else:
+                self.__pixel_frame__()
+
+    def __pixel_frame__(self):
+        """
+        Routine to run a single LED frame
+        :return: None
+        """
+        # Advance all running pulses, then work out button, text & pixel colours for every crystal in one pass
+        render_start = time.perf_counter()
+        try:
+            self.engine.tick()
+        except Exception as e:
+            self.__error__('engine_tick', e)
+        store = self.store
+        store.render()
+        write_start = time.perf_counter()
+        self.frame_times.observe(write_start - render_start, 'pixel_render')
+
+        # Try statement to put each crystal's colour at its place in the chain's back buffer, the output only sends
+        # it on if it has changed
         try:
-            if self.crystals[char].pixel > -1:
-                while pulses < 2 and self.kill == 0:
-
-                    if char != 1:
-
-                        if colour == og_colour:
-                            colour = cracked_colour
-                        else:
-                            colour = og_colour
-
-                        r, g, b, w, pixel_r, pixel_g, pixel_b, pixel_w = colour_baselines(colour, self.colours)
-
-                        self.crystals[char].red = r
-                        self.crystals[char].green = g
-                        self.crystals[char].blue = b
-                        self.crystals[char].white = w
-
-                        self.crystals[char].text_red = 255 - self.crystals[char].red
-                        self.crystals[char].text_green = 255 - self.crystals[char].green
-                        self.crystals[char].text_blue = 255 - self.crystals[char].blue
-                        if self.crystals[char].white > 0:
-                            self.crystals[char].text_red = 255 - self.crystals[char].white
-                            self.crystals[char].text_green = 255 - self.crystals[char].white
-                            self.crystals[char].text_blue = 255 - self.crystals[char].white
-
-                        if self.crystals[char].red < pixel_r:
-                            self.crystals[char].pixel_red = pixel_r
-                        else:
-                            self.crystals[char].pixel_red = self.crystals[char].red
-
-                        if self.crystals[char].blue < pixel_b:
-                            self.crystals[char].pixel_blue = pixel_b
-                        else:
-                            self.crystals[char].pixel_blue = self.crystals[char].blue
-
-                        if self.crystals[char].green < pixel_g:
-                            self.crystals[char].pixel_green = pixel_g
-                        else:
-                            self.crystals[char].pixel_green = self.crystals[char].green
-
-                        if self.crystals[char].white < pixel_w:
-                            self.crystals[char].pixel_white = pixel_w
-                        else:
-                            self.crystals[char].pixel_white = self.crystals[char].white
-
-                        stage_timer = self.timers['Value'].to_numpy()[
-                            self.timers['Name'].to_numpy() == 'cracked stages'].item()
-                        time.sleep(
-                            stage_timer*((stages-stage)+1)
-                        )
-                    pulses += 1
+            self.__fill_frame__(store, self.driver.buffer)
+            sent = self.driver.commit()
+
+            if self.skipped_writes.add(0 if sent else 1):
+                logging.debug("Skipped %.0f pixel writes per second (%d sent, %d unchanged, %d rate limited)",
+                              self.skipped_writes.rate, self.driver.writes, self.driver.unchanged,
+                              self.driver.rate_limited)
+
+        # Open exception clause to prevent the pixel thread from stopping
         except Exception as e:
-            print(e)
-            logging.error(traceback.format_exc())
-        stage_timer = self.timers['Value'].to_numpy()[
-            self.timers['Name'].to_numpy() == 'cracked stages'].item()
-
-        time.sleep(
-            stage_timer* stage
-        )
-
-        self.crystals[char].red = 0
-        self.crystals[char].green = 0
-        self.crystals[char].blue = 0
-        self.crystals[char].white = 0
-        self.crystals[char].text_red = 255
-        self.crystals[char].text_green = 255
-        self.crystals[char].text_blue = 255
-
-        colour = self.crystals[char].colour
-
-        r, g, b, w, \
-            self.crystals[char].pixel_red, self.crystals[char].pixel_green, self.crystals[char].pixel_blue, \
-            self.crystals[char].pixel_white = colour_baselines(colour, self.colours)
-
-        if blocking and self.kill == 0:
+            self.__error__('pixel_write', e)
+        self.frame_times.observe(time.perf_counter() - write_start, 'pixel_write')
+
+        if self.press_slot is not None:
+            self.__check_press_lit__()
+
+    def __check_press_lit__(self):
+        """
+        Routine to measure press to light latency - the first output frame with the pressed crystal's pixel lit is
+        noted, then once the output has sent that frame (or a later one) out to the neo pixels, the time from the press
+        to that send is recorded. With Output Process set that is when the output process writes it, not when it is
+        handed over
+        :return: None
+        """
+        if self.press_frame is None:
+            pixel = int(self.store.pixel_index[self.press_slot])
+            if not (0 <= pixel < self.num_pixels and any(self.driver.front[pixel * 4:(pixel + 1) * 4])):
+                return
+            self.press_frame = self.driver.writes
+
+        sent_time = self.driver.sent_time(self.press_frame)
+        if sent_time is None:
+            return
+        latency = sent_time - self.press_time
+        self.press_latency.observe(latency)
+        if latency > PRESS_LATENCY_TARGET:
+            logging.warning("Press to light took %.1f ms, target is %.0f ms", latency * 1000,
+                            PRESS_LATENCY_TARGET * 1000)
+        else:
+            logging.debug("Press to light took %.1f ms", latency * 1000)
+        self.press_slot = None
+        self.press_time = None
+        self.press_frame = None
+
+    def __fill_frame__(self, store, frame):
+        """
+        Routine to put each crystal's pixel colour at its place in the chain, pixels with no crystal are left off
+        :param store: OBJ - ColourStore, already rendered
+        :param frame: ARRAY - (pixels, 4) uint8 frame to fill
+        :return: None
+        """
+        index = store.pixel_index
+        connected = (index >= 0) & (index < self.num_pixels)
+        frame[:] = 0
+        frame[index[connected]] = store.pixel[connected]
+
+    def idle_frame(self):
+        """
+        Routine to render the frame shown when no pulses are running - every crystal at its idle glow. Only used while
+        the display is not running
+        :return: ARRAY - (pixels, 4) uint8 frame
+        """
+        frame = np.zeros((self.num_pixels, 4), dtype=np.uint8)
+        self.engine.cancel()
+        self.store.render()
+        self.__fill_frame__(self.store, frame)
+        return frame
+
+    def record_sequence(self, routine, path, fps=None, limit=600.0):
+        """
+        Routine to render a sequence offline into a frame recording. The animation engine runs on a simulated clock
+        stepped one LED frame at a time, so the sequence renders as fast as the CPU allows rather than in real time.
+        Recording carries on after the sequence ends until its last pulses have faded out, so the recording finishes
+        on the idle frame. Only used while the display is not running
+        :param routine: STRING - Sequence routine name
+        :param path: STRING - Path to write the recording to
+        :param fps: FLOAT - Frame rate to render at (defaults to the LED FPS setting)
+        :param limit: FLOAT - Longest recording in seconds, in case the sequence never finishes
+        :return: INT - Number of frames written (frames matching the one before are not stored)
+        """
+        fps = fps or self.settings.led_fps
+        sequence = self.__sequence_routine__(routine)
+        now = 0.0
+        live_clock = self.engine.clock
+        self.engine.clock = lambda: now
+        frame = np.zeros((self.num_pixels, 4), dtype=np.uint8)
+        try:
+            self.engine.cancel()
             self.block = 0
-            self.button = 0
+            self.sequence = 0
+            sequence()
+
+            with FrameRecorder(path, self.num_pixels, self.store.count, self.ramps) as recorder:
+                frame_no = 0
+                while True:
+                    now = frame_no / fps
+                    self.engine.tick(now)
+                    self.store.render()
+                    self.__fill_frame__(self.store, frame)
+                    recorder.add(now, frame, self.store.shown)
+                    if (not self.block and not self.engine.drawing()) or now >= limit:
+                        break
+                    frame_no += 1
+        finally:
+            self.engine.cancel()
+            self.engine.clock = live_clock
+            self.block = 0
+            self.sequence = 0
+
+        logging.info("Recorded %s - %d frames over %.2f seconds", routine, recorder.frames, recorder.duration)
+        return recorder.frames
+
+    def play_recording(self, path):
+        """
+        Routine to replay a frame recording in a loop in place of the live sequences
+        :param path: STRING - Path to the recording
+        :return: None
+        """
+        self.__start_replay__(FrameRecording(path), loop=True)
+
+    def use_baked(self, baked):
+        """
+        Routine to open baked sequence recordings - the scheduler plays one of these in place of working out the
+        sequence live, see Prebake.prebake
+        :param baked: DICT - List of recording paths for each sequence routine
+        :return: None
+        """
+        self.baked = {routine: [FrameRecording(path) for path in paths] for routine, paths in baked.items()}
+
+    def __play_baked__(self, routine):
+        """
+        Routine to run a sequence by playing one of its baked recordings once
+        :param routine: STRING - Sequence routine name
+        :return: None
+        """
+        recording = random.choice(self.baked[routine])
+        self.block = 1
+        self.sequence = 1
+        self.__start_replay__(recording, loop=False)
+        self.target_time = self.__next_sequence_time__(recording.duration)
+
+    def __start_replay__(self, recording, loop=True):
+        """
+        Routine to start replaying a frame recording in place of the animation engine. Button colours are only
+        replayed if the recording was made with the same crystals & colours tables
+        :param recording: OBJ - FrameRecording
+        :param loop: BOOLEAN - Loop the recording, otherwise it ends the running sequence once played
+        :return: None
+        """
+        if recording.num_pixels != self.num_pixels:
+            raise ValueError("%s was recorded for %d neo pixels, the display has %d"
+                             % (recording.path, recording.num_pixels, self.num_pixels))
+
+        with self.frame_lock:
+            self.engine.cancel(tag='sequence')
+            self.replay_buttons = recording.num_buttons == self.store.count \
+                and recording.checksum == ramp_checksum(self.ramps)
+            if not self.replay_buttons:
+                logging.warning("%s was recorded with different crystals or colours, only replaying the neo pixels",
+                                recording.path)
+            self.replay_loop = loop
+            self.replay_start = time.monotonic()
+            self.replay = recording
+
+    def __replay_frame__(self):
+        """
+        Routine to run a single LED frame from the recording being replayed - the frame is copied straight to the
+        output with no colour calculations. While a crystal press shows, the frame is used as the sequence layer & the
+        press is blended over it
+        :return: None
+        """
+        recording = self.replay
+        try:
+            self.engine.tick()
+            elapsed = time.monotonic() - self.replay_start
+            if self.replay_loop and recording.duration:
+                elapsed %= recording.duration
+            index = recording.index(elapsed)
+            if len(recording) and self.button:
+                store = self.store
+                pixel_index = store.pixel_index
+                connected = (pixel_index >= 0) & (pixel_index < self.num_pixels)
+                sequence = np.zeros((store.count, 4), dtype=np.uint8)
+                sequence[connected] = recording.pixels(index)[pixel_index[connected]]
+                store.render({'sequence': sequence})
+                self.__fill_frame__(store, self.driver.buffer)
+            elif len(recording):
+                self.driver.buffer[:] = recording.pixels(index)
+                if self.replay_buttons:
+                    self.store.shown = recording.buttons(index).astype(np.intp)
+            self.driver.commit()
+
+            if not self.replay_loop and elapsed >= recording.duration:
+                self.replay = None
+                self.__sequence_end__()
+
+        # Open exception clause to prevent the pixel thread from stopping
+        except Exception as e:
+            self.__error__('replay', e)
+
+    def stage_plan(self, routine):
+        """
+        Routine to fetch the precompiled stage plan for a fixed wave sequence
+        :param routine: STRING - Sequence routine name
+        :return: TUPLE - Read only array of crystal slots for each stage
+        """
+        return self.stage_plans[routine]
+
+    def __compile_plans__(self):
+        """
+        Routine to build the stage plans for the fixed wave sequences from the grid layout, the ripple plans from
+        every crystal - from the crystals' physical X & Y positions if every crystal has them, otherwise from the grid
+        - and the plans for the Patterns table. Run at start up and whenever the layout changes
+        :return: None
+        """
+        start = time.perf_counter()
+        rows = [crystal.row for crystal in self.slots]
+        columns = [crystal.column for crystal in self.slots]
+        pixels = [crystal.pixel for crystal in self.slots]
+        self.stage_plans = compile_stage_plans(rows, columns, pixels, self.max_rows, self.max_cols, self.full_row,
+                                               self.num_pixels)
+
+        xs = [crystal_row.x for crystal_row in self.data.crystals]
+        ys = [crystal_row.y for crystal_row in self.data.crystals]
+        if None in xs or None in ys:
+            xs = ys = None
+        self.ripple_plans = compile_ripple_plans(ripple_rings(rows, columns, xs, ys), pixels)
+        self.__compile_patterns__()
+        self.plan_build_time = time.perf_counter() - start
+        logging.debug("Stage plans built in %.2f ms", self.plan_build_time * 1000)
+
+    def __compile_patterns__(self):
+        """
+        Routine to build the stage plans for each pattern in the Patterns table & add the patterns to the sequences
+        the scheduler picks from. A pattern with a random origin gets a plan for every origin it could start from.
+        Patterns with an origin or colour that can't be found are left out
+        :return: None
+        """
+        rows = [crystal.row for crystal in self.slots]
+        columns = [crystal.column for crystal in self.slots]
+        pixels = [crystal.pixel for crystal in self.slots]
+        lit = [crystal.slot for crystal in self.slots if crystal.pixel > -1]
+        characters = {}
+        for crystal_row, crystal in zip(self.data.crystals, self.slots):
+            characters.setdefault(str.lower(crystal_row.character), crystal.slot)
+
+        self.patterns = {}
+        self.random_patterns = set()
+        sequences = list(self.data.sequences)
+        for pattern in self.data.patterns:
+            ordering = pattern.ordering
+            origin = str.lower(pattern.origin)
+            if pattern.colour and pattern.colour not in self.ramps.names:
+                logging.error("Pattern '%s' skipped - Colours table is missing %s", pattern.name, pattern.colour)
+                continue
+
+            if ordering == 'random':
+                origins = [None]
+            elif origin == 'random':
+                origins = lit if ordering in ('radial', 'chain') else list(ORIGINS[ordering])
+            elif origin in ORIGINS[ordering]:
+                origins = [origin]
+            elif origin in characters and ordering in ('radial', 'chain'):
+                origins = [characters[origin]]
+            else:
+                logging.error("Pattern '%s' skipped - no %s origin '%s'", pattern.name, ordering, pattern.origin)
+                continue
+
+            plans = []
+            for start in origins:
+                if ordering == 'random':
+                    plans.append(None)
+                elif ordering == 'radial':
+                    slot = start if isinstance(start, int) else anchor_slot(start, rows, columns, pixels)
+                    plans.append(() if slot is None else self.ripple_plans[slot])
+                else:
+                    plans.append(compile_pattern_plan(ordering, start, rows, columns, pixels))
+            if not plans:
+                continue
+
+            routine = PATTERN_ROUTINE % pattern.id
+            self.patterns[routine] = (pattern, plans)
+            if len(plans) > 1 or ordering == 'random':
+                self.random_patterns.add(routine)
+            sequences.append(SequenceRow(pattern.id, pattern.name, pattern.enable, routine))
+        self.sequences = sequences
+
+    def __sequence_routine__(self, routine):
+        """
+        Routine to look up the function that runs a sequence - a pattern from the Patterns table, or a sequence routine
+        on the display
+        :param routine: STRING - Sequence routine name
+        :return: FUNCTION - Starts the sequence
+        """
+        if routine in self.patterns:
+            return lambda: self.__run_pattern__(routine)
+        try:
+            return getattr(self, routine)
+        except AttributeError:
+            raise NotImplementedError
+
+    def __slot_stages__(self, stages):
+        """
+        Routine to convert stages of crystal positions into stages of crystal slots, dropping positions with no
+        crystal & repeats within a stage
+        :param stages: LIST - List of crystal positions for each stage
+        :return: LIST - List of crystal slots for each stage
+        """
+        slot_stages = []
+        for stage in stages:
+            slots = sorted({self.pos_slots[pos] for pos in stage if pos in self.pos_slots})
+            slot_stages.append(slots)
+        return slot_stages
+
+    def __pulse__(self, char, pulses=1, pulse_timer=0.01, delay=0.0, tag='sequence', on_end=None, phase=0.0,
+                  colour=None, curve='triangle', layer='sequence'):
+        """
+        Routine to queue a crystal pulse on the animation engine. Crystals without a neo pixel are not pulsed
+        :param char: INT - Crystal slot for crystal to be pulsed
+        :param pulses: INT - number of times to fully illuminate and return to base level lighting
+        :param pulse_timer: FLOAT - Timer between pulse steps (sets the pulse length, see pulse_duration)
+        :param delay: FLOAT - Time in seconds before the pulse starts
+        :param tag: STRING - Engine group the pulse belongs to
+        :param on_end: FUNCTION - Called once the pulse has finished
+        :param phase: FLOAT - Point in the first pulse to start from (0 starts off, 0.5 starts at full colour)
+        :param colour: STRING - Colour to pulse (None uses the crystal's own colour)
+        :param curve: STRING - Pulse shape, one of Engine.PULSE_CURVES
+        :param layer: STRING - Compositor layer to pulse on, one of Engine.LAYERS
+        :return: None
+        """
+        crystal = self.slots[char]
+        if crystal.pixel > -1:
+            colour = self.ramps.names[colour or crystal.colour]
+            self.engine.pulse(crystal.slot, self.ramps.offset[colour], self.ramps.peak[colour], pulses,
+                              pulse_duration(pulse_timer), delay=delay, tag=tag, on_end=on_end, phase=phase,
+                              curve=curve, layer=layer)
+        elif on_end is not None:
+            self.engine.call_later(delay, on_end, tag=tag)
+
+    def __corrupt__(self, char, cracked_colour='red', stages=1, stage=1, delay=0.0):
+        """
+        Routine to queue cracked corruption for a crystal on the animation engine - crystal flips to the cracked colour,
+        back to its own colour and then returns to idle. Crystals further out in the wave hold each colour for less time
+        :param char: INT - Crystal slot for crystal to be corrupted
+        :param cracked_colour: STRING - Colour to corrupt the crystal to
+        :param stages: INT - Total number of stages in running sequence
+        :param stage: INT - Current stage number in running sequence
+        :param delay: FLOAT - Time in seconds before the corruption starts
+        :return: None
+        """
+        crystal = self.slots[char]
+        if crystal.pixel > -1:
+            stage_timer = self.timers.cracked_stages
+            hold = stage_timer * ((stages - stage) + 1)
+
+            cracked = self.ramps.names[cracked_colour]
+            og = self.ramps.names[crystal.colour]
+            frames = [(0.0, self.ramps.full[cracked], self.ramps.glow[cracked]),
+                      (hold, self.ramps.full[og], self.ramps.glow[og])]
+            self.engine.keyframes(crystal.slot, frames, (hold * 2) + (stage_timer * stage), delay=delay,
+                                  tag='sequence')
+
+    def __sequence_end__(self):
+        """
+        Routine run from the animation engine once a sequence has finished, to allow the next one to start
+        :return: None
+        """
+        self.__sequence_stopped__('completed')
+        self.block = 0
+        self.sequence = 0
+        if self.sequence_done is not None and not self.sequence_done.done():
+            self.sequence_done.set_result(None)
+
+    def __button_release__(self):
+        """
+        Routine run from the animation engine once a button press pulse has finished, lifting the ducking from the
+        sequence layer
+        :return: None
+        """
+        self.button = 0
+        self.store.layers['sequence'].opacity = 1.0
 
     def __left_wave__(self):
         """
@@ -651,30 +1399,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                stage = math.floor(self.max_rows / 2)
-                stage = row - stage
-                stage = float(stage ** 2)
-                stage = stage ** 0.5
-                stage = int(stage + column)
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'left wave stages'].item()
-            pulses_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'left wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            stage_timer = self.timers.left_wave_stages
+            pulses_timer = self.timers.left_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__left_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __right_wave__(self):
         """
@@ -683,30 +1413,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                stage = math.floor(self.max_rows / 2)
-                stage = row - stage
-                stage = float(stage ** 2)
-                stage = stage ** 0.5
-                stage = int(stage + self.max_cols - column)
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'right wave stages'].item()
-            pulses_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'right wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            stage_timer = self.timers.right_wave_stages
+            pulses_timer = self.timers.right_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__right_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __top_wave__(self):
         """
@@ -715,30 +1427,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                stage = math.floor(self.max_cols / 2)
-                stage = column - stage
-                stage = float(stage ** 2)
-                stage = stage ** 0.5
-                stage = int(stage + row)
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top wave stages'].item()
-            pulses_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            stage_timer = self.timers.top_wave_stages
+            pulses_timer = self.timers.top_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__top_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __bottom_wave__(self):
         """
@@ -747,32 +1441,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                stage = math.floor(self.max_cols / 2)
-                stage = column - stage
-                stage = float(stage ** 2)
-                stage = stage ** 0.5
-                stage = int(stage + self.max_rows - row)
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom wave stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            stage_timer = self.timers.bottom_wave_stages
+            pulses_timer = self.timers.bottom_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__bottom_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __top_left_wave__(self):
         """
@@ -781,31 +1455,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                if row > column:
-                    stage = row
-                else:
-                    stage = column
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top left wave stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top left wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
+            stage_timer = self.timers.top_left_wave_stages
+            pulses_timer = self.timers.top_left_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__top_left_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
 
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __top_right_wave__(self):
         """
@@ -814,31 +1469,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                if row > (self.max_cols - column - 1):
-                    stage = row
-                else:
-                    stage = self.max_cols - column
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
+            stage_timer = self.timers.top_right_wave_stages
+            pulses_timer = self.timers.top_right_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__top_right_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
 
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top right wave stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'top right wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __bottom_left_wave__(self):
         """
@@ -847,39 +1483,12 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
+            stage_timer = self.timers.bottom_left_wave_stages
+            pulses_timer = self.timers.bottom_left_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__bottom_left_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
 
-            if self.full_row:
-                max_rows = self.max_rows
-            else:
-                max_rows = self.max_rows - 1
-
-            stages = []
-            stage = 0
-            for char in self.crystals.keys():
-                if self.crystals[char].pixel > -1:
-                    row = self.crystals[char].row
-                    column = self.crystals[char].column
-                    if (max_rows - row) > column:
-                        stage = (max_rows - row)
-                    else:
-                        stage = column
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom left wave stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom left wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __bottom_right_wave__(self):
         """
@@ -888,204 +1497,42 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
+            stage_timer = self.timers.bottom_right_wave_stages
+            pulses_timer = self.timers.bottom_right_wave_pulses
+            duration = self.__run_wave__(self.stage_plan('__bottom_right_wave__'),
+                                         timer=stage_timer, pulse_timer=pulses_timer)
 
-            if self.full_row:
-                max_rows = self.max_rows
-            else:
-                max_rows = self.max_rows - 1
-
-            stages = []
-            for char in self.crystals.keys():
-                row = self.crystals[char].row
-                column = self.crystals[char].column
-                if (max_rows - row) < (self.max_cols - column):
-                    stage = (self.max_cols - column)
-                else:
-                    stage = (max_rows - row)
-
-                while len(stages) < stage + 1:
-                    stages.append([])
-                if not self.crystals[char].pos in stages[stage] and \
-                        self.crystals[char].pixel > -1:
-                    stages[stage].append(self.crystals[char].pos)
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom right wave stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'bottom right wave pulses'].item()
-            self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, stage_timer)
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __rain_drop_seq__(self):
         """
         Routine to create a pulsing wave starting at a random crystal and radiating out like a rain drop
         :return: None
         """
-        if not self.sequence:
+        lit = [crystal.slot for crystal in self.slots if crystal.pixel > -1]
+        if not self.sequence and lit:
             self.sequence = 1
-            start_point = random.randint(0, len(self.crystals))
-            name = ""
-            for char in self.crystals.keys():
-                if self.crystals[char].pos == start_point:
-                    name = char
-            if name != "":
-                while self.crystals[name].pixel < 0:
-                    start_point = random.randint(0, len(self.crystals))
-                    for char in self.crystals.keys():
-                        if self.crystals[char].pos == start_point:
-                            name = char
-
-                start_row = math.floor((start_point / (self.max_cols + 1)))
-                start_col = int(((start_point / (self.max_cols + 1)) - start_row) * (self.max_cols + 1))
-                stages = [[start_point]]
-
-                added = 1
-                wave = 1
-
-                while added:
-                    wave_list = []
-                    column_1 = start_col + wave
-                    column_2 = start_col - wave
-                    rows = []
-                    added = 0
-
-                    for x in range(wave + 1):
-                        rows.append(start_row + x)
-                        rows.append(start_row - x)
-
-                    for item in rows:
-                        if column_1 <= self.max_cols:
-                            if self.max_rows - 1 >= item >= 0:
-                                pos = (item * (self.max_cols + 1)) + column_1
-                                wave_list.append(pos)
-                            pos = (start_row * (self.max_cols + 1)) + column_1
-                            wave_list.append(pos)
-                            added = 1
-                        if column_2 >= 0:
-                            if self.max_rows >= item >= 0:
-                                pos = (item * (self.max_cols + 1)) + column_2
-                                wave_list.append(pos)
-                            pos = (start_row * (self.max_cols + 1)) + column_2
-                            wave_list.append(pos)
-                            added = 1
-                    columns = []
-                    row_1 = start_row + wave
-                    row_2 = start_row - wave
-                    for x in range(wave):
-                        columns.append(start_col + x)
-                        columns.append(start_col - x)
-                    for item in columns:
-                        if row_1 <= self.max_rows:
-                            if self.max_cols >= item >= 0:
-                                pos = (row_1 * (self.max_cols + 1)) + item
-                                wave_list.append(pos)
-                            pos = (row_1 * (self.max_cols + 1)) + start_col
-                            wave_list.append(pos)
-                            added = 1
-
-                        if row_2 >= 0:
-                            if self.max_cols >= item >= 0:
-                                pos = (row_2 * (self.max_cols + 1)) + item
-                                wave_list.append(pos)
-                            pos = (row_2 * (self.max_cols + 1)) + start_col
-                            wave_list.append(pos)
-                            added = 1
-                    stages.append(wave_list)
-                    wave += 1
-                stage_timer = self.timers['Value'].to_numpy()[
-                    self.timers['Name'].to_numpy() == 'raindrop wave stages'].item()
-                pulses_timer = self.timers['Value'].to_numpy()[
-                    self.timers['Name'].to_numpy() == 'raindrop wave pulses'].item()
-                self.__run_wave__(stages, timer=stage_timer, pulse_timer=pulses_timer)
-
-                self.target_time = datetime.datetime.now() + \
-                                   datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                        self.max_between_timer)) + \
-                                   datetime.timedelta(0, stage_timer)
+            start_slot = random.choice(lit)
+
+            stage_timer = self.timers.raindrop_wave_stages
+            pulses_timer = self.timers.raindrop_wave_pulses
+            duration = self.__run_wave__(self.ripple_plans[start_slot], timer=stage_timer, pulse_timer=pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __cracked_seq__(self):
         """
         Routine to create a wave of corruption starting from random cracked crystal
         :return: None
         """
-        if not self.sequence:
+        if not self.sequence and self.cracked_list:
             self.sequence = 1
-            start_point = random.randint(0, len(self.cracked_list)-1)
-            name = self.cracked_list[start_point]
-            cracked_colour = self.crystals[name].cracked_colour
-
-            if name != "":
-                start_point = self.crystals[name].pos
-                start_row = math.floor((start_point / (self.max_cols + 1)))
-                start_col = int(((start_point / (self.max_cols + 1)) - start_row) * (self.max_cols + 1))
-                stages = [[start_point]]
-
-                added = 1
-                wave = 1
-
-                while added:
-                    wave_list = []
-                    column_1 = start_col + wave
-                    column_2 = start_col - wave
-                    rows = []
-                    added = 0
-
-                    for x in range(wave + 1):
-                        rows.append(start_row + x)
-                        rows.append(start_row - x)
-
-                    for item in rows:
-                        if column_1 <= self.max_cols:
-                            if self.max_rows - 1 >= item >= 0:
-                                pos = (item * (self.max_cols + 1)) + column_1
-                                wave_list.append(pos)
-                            pos = (start_row * (self.max_cols + 1)) + column_1
-                            wave_list.append(pos)
-                            added = 1
-                        if column_2 >= 0:
-                            if self.max_rows >= item >= 0:
-                                pos = (item * (self.max_cols + 1)) + column_2
-                                wave_list.append(pos)
-                            pos = (start_row * (self.max_cols + 1)) + column_2
-                            wave_list.append(pos)
-                            added = 1
-                    columns = []
-                    row_1 = start_row + wave
-                    row_2 = start_row - wave
-                    for x in range(wave):
-                        columns.append(start_col + x)
-                        columns.append(start_col - x)
-                    for item in columns:
-                        if row_1 <= self.max_rows:
-                            if self.max_cols >= item >= 0:
-                                pos = (row_1 * (self.max_cols + 1)) + item
-                                wave_list.append(pos)
-                            pos = (row_1 * (self.max_cols + 1)) + start_col
-                            wave_list.append(pos)
-                            added = 1
-
-                        if row_2 >= 0:
-                            if self.max_cols >= item >= 0:
-                                pos = (row_2 * (self.max_cols + 1)) + item
-                                wave_list.append(pos)
-                            pos = (row_2 * (self.max_cols + 1)) + start_col
-                            wave_list.append(pos)
-                            added = 1
-                    stages.append(wave_list)
-                    wave += 1
-
-                stage_timer = self.timers['Value'].to_numpy()[
-                    self.timers['Name'].to_numpy() == 'cracked stages'].item()
-                self.__run_wave__(stages, timer=stage_timer, pulse_timer=0.00001, cracked=1,
-                                  cracked_colour=cracked_colour)
-                self.target_time = datetime.datetime.now() + \
-                                   datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                        self.max_between_timer)) + \
-                                   datetime.timedelta(0, stage_timer)
+            crystal = self.crystals[random.choice(self.cracked_list)]
+
+            stage_timer = self.timers.cracked_stages
+            duration = self.__run_wave__(self.ripple_plans[crystal.slot], timer=stage_timer, pulse_timer=0.00001,
+                                         cracked=1, cracked_colour=crystal.cracked_colour)
+            self.target_time = self.__next_sequence_time__(stage_timer + duration)
 
     def __chain_wave__(self):
         """
@@ -1094,30 +1541,13 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            self.kill = 1
-            self.block = 1
-            time.sleep(0.1)
-            self.kill = 0
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'forward chain stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'forward chain pulses'].item()
-
-            for neo in range(0, self.num_pixels):
-                for name in self.crystals.keys():
-                    if self.crystals[name].pixel == neo and not self.button:
-                        thread = Thread(target=self.__wave_threads__, args=(name, 0, 1, pulses_timer,))
-                        thread.start()
-                time.sleep(stage_timer)
-
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, pulses_timer * (510 + 127.5))
 
-        self.block = 0
-        self.sequence = 0
+            stage_timer = self.timers.forward_chain_stages
+            pulses_timer = self.timers.forward_chain_pulses
+
+            duration = self.__run_chain__(self.stage_plan('__chain_wave__'), stage_timer, pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(duration + pulses_timer * (510 + 127.5))
 
     def __reverse_chain_wave__(self):
         """
@@ -1126,28 +1556,13 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            self.kill = 1
-            self.block = 1
-            time.sleep(0.1)
-            self.kill = 0
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'backward chain stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'backward chain pulses'].item()
-
-            for neo in range(0, self.num_pixels + 1):
-                for name in self.crystals.keys():
-                    if self.crystals[name].pixel == self.num_pixels - neo and not self.button:
-                        thread = Thread(target=self.__wave_threads__, args=(name, 0, 1, pulses_timer,))
-                        thread.start()
-                time.sleep(stage_timer)
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, pulses_timer * (510 + 127.5))
-        self.block = 0
-        self.sequence = 0
+
+            stage_timer = self.timers.backward_chain_stages
+            pulses_timer = self.timers.backward_chain_pulses
+
+            duration = self.__run_chain__(self.stage_plan('__reverse_chain_wave__'), stage_timer, pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(duration + pulses_timer * (510 + 127.5))
 
     def __centre_chain_wave__(self):
         """
@@ -1156,43 +1571,13 @@ class MainWindow(tk.Tk):
         """
         if not self.sequence:
             self.sequence = 1
-            self.kill = 1
-            self.block = 1
-            time.sleep(0.1)
-            self.kill = 0
-
-            stage_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'centre chain stages'].item()
-            pulses_timer = \
-                self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'centre chain pulses'].item()
-
-            start = 1
-
-            lower_pixel = int(self.num_pixels / 2)
-            upper_pixel = int(self.num_pixels / 2)
-            while lower_pixel > -1 and upper_pixel <= self.num_pixels:
-                for name in self.crystals.keys():
-                    if start and self.crystals[name].pixel == lower_pixel and not self.button:
-                        thread = Thread(target=self.__wave_threads__, args=(name, 0, 1, pulses_timer,))
-                        thread.start()
-                        start = 0
-                    else:
-                        if self.crystals[name].pixel == lower_pixel and not self.button:
-                            thread = Thread(target=self.__wave_threads__, args=(name, 0, 1, pulses_timer,))
-                            thread.start()
-                        if self.crystals[name].pixel == upper_pixel and not self.button:
-                            thread = Thread(target=self.__wave_threads__, args=(name, 0, 1, pulses_timer,))
-                            thread.start()
-                lower_pixel -= 1
-                upper_pixel += 1
-
-                time.sleep(stage_timer)
-            self.target_time = datetime.datetime.now() + \
-                               datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                    self.max_between_timer)) + \
-                               datetime.timedelta(0, pulses_timer * (510 + 127.5))
-        self.block = 0
-        self.sequence = 0
+
+            stage_timer = self.timers.centre_chain_stages
+            pulses_timer = self.timers.centre_chain_pulses
+
+            duration = self.__run_chain__(self.stage_plan('__centre_chain_wave__'), stage_timer, pulses_timer)
+
+            self.target_time = self.__next_sequence_time__(duration + pulses_timer * (510 + 127.5))
 
     def __random_crystal__(self):
         """
@@ -1205,61 +1590,319 @@ class MainWindow(tk.Tk):
             if not [item for item in stages if rand_crystal in item]:
                 stages.append([rand_crystal])
 
-        pulses_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'button press pulses'].item()
-        stage_timer = self.timers['Value'].to_numpy()[self.timers['Name'].to_numpy() == 'random stages'].item()
+        pulses_timer = self.timers.button_press_pulses
+        stage_timer = self.timers.random_stages
 
-        thread = Thread(target=self.__run_wave__, args=(stages,
-                                                        stage_timer,
-                                                        pulses_timer,
-                                                        self.pulses))
-        thread.start()
+        pulses = self.settings.random_crystal_pulses + 1
+        self.__run_wave__(self.__slot_stages__(stages), stage_timer, pulses_timer, pulses)
 
-        stage_timer = ((pulses_timer * (510 + 127.5)) * (self.pulses + 1)) + (stage_timer * len(stages))
-        self.target_time = datetime.datetime.now() + \
-                           datetime.timedelta(0, random.randint(self.min_between_timer,
-                                                                self.max_between_timer)) + \
-                           datetime.timedelta(0, stage_timer)
+        stage_timer = ((pulses_timer * (510 + 127.5)) * (pulses + 1)) + (stage_timer * len(stages))
+        self.target_time = self.__next_sequence_time__(stage_timer)
 
-    def __run_wave__(self, stages, timer=1, pulse_timer=0.01, pulses=1, cracked=0, cracked_colour=""):
+    def __run_wave__(self, stages, timer=1, pulse_timer=0.01, pulses=1, cracked=0, cracked_colour="", colour=None,
+                     curve='triangle'):
         """
-        Routine to run wave pattern and start calculation threads for each crystal
-        :param stages: INT - number of stages in the wave pattern
+        Routine to run wave pattern, queueing each stage's crystals on the animation engine
+        :param stages: LIST - crystal slots for each stage in the wave pattern
         :param timer: FLOAT - time to wait between running each stage
         :param pulse_timer: FLOAT - time to wait between each calculation step for colours
         :param pulses: INT - number of times for the crystals to pulsate to max brightness
         :param cracked: BOOLEAN - running cracked wave sequence or not
         :param cracked_colour: STRING - Cracked crystal colour (the colour to run calculations for when cracked pattern)
-        :return: None
+        :param colour: STRING - Colour to pulse every crystal (None uses each crystal's own colour)
+        :param curve: STRING - Pulse shape, one of Engine.PULSE_CURVES
+        :return: FLOAT - Time in seconds until the wave has finished
         """
-        self.kill = 1
         self.block = 1
-        time.sleep(0.1)
-        self.kill = 0
+        self.engine.cancel(tag='sequence')
 
         total_stages = len(stages)-1
         stage_no = 0
 
         for stage in stages:
-            if self.button:
-                break
-            for name in self.crystals.keys():
-                if self.button:
-                    break
-                if self.crystals[name].pos in stage:
-                    if cracked:
-                        thread = Thread(target=self.__cracked_wave_threads__,
-                                        args=(name, 0, cracked_colour, total_stages, stage_no))
-                        thread.start()
-                    else:
-                        thread = Thread(target=self.__wave_threads__, args=(name, 0, pulses, pulse_timer))
-                        thread.start()
-            time.sleep(timer)
+            for slot in stage:
+                if cracked:
+                    self.__corrupt__(int(slot), cracked_colour, total_stages, stage_no, delay=stage_no * timer)
+                else:
+                    self.__pulse__(int(slot), pulses, pulse_timer, delay=stage_no * timer, colour=colour, curve=curve)
             stage_no += 1
-        time.sleep(10)
-        self.block = 0
-        self.sequence = 0
+
+        duration = (len(stages) * timer) + 10
+        self.engine.call_later(duration, self.__sequence_end__, tag='sequence')
+        return duration
+
+    def __run_pattern__(self, routine):
+        """
+        Routine to run a pattern from the Patterns table - picks one of its origins (or a random order of crystals),
+        then runs the stage plan once for each repeat as a single wave
+        :param routine: STRING - Pattern's sequence routine name
+        :return: None
+        """
+        if not self.sequence:
+            self.sequence = 1
+            pattern, plans = self.patterns[routine]
+            plan = random.choice(plans)
+
+            stages = []
+            for _ in range(pattern.repeat):
+                if plan is None:
+                    lit = [crystal.slot for crystal in self.slots if crystal.pixel > -1]
+                    stages.extend([slot] for slot in random.sample(lit, len(lit)))
+                else:
+                    stages.extend(plan)
+
+            duration = self.__run_wave__(stages, timer=pattern.stage_interval, pulse_timer=pattern.pulse_timer,
+                                         colour=pattern.colour or None, curve=pattern.curve)
+            self.target_time = self.__next_sequence_time__(pattern.stage_interval + duration)
+
+    def __run_chain__(self, stages, timer=1, pulse_timer=0.01):
+        """
+        Routine to run chain wave pattern, queueing a single pulse for each stage's crystals on the animation engine
+        :param stages: LIST - crystal slots for each stage in the chain
+        :param timer: FLOAT - time to wait between running each stage
+        :param pulse_timer: FLOAT - time to wait between each calculation step for colours
+        :return: FLOAT - Time in seconds until the last stage has started
+        """
+        self.block = 1
+        self.engine.cancel(tag='sequence')
+
+        for stage_no, stage in enumerate(stages):
+            for slot in stage:
+                self.__pulse__(int(slot), 1, pulse_timer, delay=stage_no * timer)
+
+        duration = len(stages) * timer
+        self.engine.call_later(duration, self.__sequence_end__, tag='sequence')
+        return duration
+
+
+class MainWindow(Display, tk.Tk):
+    """
+    Class for main program & GUI window
+    """
+
+    def __init__(self, *args, output='neopixel', database='Crystals.db', metrics_file='metrics.prom',
+                 targets=('127.0.0.1',), **kwargs):
+        """
+        Routine to initialise main program class
+        :param args:
+        :param output: STRING - Pixel output to use, one of Output.DRIVERS
+        :param database: STRING - Path to the SQLite database file
+        :param metrics_file: STRING - Path to the rotating file for periodic metrics snapshots
+        :param targets: LIST - 'host' or 'host:port' of each receiver for the network outputs
+        :param kwargs:
+        """
+        tk.Tk.__init__(self, *args, **kwargs)
+
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Setup GUI Window
+        w, h = self.winfo_screenwidth(), self.winfo_screenheight()
+        self.geometry("%dx%d+0+0" % (w, h))
+        self.config(bg='black')
+        self.wm_attributes('-fullscreen', 'true')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.__setup_screen__()
+
+        self.skipped_updates = RateCounter()
+
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Setup crystals, neo pixels & sequencing
+        Display.__init__(self, output, database, metrics_file, targets)
+
+    def __setup_screen__(self):
+        """
+        Routine to create the frame the crystal buttons are gridded into
+        :return: None
+        """
+        self.frame = tk.Frame(self, bg='black')
+        self.frame.grid(row=0, column=0, sticky="news")
+
+        self.grid = tk.Frame(self.frame, bg='black')
+        self.grid.grid(sticky="news", column=0, row=7, columnspan=2)
+
+        self.frame.rowconfigure(7, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+
+    def __place_crystal__(self, crystal):
+        crystal.button.grid(row=crystal.row, column=crystal.column, padx=5, pady=5, sticky='news')
+
+    def __remove_crystal__(self, crystal):
+        crystal.button.destroy()
+
+    def __layout_crystals__(self):
+        # Clear the weights left by any previous layout, then share the space between the rows & columns in use
+        columns, rows = self.frame.grid_size()
+        if columns:
+            self.frame.columnconfigure(tuple(range(columns)), weight=0)
+        if rows:
+            self.frame.rowconfigure(tuple(range(rows)), weight=0)
+        self.frame.columnconfigure(tuple(range(self.max_cols + 1)), weight=1)
+        self.frame.rowconfigure(tuple(range(self.max_rows + 1)), weight=1)
+
+    def __draw_crystals__(self):
+        # Only redraw buttons whose colours have changed since they were last drawn
+        skipped = 0
+        if self.settings.illuminate_buttons or self.button:
+            store = self.store
+            shown = store.shown
+            changed = np.flatnonzero(shown != store.drawn)
+            skipped = store.count - len(changed)
+
+            for slot, entry in zip(changed.tolist(), shown[changed].tolist()):
+                # Try statement to update button & text colours - hex codes come straight from the ramp table
+                try:
+                    self.__paint_crystal__(self.slots[slot], store.ramps.bg_hex[entry], store.ramps.text_hex[entry])
+                    store.drawn[slot] = entry
+
+                # Open exception clause to prevent program from crashing - occasional error for colours
+                except Exception as e:
+                    self.__error__('button_draw', e)
+
+        if self.skipped_updates.add(skipped):
+            logging.debug("Skipped %.0f unchanged button updates per second", self.skipped_updates.rate)
+
+    def __paint_crystal__(self, crystal, bg_hex, text_hex):
+        """
+        Routine to set a crystal's background & text colours on screen
+        :param crystal: OBJ - Crystal
+        :param bg_hex: STRING - Background colour hex code
+        :param text_hex: STRING - Text colour hex code
+        :return: None
+        """
+        crystal.button.configure(bg=bg_hex, activebackground=bg_hex, fg=text_hex, activeforeground=text_hex)
+
+    def __show_description__(self, char, text):
+        Popup(self, text, char)
+
+    def __refresh__(self):
+        self.update()
+
+
+class CanvasWindow(MainWindow):
+    """
+    Class for the GUI window drawn on a single canvas instead of a button per crystal - each crystal is a rectangle
+    & a text item, laid out in the same Max Buttons grid. Presses are found from the grid cell touched, and only the
+    items whose colours change are reconfigured, so the grid scales to hundreds of crystals
+    """
+
+    padding = 5         # gap around each crystal, matching the button grid's padx & pady
+
+    def __setup_screen__(self):
+        """
+        Routine to create the canvas the crystals are drawn on
+        :return: None
+        """
+        self.items = {}             # canvas (rectangle, text) items for each crystal
+        self.item_text = {}         # text last drawn for each crystal
+        self.cells = {}             # crystal in each (row, column) grid cell
+        self.cell_size = (1.0, 1.0)
+        self.canvas = tk.Canvas(self, bg='black', highlightthickness=0,
+                                width=self.winfo_screenwidth(), height=self.winfo_screenheight())
+        self.canvas.grid(row=0, column=0, sticky="news")
+        self.canvas.bind('<ButtonPress-1>', self.__canvas_press__)
+        self.canvas.bind('<Configure>', lambda event: self.__layout_crystals__())
+
+    def __place_crystal__(self, crystal):
+        # Items are created once per crystal, then moved into place by __layout_crystals__
+        if crystal not in self.items:
+            self.items[crystal] = (self.canvas.create_rectangle(0, 0, 0, 0, fill='black', width=0),
+                                   self.canvas.create_text(0, 0, fill='white', justify=tk.CENTER))
+
+    def __remove_crystal__(self, crystal):
+        for item in self.items.pop(crystal, ()):
+            self.canvas.delete(item)
+        self.item_text.pop(crystal, None)
+
+    def __layout_crystals__(self):
+        # Share the canvas between the rows & columns in use, like the weighted button grid
+        width = max(self.canvas.winfo_width(), 1) if self.canvas.winfo_ismapped() else int(self.canvas['width'])
+        height = max(self.canvas.winfo_height(), 1) if self.canvas.winfo_ismapped() else int(self.canvas['height'])
+        cell_width = width / (self.max_cols + 1)
+        cell_height = height / (self.max_rows + 1)
+        self.cell_size = (cell_width, cell_height)
+        self.cells = {}
+
+        for crystal in self.slots:
+            self.cells[(crystal.row, crystal.column)] = crystal
+            rectangle, text = self.items[crystal]
+            left = crystal.column * cell_width
+            top = crystal.row * cell_height
+            self.canvas.coords(rectangle, left + self.padding, top + self.padding,
+                               left + cell_width - self.padding, top + cell_height - self.padding)
+            self.canvas.coords(text, left + cell_width / 2, top + cell_height / 2)
+            if self.item_text.get(crystal) != crystal.text:
+                # Names are split over lines with carriage returns for the buttons, the canvas needs new lines
+                self.canvas.itemconfigure(text, text=crystal.text.replace(chr(13), "\n"))
+                self.item_text[crystal] = crystal.text
+
+    def __paint_crystal__(self, crystal, bg_hex, text_hex):
+        rectangle, text = self.items[crystal]
+        self.canvas.itemconfigure(rectangle, fill=bg_hex)
+        self.canvas.itemconfigure(text, fill=text_hex)
+
+    def __canvas_press__(self, event):
+        """
+        Routine for a press on the canvas - the crystal is found from the grid cell under the press
+        :param event: OBJ - Tk button press event
+        :return: None
+        """
+        cell_width, cell_height = self.cell_size
+        crystal = self.cells.get((int(event.y // cell_height), int(event.x // cell_width)))
+        if crystal is not None:
+            self.__button_press__(crystal.key, crystal.descr)
 
 
 if __name__ == '__main__':
-    root = MainWindow()
-    root.mainloop_()
+    parser = argparse.ArgumentParser(description="Kyber crystal display")
+    parser.add_argument('--headless', action='store_true',
+                        help="run the sequences & neo pixels with no GUI window")
+    parser.add_argument('--output', choices=sorted(DRIVERS), default='neopixel' if os.name != 'nt' else 'fake',
+                        help="pixel output - 'fake' records frames in memory instead of driving the neo pixels, "
+                             "'e131' & 'artnet' stream them over UDP to network pixel controllers or other displays")
+    parser.add_argument('--target', action='append', metavar='HOST[:PORT]',
+                        help="receiver for the e131 & artnet outputs, repeat to send to several (default 127.0.0.1)")
+    parser.add_argument('--db', default='Crystals.db', help="path to the crystals database")
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--metrics-file', default='metrics.prom',
+                        help="rotating file for metrics snapshots, written when the Metrics Dump Interval is set")
+    parser.add_argument('--record', nargs=2, metavar=('ROUTINE', 'FILE'),
+                        help="render a sequence routine offline into a frame recording, then exit")
+    parser.add_argument('--replay', metavar='FILE', help="loop a frame recording instead of running the sequences")
+    parser.add_argument('--prebake', action='store_true',
+                        help="bake every enabled sequence into frame recordings at start up, using every CPU core, "
+                             "and play those instead of working the sequences out live")
+    parser.add_argument('--prebake-variants', type=int, default=4,
+                        help="number of versions to bake of each random sequence")
+    parser.add_argument('--bake-cache', default='bake_cache', help="folder to cache baked recordings in")
+    parser.add_argument('--renderer', choices=('buttons', 'canvas'), default='buttons',
+                        help="draw each crystal as its own button, or the whole grid on one canvas (faster for large "
+                             "grids)")
+    parser.add_argument('--asyncio', action='store_true',
+                        help="run the GUI, neo pixels, button presses & sequences as tasks on an asyncio event loop")
+    arguments = parser.parse_args()
+
+    # Bake before the display is created, so the pool processes are not forked from a running GUI
+    baked = None
+    if arguments.prebake and not arguments.record:
+        baked = prebake(arguments.db, arguments.bake_cache, arguments.prebake_variants)
+
+    if arguments.headless or arguments.record:
+        root = Display(output='fake' if arguments.record else arguments.output, database=arguments.db,
+                       metrics_file=arguments.metrics_file, targets=arguments.target or ['127.0.0.1'])
+    else:
+        window = CanvasWindow if arguments.renderer == 'canvas' else MainWindow
+        root = window(output=arguments.output, database=arguments.db, metrics_file=arguments.metrics_file,
+                      targets=arguments.target or ['127.0.0.1'])
+
+    if arguments.record:
+        root.record_sequence(*arguments.record)
+        root.stop()
+    else:
+        if baked:
+            root.use_baked(baked)
+        if arguments.replay:
+            root.play_recording(arguments.replay)
+        if arguments.asyncio:
+            root.run_async(arguments.duration)
+        else:
+            root.mainloop_(arguments.duration)
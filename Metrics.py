@@ -0,0 +1,340 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import time
+import threading
+import logging
+import logging.handlers
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Default histogram buckets in seconds - frame times at 60 FPS sit around 1-17 ms
+FRAME_BUCKETS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.0167, 0.033, 0.05, 0.1, 0.25)
+SEQUENCE_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value):
+    """
+    Routine to escape a label value for the Prometheus text format
+    :param value: STRING - Label value
+    :return: STRING - Escaped label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    """
+    Routine to format a set of labels for a sample line
+    :param names: TUPLE - Label names
+    :param values: TUPLE - Label values, in the same order as the names
+    :param extra: TUPLE - Extra (name, value) pairs, e.g. the histogram 'le' label
+    :return: STRING - Labels in braces (empty string if there are none)
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    """
+    Routine to format a sample value
+    :param value: FLOAT - Sample value
+    :return: STRING - Value as Prometheus expects it
+    """
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class for a named metric, with one value per set of label values
+    """
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        """
+        Routine to initialise the metric
+        :param name: STRING - Metric name
+        :param help_text: STRING - Description shown in the HELP line
+        :param labels: TUPLE - Label names
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def lines(self):
+        """
+        Routine to build the sample lines for the metric
+        :return: LIST - Lines of Prometheus text
+        """
+        with self.lock:
+            return ["%s%s %s" % (self.name, _format_labels(self.labels, key), _format_value(value))
+                    for key, value in sorted(self.values.items())]
+
+    def render(self):
+        """
+        Routine to build the HELP, TYPE & sample lines for the metric
+        :return: STRING - Prometheus text
+        """
+        return "\n".join(["# HELP %s %s" % (self.name, self.help_text),
+                          "# TYPE %s %s" % (self.name, self.metric_type)] + self.lines())
+
+
+class Counter(Metric):
+    """
+    Class for a count that only goes up
+    """
+
+    metric_type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        """
+        Routine to add to the count
+        :param label_values: STRING - Value for each label
+        :param amount: INT - Amount to add
+        :return: None
+        """
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        """
+        Routine to read the count
+        :param label_values: STRING - Value for each label
+        :return: INT - Current count
+        """
+        with self.lock:
+            return self.values.get(label_values, 0)
+
+
+class Gauge(Metric):
+    """
+    Class for a value that can go up & down. Either set directly, or read from a function each time it is collected
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        """
+        Routine to initialise the gauge
+        :param name: STRING - Metric name
+        :param help_text: STRING - Description shown in the HELP line
+        :param labels: TUPLE - Label names
+        :param function: FUNCTION - Called with no arguments to read the value (gauges without labels only)
+        """
+        Metric.__init__(self, name, help_text, labels)
+        self.function = function
+
+    def set(self, value, *label_values):
+        """
+        Routine to set the value
+        :param value: FLOAT - New value
+        :param label_values: STRING - Value for each label
+        :return: None
+        """
+        with self.lock:
+            self.values[label_values] = value
+
+    def lines(self):
+        if self.function is not None:
+            self.set(self.function())
+        return Metric.lines(self)
+
+
+class Histogram(Metric):
+    """
+    Class for counting observations into buckets, e.g. frame times
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=FRAME_BUCKETS):
+        """
+        Routine to initialise the histogram
+        :param name: STRING - Metric name
+        :param help_text: STRING - Description shown in the HELP line
+        :param labels: TUPLE - Label names
+        :param buckets: TUPLE - Upper bound of each bucket, in increasing order (+Inf is added)
+        """
+        Metric.__init__(self, name, help_text, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, *label_values):
+        """
+        Routine to record an observation
+        :param value: FLOAT - Observed value
+        :param label_values: STRING - Value for each label
+        :return: None
+        """
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][index] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    def lines(self):
+        lines = []
+        with self.lock:
+            for key, (buckets, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, buckets):
+                    cumulative += bucket
+                    lines.append("%s_bucket%s %d" % (self.name, _format_labels(self.labels, key,
+                                                                                 [('le', _format_value(bound))]),
+                                                      cumulative))
+                lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labels, key), repr(total)))
+                lines.append("%s_count%s %d" % (self.name, _format_labels(self.labels, key), count))
+        return lines
+
+
+class Registry:
+    """
+    Class holding a set of metrics, rendered together in the Prometheus text format
+    """
+
+    def __init__(self):
+        """
+        Routine to initialise an empty registry
+        """
+        self.metrics = []
+
+    def add(self, metric):
+        """
+        Routine to add a metric to the registry
+        :param metric: OBJ - Metric
+        :return: OBJ - The metric
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        """
+        Routine to add a new counter, see Counter
+        :return: OBJ - The counter
+        """
+        return self.add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), function=None):
+        """
+        Routine to add a new gauge, see Gauge
+        :return: OBJ - The gauge
+        """
+        return self.add(Gauge(name, help_text, labels, function))
+
+    def histogram(self, name, help_text, labels=(), buckets=FRAME_BUCKETS):
+        """
+        Routine to add a new histogram, see Histogram
+        :return: OBJ - The histogram
+        """
+        return self.add(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """
+        Routine to build the Prometheus text for every metric
+        :return: STRING - Prometheus text
+        """
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class MetricsServer:
+    """
+    Class serving a registry over HTTP at /metrics. Only listens on localhost
+    """
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        """
+        Routine to start the server on its own thread
+        :param registry: OBJ - Registry to serve
+        :param port: INT - TCP port to listen on
+        :param host: STRING - Address to listen on
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        """
+        Port the server is listening on
+        """
+        return self.server.server_address[1]
+
+    def close(self):
+        """
+        Routine to stop the server
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsDump:
+    """
+    Class writing a snapshot of a registry to a rotating file at a fixed interval
+    """
+
+    def __init__(self, registry, path, interval, max_bytes=1000000, backups=5):
+        """
+        Routine to start the dump thread
+        :param registry: OBJ - Registry to dump
+        :param path: STRING - File to write to (rotated to path.1, path.2... once it is over max_bytes)
+        :param interval: FLOAT - Time in seconds between snapshots
+        :param max_bytes: INT - File size to rotate at
+        :param backups: INT - Number of rotated files to keep
+        """
+        self.registry = registry
+        self.interval = interval
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__loop__, daemon=True)
+        self.thread.start()
+
+    def __loop__(self):
+        """
+        Routine for the dump thread
+        :return: None
+        """
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """
+        Routine to write one snapshot, headed with the time it was taken
+        :return: None
+        """
+        text = "# snapshot %s\n%s" % (time.strftime('%Y-%m-%dT%H:%M:%S'), self.registry.render())
+        self.handler.emit(logging.makeLogRecord({'msg': text, 'levelno': logging.INFO, 'levelname': 'INFO'}))
+
+    def close(self):
+        """
+        Routine to stop the dump thread & close the file
+        :return: None
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.handler.close()
@@ -0,0 +1,476 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import time
+import uuid
+import socket
+import struct
+import argparse
+import threading
+import numpy as np
+
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Pixel streaming protocols - E1.31 (sACN) & Art-Net both carry up to 512 channels per universe, which is 128 RGBW
+# neo pixels. Each frame is sent as one packet per universe, optionally followed by a sync packet telling every
+# receiver to show the frame at once
+PROTOCOLS = ('e131', 'artnet')
+PORTS = {'e131': 5568, 'artnet': 6454}
+UNIVERSE_CHANNELS = 512
+SOURCE_NAME = "Kyber Crystal Display"
+
+E131_IDENTIFIER = b'ASC-E1.17\x00\x00\x00'
+E131_ROOT_DATA = 0x00000004             # root layer vector for a data packet
+E131_ROOT_EXTENDED = 0x00000008         # root layer vector for a sync packet
+E131_FRAME_DATA = 0x00000002            # framing layer vector for a data packet
+E131_FRAME_SYNC = 0x00000001            # framing layer vector for a sync packet
+E131_TERMINATED = 0x40                  # options bit - the source has stopped sending this universe
+E131_HEADER = struct.Struct('!HH12sHI16sHI64sBHBBHHBBHHH')
+E131_SYNC = struct.Struct('!HH12sHI16sHIBHH')
+
+ARTNET_ID = b'Art-Net\x00'
+ARTNET_DMX = 0x5000
+ARTNET_SYNC = 0x5200
+ARTNET_VERSION = 14
+ARTNET_HEADER = struct.Struct('<8sH')
+ARTNET_DMX_HEADER = struct.Struct('!HBBHH')
+ARTNET_SYNC_BODY = struct.Struct('!HBB')
+
+
+def e131_data_packet(cid, universe, sequence, data, sync_universe=0, options=0, priority=100):
+    """
+    Routine to build an E1.31 data packet for one universe
+    :param cid: BYTES - 16 byte component ID of the sender
+    :param universe: INT - Universe number (1-63999)
+    :param sequence: INT - Sequence number (0-255)
+    :param data: BYTES - Channel values, up to 512
+    :param sync_universe: INT - Universe the sync packets are sent on (0 shows the data as soon as it arrives)
+    :param options: INT - Options flags, e.g. E131_TERMINATED
+    :param priority: INT - Source priority (0-200)
+    :return: BYTES - Packet
+    """
+    length = E131_HEADER.size + 1 + len(data)       # the header is followed by the DMX start code
+    return E131_HEADER.pack(0x0010, 0, E131_IDENTIFIER, 0x7000 | (length - 16), E131_ROOT_DATA, cid,
+                            0x7000 | (length - 38), E131_FRAME_DATA, SOURCE_NAME.encode('utf-8'), priority,
+                            sync_universe, sequence, options, universe,
+                            0x7000 | (length - 115), 0x02, 0xa1, 0, 1, len(data) + 1) + b'\x00' + bytes(data)
+
+
+def e131_sync_packet(cid, sync_universe, sequence):
+    """
+    Routine to build an E1.31 universe sync packet - receivers holding data for the sync universe show it now
+    :param cid: BYTES - 16 byte component ID of the sender
+    :param sync_universe: INT - Sync universe number
+    :param sequence: INT - Sequence number (0-255)
+    :return: BYTES - Packet
+    """
+    length = E131_SYNC.size
+    return E131_SYNC.pack(0x0010, 0, E131_IDENTIFIER, 0x7000 | (length - 16), E131_ROOT_EXTENDED, cid,
+                          0x7000 | (length - 38), E131_FRAME_SYNC, sequence, sync_universe, 0)
+
+
+def artnet_dmx_packet(universe, sequence, data):
+    """
+    Routine to build an Art-Net ArtDmx packet for one universe
+    :param universe: INT - Port address (0-32767)
+    :param sequence: INT - Sequence number (1-255, 0 turns sequence checks off)
+    :param data: BYTES - Channel values, up to 512 (padded to an even number)
+    :return: BYTES - Packet
+    """
+    data = bytes(data)
+    if len(data) % 2:
+        data += b'\x00'
+    return ARTNET_HEADER.pack(ARTNET_ID, ARTNET_DMX) + \
+        ARTNET_DMX_HEADER.pack(ARTNET_VERSION, sequence, 0, ((universe & 0xff) << 8) | (universe >> 8 & 0x7f),
+                               len(data)) + data
+
+
+def artnet_sync_packet():
+    """
+    Routine to build an Art-Net ArtSync packet - receivers show the ArtDmx data they are holding now
+    :return: BYTES - Packet
+    """
+    return ARTNET_HEADER.pack(ARTNET_ID, ARTNET_SYNC) + ARTNET_SYNC_BODY.pack(ARTNET_VERSION, 0, 0)
+
+
+def _check_pdu(packet, flags_length, start, name):
+    """
+    Routine to check an E1.31 PDU's flags & length field - the length runs from the start of the PDU to the end of
+    the packet
+    :param packet: BYTES - Packet as received
+    :param flags_length: INT - PDU flags & length field
+    :param start: INT - Offset of the PDU in the packet
+    :param name: STRING - PDU name, for the error
+    :return: None
+    """
+    if flags_length & 0xf000 != 0x7000 or flags_length & 0x0fff != len(packet) - start:
+        raise ValueError("E1.31 %s layer length %d does not match the %d byte packet" % (name, flags_length & 0x0fff,
+                                                                                        len(packet)))
+
+
+def parse_packet(packet):
+    """
+    Routine to read an E1.31 or Art-Net packet. The length fields of each layer are checked against the packet size
+    :param packet: BYTES - Packet as received
+    :return: TUPLE - ('data', universe, sequence, channel values) or ('sync', sync universe, sequence, None), None if
+    the packet is not one of these
+    """
+    if packet[4:16] == E131_IDENTIFIER and len(packet) >= E131_SYNC.size:
+        vector = struct.unpack_from('!I', packet, 18)[0]
+        if vector == E131_ROOT_DATA and len(packet) > E131_HEADER.size:
+            fields = E131_HEADER.unpack_from(packet)
+            _check_pdu(packet, fields[3], 16, 'root')
+            _check_pdu(packet, fields[6], 38, 'framing')
+            _check_pdu(packet, fields[14], 115, 'DMP')
+            sequence, options, universe, count = fields[11], fields[12], fields[13], fields[19]
+            if count != len(packet) - E131_HEADER.size:
+                raise ValueError("E1.31 property count %d does not match the %d byte packet" % (count, len(packet)))
+            if options & E131_TERMINATED:
+                return None
+            return 'data', universe, sequence, packet[E131_HEADER.size + 1:]
+        if vector == E131_ROOT_EXTENDED:
+            fields = E131_SYNC.unpack_from(packet)
+            _check_pdu(packet, fields[3], 16, 'root')
+            _check_pdu(packet, fields[6], 38, 'framing')
+            return 'sync', fields[9], fields[8], None
+        return None
+
+    if packet[:8] == ARTNET_ID and len(packet) >= ARTNET_HEADER.size:
+        opcode = ARTNET_HEADER.unpack_from(packet)[1]
+        if opcode == ARTNET_DMX and len(packet) >= ARTNET_HEADER.size + ARTNET_DMX_HEADER.size:
+            _, sequence, _, address, length = ARTNET_DMX_HEADER.unpack_from(packet, ARTNET_HEADER.size)
+            universe = (address >> 8) | ((address & 0x7f) << 8)
+            start = ARTNET_HEADER.size + ARTNET_DMX_HEADER.size
+            if length != len(packet) - start:
+                raise ValueError("ArtDmx length %d does not match the %d byte packet" % (length, len(packet)))
+            return 'data', universe, sequence, packet[start:]
+        if opcode == ARTNET_SYNC:
+            return 'sync', 0, None, None
+    return None
+
+
+def parse_target(target, protocol):
+    """
+    Routine to turn a 'host' or 'host:port' string into a socket address
+    :param target: STRING - Receiver address
+    :param protocol: STRING - Protocol, one of PROTOCOLS (sets the default port)
+    :return: TUPLE - (host, port)
+    """
+    host, _, port = target.rpartition(':') if target.count(':') == 1 else (target, '', '')
+    return host, int(port) if port else PORTS[protocol]
+
+
+def new_cid():
+    """
+    Routine to make a component ID for an E1.31 sender
+    :return: BYTES - 16 byte ID
+    """
+    return uuid.uuid4().bytes
+
+
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Receiver stub for testing network outputs
+class PixelReceiver:
+    """
+    Class for a stub pixel receiver - listens for E1.31 or Art-Net packets & puts the frames back together from their
+    universes, counting packets & frames. Packets with length fields that don't match their size are counted as
+    rejected & ignored. Given the sender's send times it also measures the latency from each frame being sent to it
+    arriving complete (at its sync packet, or at each data packet when sync is off)
+    """
+
+    def __init__(self, port=0, host='127.0.0.1', sent=None):
+        """
+        Routine to start listening on its own thread
+        :param port: INT - UDP port to listen on (0 picks a free port)
+        :param host: STRING - Address to listen on
+        :param sent: DICT - Send time of each sequence number, e.g. NetworkDriver.sent (None skips latency)
+        """
+        self.sent = sent
+        self.universes = {}
+        self.packets = 0
+        self.rejected = 0
+        self.frames = 0
+        self.syncs = 0
+        self.bytes = 0
+        self.latencies = []
+        self.last_sequence = None
+        self.lock = threading.Lock()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.2)
+        self.stopped = threading.Event()
+        self.start_time = time.monotonic()
+        self.thread = threading.Thread(target=self.__loop__, name='pixel receiver', daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        """
+        Port the receiver is listening on
+        """
+        return self.socket.getsockname()[1]
+
+    def __loop__(self):
+        """
+        Routine for the receiver thread
+        :return: None
+        """
+        while not self.stopped.is_set():
+            try:
+                packet = self.socket.recv(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.__handle__(packet, time.monotonic())
+
+    def __handle__(self, packet, now):
+        """
+        Routine to take in one packet
+        :param packet: BYTES - Packet as received
+        :param now: FLOAT - Time the packet arrived
+        :return: None
+        """
+        # Try statement to read the packet - a malformed one is counted & dropped, as a strict receiver would
+        try:
+            parsed = parse_packet(packet)
+        except (ValueError, struct.error):
+            with self.lock:
+                self.rejected += 1
+            return
+        if parsed is None:
+            return
+        kind, universe, sequence, data = parsed
+        with self.lock:
+            self.packets += 1
+            self.bytes += len(packet)
+            if kind == 'data':
+                self.universes[universe] = bytes(data)
+                if sequence != self.last_sequence:
+                    self.last_sequence = sequence
+                    self.frames += 1
+                # Once sync packets are seen a frame only counts as arrived at its sync
+                send_time = self.sent.get(sequence) if self.sent is not None and not self.syncs else None
+            else:
+                self.syncs += 1
+                sequence = self.last_sequence if sequence is None else sequence
+                send_time = self.sent.get(sequence) if self.sent is not None else None
+            if send_time is not None:
+                self.latencies.append(now - send_time)
+
+    def frame(self, num_pixels, first_universe=1):
+        """
+        Routine to put the latest frame back together from its universes
+        :param num_pixels: INT - Number of neo pixels in the frame
+        :param first_universe: INT - Universe holding the first pixel
+        :return: ARRAY - (pixels, 4) colour values (pixels not received are off)
+        """
+        channels = bytearray(num_pixels * 4)
+        with self.lock:
+            for universe, data in self.universes.items():
+                start = (universe - first_universe) * UNIVERSE_CHANNELS
+                if 0 <= start < len(channels):
+                    data = data[:len(channels) - start]
+                    channels[start:start + len(data)] = data
+        return np.frombuffer(bytes(channels), dtype=np.uint8).reshape(num_pixels, 4)
+
+    def stats(self):
+        """
+        Routine to summarise what has been received so far
+        :return: DICT - Packet & frame counts & rates per second, and latency in ms (None if not measured)
+        """
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start_time, 1e-9)
+            latencies = np.array(self.latencies) * 1000
+            return {'packets': self.packets, 'rejected': self.rejected, 'frames': self.frames, 'syncs': self.syncs,
+                    'bytes': self.bytes,
+                    'packet_rate': self.packets / elapsed, 'frame_rate': self.frames / elapsed,
+                    'latency_mean': float(latencies.mean()) if len(latencies) else None,
+                    'latency_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                    'latency_max': float(latencies.max()) if len(latencies) else None}
+
+    def close(self):
+        """
+        Routine to stop listening
+        :return: None
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.socket.close()
+
+
+def _expect(condition, message):
+    """
+    Routine to fail a packet check
+    :param condition: BOOLEAN - Check passed
+    :param message: STRING - What was expected
+    :return: None
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+def _expect_rejected(packet, message):
+    """
+    Routine to check parse_packet refuses a malformed packet
+    :param packet: BYTES - Packet with a bad length
+    :param message: STRING - What is wrong with it
+    :return: None
+    """
+    try:
+        parse_packet(packet)
+    except ValueError:
+        return
+    raise AssertionError("%s was not rejected" % message)
+
+
+def check_packets():
+    """
+    Routine to check the packet builders against the protocol layouts - every E1.31 & Art-Net packet is built, its
+    length fields checked for a full 512 channel universe & read back with parse_packet, then packets with a wrong
+    length are checked to be rejected
+    :return: INT - Number of checks passed, an AssertionError is raised on the first failure
+    """
+    checks = 0
+    cid = new_cid()
+    data = bytes(range(256)) * 2
+
+    packet = e131_data_packet(cid, 7, 42, data, sync_universe=9)
+    fields = E131_HEADER.unpack_from(packet)
+    for name, value, expected in (('packet size', len(packet), 638), ('root length', fields[3] & 0x0fff, 622),
+                                  ('framing length', fields[6] & 0x0fff, 600), ('DMP length', fields[14] & 0x0fff, 523),
+                                  ('property count', fields[19], 513)):
+        _expect(value == expected, "E1.31 %s is %d, expected %d" % (name, value, expected))
+        checks += 1
+    _expect(parse_packet(packet) == ('data', 7, 42, data), "E1.31 data packet did not read back")
+    checks += 1
+
+    sync = e131_sync_packet(cid, 9, 42)
+    fields = E131_SYNC.unpack_from(sync)
+    _expect((len(sync), fields[3] & 0x0fff, fields[6] & 0x0fff) == (49, 33, 11), "E1.31 sync lengths are wrong")
+    _expect(parse_packet(sync) == ('sync', 9, 42, None), "E1.31 sync packet did not read back")
+    checks += 2
+
+    for offset, name in ((16, 'root'), (38, 'framing'), (115, 'DMP'), (123, 'property count')):
+        bad = bytearray(packet)
+        struct.pack_into('!H', bad, offset, struct.unpack_from('!H', packet, offset)[0] - 1)
+        _expect_rejected(bytes(bad), "E1.31 packet with a short %s length" % name)
+        checks += 1
+    _expect_rejected(packet[:-1], "Truncated E1.31 packet")
+    _expect_rejected(sync + b'\x00', "E1.31 sync packet with a trailing byte")
+    checks += 2
+
+    packet = artnet_dmx_packet(0x1234, 42, data)
+    length = ARTNET_DMX_HEADER.unpack_from(packet, ARTNET_HEADER.size)[4]
+    _expect((len(packet), length) == (530, 512), "ArtDmx packet is %d bytes with length %d, expected 530 & 512" %
+            (len(packet), length))
+    _expect(parse_packet(packet) == ('data', 0x1234, 42, data), "ArtDmx packet did not read back")
+    _expect(parse_packet(artnet_sync_packet()) == ('sync', 0, None, None), "ArtSync packet did not read back")
+    checks += 3
+
+    _expect_rejected(packet[:-1], "Truncated ArtDmx packet")
+    bad = bytearray(packet)
+    struct.pack_into('!H', bad, ARTNET_HEADER.size + 6, 510)
+    _expect_rejected(bytes(bad), "ArtDmx packet with a short length")
+    checks += 2
+    return checks
+
+
+def loopback_test(protocol='e131', num_pixels=300, fps=60.0, duration=5.0, delta=False, sync_universe=0, universe=1):
+    """
+    Routine to test a network output entirely on localhost - a receiver stub is started, then a pixel chasing along
+    the chain is sent through the output at the frame rate for the duration
+    :param protocol: STRING - Network output to test, one of PROTOCOLS
+    :param num_pixels: INT - Number of neo pixels in the frame
+    :param fps: FLOAT - Frames per second to send at
+    :param duration: FLOAT - Time in seconds to send for
+    :param delta: BOOLEAN - Only send the universes that have changed
+    :param sync_universe: INT - Follow each frame with a sync packet on this universe (0 = off)
+    :param universe: INT - Universe holding the first pixel
+    :return: DICT - Receiver stats (see PixelReceiver.stats), plus the frames sent & whether the last frame arrived
+    intact with no packets rejected
+    """
+    from Engine import FrameClock
+    from Output import create_driver
+
+    receiver = PixelReceiver()
+    driver = create_driver(protocol, num_pixels, options={'targets': ['127.0.0.1:%d' % receiver.port],
+                                                          'universe': universe, 'delta': delta,
+                                                          'sync_universe': sync_universe})
+    receiver.sent = driver.sent
+    clock = FrameClock(fps)
+    frame = np.zeros((num_pixels, 4), dtype=np.uint8)
+    end_time = time.monotonic() + duration
+    step = 0
+    try:
+        while time.monotonic() < end_time:
+            clock.wait()
+            clock.tick()
+            frame[:] = 0
+            frame[step % num_pixels] = (255, 0, 0, 0)
+            driver.show(frame)
+            step += 1
+
+        time.sleep(0.2)
+        stats = receiver.stats()
+        stats['sent_frames'] = driver.writes
+        stats['intact'] = bool(np.array_equal(receiver.frame(num_pixels, universe), frame)) and not stats['rejected']
+    finally:
+        driver.close()
+        receiver.close()
+    return stats
+
+
+def _report(stats):
+    """
+    Routine to format receiver stats for the command line
+    :param stats: DICT - Receiver stats
+    :return: STRING - One line summary
+    """
+    line = "%d packets (%.0f/s), %d rejected, %d frames (%.1f/s), %d syncs" % (
+        stats['packets'], stats['packet_rate'], stats['rejected'], stats['frames'], stats['frame_rate'],
+        stats['syncs'])
+    if stats['latency_mean'] is not None:
+        line += ", latency mean %.2f ms, p99 %.2f ms, max %.2f ms" % (stats['latency_mean'], stats['latency_p99'],
+                                                                     stats['latency_max'])
+    return line
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="E1.31 / Art-Net receiver stub for testing the network pixel outputs")
+    parser.add_argument('--protocol', choices=PROTOCOLS, default='e131')
+    parser.add_argument('--listen', default='127.0.0.1', metavar='HOST[:PORT]',
+                        help="address to listen on (the port defaults to the protocol's port)")
+    parser.add_argument('--check', action='store_true',
+                        help="check the packet builders & parser against the protocol layouts, then exit")
+    parser.add_argument('--loopback', action='store_true',
+                        help="send a test show through the network output to a receiver on localhost, then report")
+    parser.add_argument('--pixels', type=int, default=300, help="number of pixels in the loopback test")
+    parser.add_argument('--fps', type=float, default=60.0, help="frame rate of the loopback test")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="seconds to listen for (default until stopped), or to run the loopback test for (5)")
+    parser.add_argument('--delta', action='store_true', help="only send changed universes in the loopback test")
+    parser.add_argument('--sync-universe', type=int, default=0,
+                        help="send sync packets on this universe in the loopback test (0 = off)")
+    arguments = parser.parse_args()
+
+    if arguments.check:
+        print("%d packet checks passed" % check_packets())
+    elif arguments.loopback:
+        result = loopback_test(arguments.protocol, arguments.pixels, arguments.fps, arguments.duration or 5.0,
+                               arguments.delta, arguments.sync_universe)
+        print(_report(result))
+        print("%d frames sent, last frame %s" % (result['sent_frames'], "intact" if result['intact'] else "DIFFERS"))
+    else:
+        host, port = parse_target(arguments.listen, arguments.protocol)
+        stub = PixelReceiver(port, host)
+        print("Listening for %s on %s:%d" % (arguments.protocol, host, stub.port))
+        stop_time = None if arguments.duration is None else time.monotonic() + arguments.duration
+        try:
+            while stop_time is None or time.monotonic() < stop_time:
+                time.sleep(1.0)
+                print(_report(stub.stats()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.close()
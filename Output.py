@@ -0,0 +1,689 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import os
+import time
+import socket
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Network import (UNIVERSE_CHANNELS, e131_data_packet, e131_sync_packet, artnet_dmx_packet, artnet_sync_packet,
+                     parse_target, new_cid, E131_TERMINATED)
+
+# Shared memory needs Python 3.8 or later - without it the pixel outputs always run in the display process
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class OutputDriver:
+    """
+    Base class for pixel outputs. Frames are double buffered - the next frame is built in the back buffer (red, green,
+    blue & white bytes for each neo pixel), then commit() only sends it out if it differs from the last frame sent and
+    the strip has had time to finish its last refresh
+    """
+
+    test_hold = 1.0
+    bit_rate = 800000           # neo pixel data rate, bits per second
+    bits_per_pixel = 32         # 8 bits each for red, green, blue & white
+    latch_time = 0.0003         # low time needed after a frame before the pixels latch the new colours
+
+    def __init__(self, num_pixels, pin=None, brightness=1.0, clock=time.monotonic):
+        """
+        Routine to initialise the output
+        :param num_pixels: INT - Number of neo pixels in the chain
+        :param pin: INT - GPIO pin the chain is connected to
+        :param brightness: FLOAT - Brightness scale for the chain (0-1)
+        :param clock: FUNCTION - Monotonic time source in seconds
+        """
+        self.num_pixels = num_pixels
+        self.pin = pin
+        self.brightness = brightness
+        self.clock = clock
+
+        self.front = bytearray(num_pixels * 4)      # last frame sent to the pixels
+        self.back = bytearray(num_pixels * 4)       # next frame, being built
+        self.min_interval = num_pixels * self.bits_per_pixel / self.bit_rate + self.latch_time
+        self.last_write = None
+
+        self.writes = 0             # frames sent to the pixels
+        self.unchanged = 0          # frames skipped as they matched the last frame sent
+        self.rate_limited = 0       # frames held back as the strip was still refreshing
+
+    @property
+    def buffer(self):
+        """
+        Back buffer as a writable (pixels, 4) array
+        """
+        return np.frombuffer(self.back, dtype=np.uint8).reshape(self.num_pixels, 4)
+
+    @property
+    def skipped(self):
+        """
+        Number of frames not sent to the pixels
+        """
+        return self.unchanged + self.rate_limited
+
+    def commit(self):
+        """
+        Routine to send the back buffer out to the pixels if it has changed, then swap the buffers. A changed frame
+        that arrives before the strip can refresh again is held back, and sent by a later commit
+        :return: BOOLEAN - Frame was sent
+        """
+        if self.back == self.front:
+            self.unchanged += 1
+            return False
+
+        now = self.clock()
+        if self.last_write is not None and now - self.last_write < self.min_interval:
+            self.rate_limited += 1
+            return False
+
+        self.write()
+        self.last_write = now
+        self.writes += 1
+        self.front, self.back = self.back, self.front
+        return True
+
+    def show(self, frame):
+        """
+        Routine to copy a whole frame into the back buffer & commit it
+        :param frame: ARRAY - uint8 colour values, one row per pixel
+        :return: BOOLEAN - Frame was sent
+        """
+        self.buffer[:] = frame
+        return self.commit()
+
+    def write(self):
+        """
+        Routine to send the back buffer out to the pixels. The front buffer still holds the last frame sent
+        :return: None
+        """
+        raise NotImplementedError
+
+    def sent_time(self, number):
+        """
+        Routine to find when a frame was sent out to the pixels. Frames are numbered by the write count & sent as they
+        are committed, so only the latest frame's time is kept
+        :param number: INT - Frame number
+        :return: FLOAT - Monotonic time the frame was sent (None if it has not been sent, or is no longer the latest)
+        """
+        return self.last_write if number == self.writes else None
+
+    def test(self):
+        """
+        Routine to flash the first pixel green, to show the chain is working
+        :return: None
+        """
+        frame = np.zeros((self.num_pixels, 4), dtype=np.uint8)
+        frame[0] = (0, 255, 0, 0)
+        self.show(frame)
+        time.sleep(max(self.test_hold, self.min_interval))
+        frame[0] = 0
+        self.show(frame)
+
+    def close(self):
+        """
+        Routine to release the output
+        :return: None
+        """
+
+
+class NeoPixelDriver(OutputDriver):
+    """
+    Class for a real neo pixel chain on the Raspberry Pi GPIO. Only pixels that differ from the last frame sent are
+    updated before the chain is written
+    """
+
+    def __init__(self, num_pixels, pin=None, brightness=1.0, clock=time.monotonic):
+        OutputDriver.__init__(self, num_pixels, pin, brightness, clock)
+
+        # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+        # Raspberry Pi specific imports - only needed once a real chain is used
+        import board
+        import neopixel
+
+        pins = {10: board.D10,
+                12: board.D12,
+                18: board.D18,
+                21: board.D21}
+
+        self.pixels = neopixel.NeoPixel(
+            pins[pin], num_pixels, brightness=brightness, auto_write=False, pixel_order=neopixel.GRBW
+        )
+
+    def write(self):
+        back = self.buffer
+        front = np.frombuffer(self.front, dtype=np.uint8).reshape(self.num_pixels, 4)
+        changed = np.flatnonzero(np.any(back != front, axis=1))
+        for pixel, colour in zip(changed.tolist(), back[changed].tolist()):
+            self.pixels[pixel] = tuple(colour)
+        self.pixels.write()
+
+    def close(self):
+        self.pixels.deinit()
+
+
+class FakeDriver(OutputDriver):
+    """
+    Class for an in memory pixel chain, for running without neo pixel hardware. Every frame sent is recorded as bytes
+    with the time it was sent, and the time of every commit is kept so frame timing can be measured
+    """
+
+    test_hold = 0.0
+
+    def __init__(self, num_pixels, pin=None, brightness=1.0, clock=time.monotonic, history=None):
+        """
+        Routine to initialise the fake chain
+        :param num_pixels: INT - Number of neo pixels in the chain
+        :param pin: INT - GPIO pin (not used)
+        :param brightness: FLOAT - Brightness scale (recorded, not applied)
+        :param clock: FUNCTION - Monotonic time source in seconds
+        :param history: INT - Number of frames to keep (None keeps every frame)
+        """
+        OutputDriver.__init__(self, num_pixels, pin, brightness, clock)
+        self.frames = deque(maxlen=history)
+        self.times = deque(maxlen=history)
+        self.commit_times = deque(maxlen=history)
+
+    def commit(self):
+        self.commit_times.append(self.clock())
+        return OutputDriver.commit(self)
+
+    def write(self):
+        self.frames.append(bytes(self.back))
+        self.times.append(self.clock())
+
+    def frame(self, index=-1):
+        """
+        Routine to fetch a recorded frame
+        :param index: INT - Frame number (negative counts back from the latest frame)
+        :return: ARRAY - (pixels, 4) colour values
+        """
+        return np.frombuffer(self.frames[index], dtype=np.uint8).reshape(self.num_pixels, 4)
+
+
+class NetworkDriver(OutputDriver):
+    """
+    Base class for streaming the pixels over UDP to network pixel controllers or other displays. Each frame is split
+    into universes of 512 channels (128 neo pixels) and sent to every target. In delta mode only the universes that
+    changed are sent, with every universe sent again at least once a keep alive period so receivers don't time out.
+    With a sync universe set, each frame is followed by a sync packet so every receiver shows it at the same moment
+    """
+
+    protocol = None
+    keepalive = 1.0             # longest time between sends of each universe, receivers drop a source after 2.5s
+
+    def __init__(self, num_pixels, pin=None, brightness=1.0, clock=time.monotonic, targets=('127.0.0.1',), universe=1,
+                 delta=False, sync_universe=0):
+        """
+        Routine to open the output socket
+        :param num_pixels: INT - Number of neo pixels in the chain
+        :param pin: INT - Not used, there is no GPIO pin
+        :param brightness: FLOAT - Brightness scale for the chain (0-1)
+        :param clock: FUNCTION - Monotonic time source in seconds
+        :param targets: LIST - 'host' or 'host:port' for each receiver
+        :param universe: INT - Universe holding the first pixel, the rest follow on in order
+        :param delta: BOOLEAN - Only send the universes that have changed
+        :param sync_universe: INT - Follow each frame with a sync packet on this universe (0 = off)
+        """
+        OutputDriver.__init__(self, num_pixels, pin, brightness, clock)
+        self.min_interval = 0.0     # no strip to wait for, frames go out as fast as they are committed
+        self.targets = [parse_target(target, self.protocol) for target in targets]
+        self.universe = universe
+        self.universes = -(-num_pixels * 4 // UNIVERSE_CHANNELS)
+        self.delta = delta
+        self.sync_universe = sync_universe
+        self.sequence = 0
+        self.sent = {}              # send time of each sequence number, so a receiver can measure latency
+        self.last_full = None
+        self.packets = 0            # packets sent, to all targets
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def commit(self):
+        # An unchanged frame is still sent once a keep alive period, so the receivers keep showing it
+        if self.back == self.front and self.last_write is not None and \
+                self.clock() - self.last_write >= self.keepalive:
+            self.write()
+            self.last_write = self.clock()
+            self.writes += 1
+            return True
+        return OutputDriver.commit(self)
+
+    def write(self):
+        now = self.clock()
+        full = not self.delta or self.last_full is None or now - self.last_full >= self.keepalive
+        data = self.back
+        if self.brightness < 1.0:
+            data = (np.frombuffer(self.back, dtype=np.uint8) * self.brightness).astype(np.uint8).tobytes()
+
+        self.sequence = self.__next_sequence__()
+        self.sent[self.sequence] = now
+        for index in range(self.universes):
+            start = index * UNIVERSE_CHANNELS
+            end = start + UNIVERSE_CHANNELS
+            if full or self.back[start:end] != self.front[start:end]:
+                self.__send__(self.__data_packet__(self.universe + index, data[start:end]))
+        if self.sync_universe:
+            self.__send__(self.__sync_packet__())
+        if full:
+            self.last_full = now
+
+    def __send__(self, packet):
+        """
+        Routine to send a packet to every target
+        :param packet: BYTES - UDP payload
+        :return: None
+        """
+        for target in self.targets:
+            self.socket.sendto(packet, target)
+            self.packets += 1
+
+    def __next_sequence__(self):
+        """
+        Routine to step the sequence number for the next frame
+        :return: INT - Sequence number
+        """
+        raise NotImplementedError
+
+    def __data_packet__(self, universe, data):
+        """
+        Routine to build the packet carrying one universe of the current frame
+        :param universe: INT - Universe number
+        :param data: BYTES - Channel values, up to 512
+        :return: BYTES - UDP payload
+        """
+        raise NotImplementedError
+
+    def __sync_packet__(self):
+        """
+        Routine to build the packet telling the receivers to show the current frame
+        :return: BYTES - UDP payload
+        """
+        raise NotImplementedError
+
+    def close(self):
+        self.socket.close()
+
+
+class E131Driver(NetworkDriver):
+    """
+    Class for streaming the pixels as E1.31 (sACN). Data packets name the sync universe, so receivers hold each frame
+    until the sync packet arrives
+    """
+
+    protocol = 'e131'
+
+    def __init__(self, *args, **kwargs):
+        NetworkDriver.__init__(self, *args, **kwargs)
+        self.cid = new_cid()
+
+    def __next_sequence__(self):
+        return (self.sequence + 1) % 256
+
+    def __data_packet__(self, universe, data, options=0):
+        return e131_data_packet(self.cid, universe, self.sequence, data, self.sync_universe, options)
+
+    def __sync_packet__(self):
+        return e131_sync_packet(self.cid, self.sync_universe, self.sequence)
+
+    def close(self):
+        # Tell the receivers the stream has ended, so they stop waiting for it straight away
+        self.sequence = self.__next_sequence__()
+        for index in range(self.universes):
+            start = index * UNIVERSE_CHANNELS
+            self.__send__(self.__data_packet__(self.universe + index, self.front[start:start + UNIVERSE_CHANNELS],
+                                               E131_TERMINATED))
+        NetworkDriver.close(self)
+
+
+class ArtNetDriver(NetworkDriver):
+    """
+    Class for streaming the pixels as Art-Net. With a sync universe set each frame is followed by an ArtSync packet -
+    Art-Net has only one sync, so any non zero sync universe turns it on
+    """
+
+    protocol = 'artnet'
+
+    def __next_sequence__(self):
+        return self.sequence % 255 + 1          # 0 means sequencing is off in Art-Net
+
+    def __data_packet__(self, universe, data):
+        return artnet_dmx_packet(universe, self.sequence, data)
+
+    def __sync_packet__(self):
+        return artnet_sync_packet()
+
+
+class FrameRing:
+    """
+    Class for a ring of frame slots in shared memory, written by one process & read by another. Each slot carries its
+    frame number before & after the frame bytes, so a reader can spot a slot that was rewritten while it was copied.
+    The reader logs the number & time of each frame it sends out to the pixels, for the writer to look up
+    """
+
+    log_size = 64       # frames sent kept in the log, about a second at 60 FPS
+
+    def __init__(self, buffer, num_pixels, slots=4):
+        """
+        Routine to lay the ring out over a block of memory
+        :param buffer: OBJ - Memory to use, at least FrameRing.size(num_pixels, slots) bytes
+        :param num_pixels: INT - Number of neo pixels in each frame
+        :param slots: INT - Number of frames held
+        """
+        self.slots = slots
+        log = 16 + 8 * self.log_size
+        self.header = np.ndarray((2,), dtype=np.uint64, buffer=buffer)                    # latest number, sends
+        self.sent_numbers = np.ndarray((self.log_size,), dtype=np.uint64, buffer=buffer, offset=16)
+        self.sent_times = np.ndarray((self.log_size,), dtype=np.float64, buffer=buffer, offset=log)
+        self.marks = np.ndarray((slots, 2), dtype=np.uint64, buffer=buffer, offset=log + 8 * self.log_size)
+        self.frames = np.ndarray((slots, num_pixels, 4), dtype=np.uint8, buffer=buffer,
+                                 offset=log + 8 * self.log_size + 16 * slots)
+
+    @classmethod
+    def size(cls, num_pixels, slots=4):
+        """
+        Routine to work out the memory needed for a ring
+        :param num_pixels: INT - Number of neo pixels in each frame
+        :param slots: INT - Number of frames held
+        :return: INT - Size in bytes
+        """
+        return 16 + 16 * cls.log_size + slots * (16 + num_pixels * 4)
+
+    def publish(self, frame):
+        """
+        Routine to write a frame into the next slot & make it the latest frame
+        :param frame: ARRAY - (pixels, 4) uint8 colour values
+        :return: INT - Frame number
+        """
+        number = int(self.header[0]) + 1
+        slot = number % self.slots
+        self.marks[slot, 0] = number
+        self.frames[slot] = frame
+        self.marks[slot, 1] = number
+        self.header[0] = number
+        return number
+
+    def read(self, frame, last=0):
+        """
+        Routine to copy the latest frame out of the ring, if it is newer than the last one read
+        :param frame: ARRAY - (pixels, 4) uint8 array to copy into
+        :param last: INT - Frame number last read
+        :return: INT - Frame number now in frame (last if there was no new frame, or it was being rewritten)
+        """
+        number = int(self.header[0])
+        if number == last:
+            return last
+        slot = number % self.slots
+        after = int(self.marks[slot, 1])
+        frame[:] = self.frames[slot]
+        if after != number or int(self.marks[slot, 0]) != number:
+            return last
+        return number
+
+    def mark_sent(self, number, when):
+        """
+        Routine for the reader to log a frame it has sent out to the pixels
+        :param number: INT - Frame number sent
+        :param when: FLOAT - Monotonic time it was sent
+        :return: None
+        """
+        sends = int(self.header[1])
+        entry = sends % self.log_size
+        self.sent_times[entry] = when
+        self.sent_numbers[entry] = number
+        self.header[1] = sends + 1
+
+    def sent_time(self, number):
+        """
+        Routine to look up when a frame reached the pixels - the reader skips frames it has no time for, so this is
+        the first frame sent at or after it
+        :param number: INT - Frame number
+        :return: FLOAT - Monotonic time it was sent (None if no frame at or after it has been sent)
+        """
+        logged = min(int(self.header[1]), self.log_size)
+        numbers = self.sent_numbers[:logged]
+        later = numbers >= number
+        if not later.any():
+            return None
+        return float(self.sent_times[:logged][later][np.argmin(numbers[later])])
+
+
+def _output_process(memory_name, output, num_pixels, pin, brightness, fps, slots, stop, test, parent, options=None):
+    """
+    Routine run in the output process - takes the latest frame from the ring on its own frame clock & sends it out
+    through the real pixel output
+    :param memory_name: STRING - Name of the shared memory block holding the ring
+    :param output: STRING - Pixel output to drive, one of DRIVERS
+    :param num_pixels: INT - Number of neo pixels in the chain
+    :param pin: INT - GPIO pin the chain is connected to
+    :param brightness: FLOAT - Brightness scale for the chain (0-1)
+    :param fps: FLOAT - Frames per second to write at
+    :param slots: INT - Number of frames in the ring
+    :param stop: OBJ - Event set when the process should finish
+    :param test: OBJ - Event set when the pixel test should be run
+    :param parent: INT - Process ID of the display, the output stops if it goes away
+    :param options: DICT - Extra settings for the pixel output, e.g. network targets
+    :return: None
+    """
+    from Engine import FrameClock
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    ring = FrameRing(memory.buf, num_pixels, slots)
+    driver = create_driver(output, num_pixels, pin, brightness, options=options)
+    frame = np.zeros((num_pixels, 4), dtype=np.uint8)
+    clock = FrameClock(fps)
+    last = 0
+    try:
+        while not stop.is_set() and os.getppid() == parent:
+            clock.wait()
+            clock.tick()
+            if test.is_set():
+                test.clear()
+                driver.test()
+            last = ring.read(frame, last)
+            if driver.show(frame):
+                ring.mark_sent(last, time.monotonic())
+    finally:
+        driver.close()
+        del ring
+        memory.close()
+
+
+class ProcessDriver(OutputDriver):
+    """
+    Class for running a pixel output in its own process, so GUI load in the display process never delays a pixel
+    write. Committed frames are published to a ring in shared memory, and the output process writes the latest one
+    on its own frame clock. The output process also holds back frames while the strip refreshes. If the output
+    process stops, the pixels are driven from the display process instead
+    """
+
+    slots = 4
+
+    def __init__(self, num_pixels, pin=None, brightness=1.0, clock=time.monotonic, output='neopixel', fps=60.0,
+                 options=None):
+        """
+        Routine to start the output process
+        :param num_pixels: INT - Number of neo pixels in the chain
+        :param pin: INT - GPIO pin the chain is connected to
+        :param brightness: FLOAT - Brightness scale for the chain (0-1)
+        :param clock: FUNCTION - Monotonic time source in seconds
+        :param output: STRING - Pixel output to run in the process, one of DRIVERS
+        :param fps: FLOAT - Frames per second for the output process to write at
+        :param options: DICT - Extra settings for the pixel output, e.g. network targets
+        """
+        OutputDriver.__init__(self, num_pixels, pin, brightness, clock)
+        self.min_interval = 0.0     # the output process holds frames back while the strip refreshes
+        self.output = output
+        self.options = options
+        self.fallback = None        # output in this process, once the output process has stopped
+
+        context = multiprocessing.get_context('spawn')
+        self.memory = shared_memory.SharedMemory(create=True, size=FrameRing.size(num_pixels, self.slots))
+        self.ring = FrameRing(self.memory.buf, num_pixels, self.slots)
+        self.ring.header[:] = 0
+        self.stop = context.Event()
+        self.test_request = context.Event()
+        self.process = context.Process(target=_output_process, name='pixel output', daemon=True,
+                                       args=(self.memory.name, output, num_pixels, pin, brightness, fps, self.slots,
+                                             self.stop, self.test_request, os.getpid(), options))
+        self.process.start()
+
+    def write(self):
+        if self.fallback is None and not self.process.is_alive():
+            self.__start_fallback__()
+        if self.fallback is not None:
+            self.fallback.buffer[:] = self.buffer
+            self.fallback.write()
+            self.fallback.front, self.fallback.back = self.fallback.back, self.fallback.front
+            return
+        self.ring.publish(self.buffer)
+
+    def __start_fallback__(self):
+        """
+        Routine to drive the pixels from this process after the output process has stopped (or failed to start)
+        :return: None
+        """
+        logging.error("Pixel output process stopped (exit code %s), driving the %s output from the display process",
+                      self.process.exitcode, self.output)
+        self.fallback = create_driver(self.output, self.num_pixels, self.pin, self.brightness, options=self.options)
+
+    def sent_time(self, number):
+        # Frames are numbered the same in the ring, the output process logs when it sent each one
+        if self.fallback is not None:
+            return OutputDriver.sent_time(self, number)
+        return self.ring.sent_time(number)
+
+    def test(self):
+        if self.fallback is not None:
+            self.fallback.test()
+        else:
+            self.test_request.set()
+
+    def close(self):
+        self.stop.set()
+        self.process.join(2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.fallback is not None:
+            self.fallback.close()
+        del self.ring
+        self.memory.close()
+        self.memory.unlink()
+
+
+class ChainedDriver(OutputDriver):
+    """
+    Class for several neo pixel chains on separate GPIO pins, run as one long chain - each chain's pixels follow on
+    from the chain before. Every chain has its own output & worker thread, and a commit hands the frame to all the
+    workers & waits for them, so the chains are written in parallel and always show the same frame
+    """
+
+    def __init__(self, chains, brightness=1.0, clock=time.monotonic, output='neopixel', process_fps=None):
+        """
+        Routine to create an output for each chain
+        :param chains: LIST - (GPIO pin, number of neo pixels) for each chain, in order
+        :param brightness: FLOAT - Brightness scale for the chains (0-1)
+        :param clock: FUNCTION - Monotonic time source in seconds
+        :param output: STRING - Pixel output for each chain, one of DRIVERS
+        :param process_fps: FLOAT - Run each chain's output in its own process at this frame rate (None runs them in
+        this process)
+        """
+        OutputDriver.__init__(self, sum(length for _, length in chains), None, brightness, clock)
+        self.chains = [create_driver(output, length, pin, brightness, process_fps) for pin, length in chains]
+        self.offsets = []
+        start = 0
+        for chain in self.chains:
+            self.offsets.append(start)
+            start += chain.num_pixels
+
+        # The longest chain sets how often frames can be sent, so no chain ever holds a frame back on its own
+        self.min_interval = max(chain.min_interval for chain in self.chains)
+        for chain in self.chains:
+            chain.min_interval = 0.0
+        self.workers = ThreadPoolExecutor(max_workers=len(self.chains), thread_name_prefix='pixel chain')
+        self.chain_frames = {}      # chains that sent each recent frame, with their own frame numbers
+
+    def write(self):
+        frame = self.buffer
+        for chain, start in zip(self.chains, self.offsets):
+            chain.buffer[:] = frame[start:start + chain.num_pixels]
+        sent = list(self.workers.map(lambda chain: chain.commit(), self.chains))
+
+        number = self.writes + 1
+        self.chain_frames[number] = [(chain, chain.writes) for chain, chain_sent in zip(self.chains, sent)
+                                     if chain_sent]
+        self.chain_frames.pop(number - FrameRing.log_size, None)
+
+    def sent_time(self, number):
+        # A frame has been sent once every chain that changed has sent its part - the last to do so sets the time
+        parts = self.chain_frames.get(number)
+        if parts is None:
+            return None
+        times = [chain.sent_time(chain_number) for chain, chain_number in parts]
+        if None in times:
+            return None
+        return max(times, default=self.last_write)
+
+    def test(self):
+        frame = np.zeros((self.num_pixels, 4), dtype=np.uint8)
+        frame[self.offsets] = (0, 255, 0, 0)
+        self.show(frame)
+        time.sleep(max(max(chain.test_hold for chain in self.chains), self.min_interval))
+        frame[self.offsets] = 0
+        self.show(frame)
+
+    def close(self):
+        self.workers.shutdown()
+        for chain in self.chains:
+            chain.close()
+
+
+NETWORK_DRIVERS = {'e131': E131Driver,
+                   'artnet': ArtNetDriver}
+
+DRIVERS = {'neopixel': NeoPixelDriver,
+           'fake': FakeDriver,
+           **NETWORK_DRIVERS}
+
+
+def create_driver(name, num_pixels, pin=None, brightness=1.0, process_fps=None, options=None):
+    """
+    Routine to create a pixel output by name
+    :param name: STRING - Output name, one of DRIVERS
+    :param num_pixels: INT - Number of neo pixels in the chain
+    :param pin: INT - GPIO pin the chain is connected to
+    :param brightness: FLOAT - Brightness scale for the chain (0-1)
+    :param process_fps: FLOAT - Run the output in its own process at this frame rate (None runs it in this process)
+    :param options: DICT - Extra settings passed on to the output, e.g. targets for the network outputs
+    :return: OBJ - OutputDriver
+    """
+    if name not in DRIVERS:
+        raise ValueError("Unknown pixel output '%s', expected one of: %s" % (name, ", ".join(DRIVERS)))
+    if process_fps and shared_memory is None:
+        logging.warning("Output Process needs Python 3.8 or later, driving the %s output from the display process",
+                        name)
+    elif process_fps:
+        return ProcessDriver(num_pixels, pin, brightness, output=name, fps=process_fps, options=options)
+    return DRIVERS[name](num_pixels, pin, brightness, **(options or {}))
+
+
+def create_output(name, chains, brightness=1.0, process_fps=None, options=None):
+    """
+    Routine to create the pixel output for one or more neo pixel chains
+    :param name: STRING - Output name, one of DRIVERS
+    :param chains: LIST - (GPIO pin, number of neo pixels) for each chain, in order
+    :param brightness: FLOAT - Brightness scale for the chains (0-1)
+    :param process_fps: FLOAT - Run the output in its own process at this frame rate (None runs it in this process)
+    :param options: DICT - Extra settings passed on to the output, e.g. targets for the network outputs
+    :return: OBJ - OutputDriver
+    """
+    if name in NETWORK_DRIVERS:
+        # The universes carry the whole display in pixel order, the chains are wired up at the receiving end
+        return create_driver(name, sum(length for _, length in chains), None, brightness, process_fps, options)
+    if len(chains) == 1:
+        pin, length = chains[0]
+        return create_driver(name, length, pin, brightness, process_fps, options)
+    return ChainedDriver(chains, brightness, output=name, process_fps=process_fps)
@@ -0,0 +1,221 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import numpy as np
+
+# Pattern orderings & the named origins each one can start from - radial & chain patterns can also start from a
+# crystal, and any pattern with an origin can pick one at random each time it runs
+ORDERINGS = ('axis', 'diagonal', 'radial', 'chain', 'random')
+ORIGINS = {
+    'axis': ('left', 'right', 'top', 'bottom'),
+    'diagonal': ('top left', 'top right', 'bottom left', 'bottom right'),
+    'radial': ('centre', 'left', 'right', 'top', 'bottom', 'top left', 'top right', 'bottom left', 'bottom right'),
+    'chain': ('start', 'end', 'centre'),
+    'random': (),
+}
+
+# Point on the grid each named radial origin sits at - (row, column) as a fraction of the grid's height & width
+ANCHORS = {
+    'centre': (0.5, 0.5), 'left': (0.5, 0.0), 'right': (0.5, 1.0), 'top': (0.0, 0.5), 'bottom': (1.0, 0.5),
+    'top left': (0.0, 0.0), 'top right': (0.0, 1.0), 'bottom left': (1.0, 0.0), 'bottom right': (1.0, 1.0),
+}
+
+
+def _freeze(slots):
+    """
+    Routine to turn a list of crystal slots into a read only array
+    :param slots: LIST - Crystal slot numbers
+    :return: ARRAY - Read only array of slot numbers
+    """
+    stage = np.array(slots, dtype=np.intp)
+    stage.flags.writeable = False
+    return stage
+
+
+def _group_stages(stage_numbers, lit, length):
+    """
+    Routine to group crystal slots by stage number
+    :param stage_numbers: ARRAY - Stage number for each crystal slot
+    :param lit: ARRAY - BOOLEAN mask of crystals that have a neo pixel
+    :param length: INT - Number of stages in the plan (may include empty stages)
+    :return: TUPLE - Read only array of crystal slots for each stage
+    """
+    return tuple(_freeze(np.flatnonzero((stage_numbers == stage) & lit)) for stage in range(length))
+
+
+def _sorted_stages(stage_numbers, slots):
+    """
+    Routine to group crystal slots by stage number with one sort, for plans where every stage up to the last is kept
+    :param stage_numbers: ARRAY - Stage number (0 or more) for each crystal slot in slots
+    :param slots: ARRAY - Crystal slots to group
+    :return: TUPLE - Read only array of crystal slots for each stage, each in slot order
+    """
+    order = np.argsort(stage_numbers, kind='stable')
+    ordered = stage_numbers[order]
+    length = int(ordered[-1]) + 1 if len(ordered) else 0
+    bounds = np.searchsorted(ordered, np.arange(length + 1))
+    return tuple(_freeze(slots[order[bounds[stage]:bounds[stage + 1]]]) for stage in range(length))
+
+
+def compile_stage_plans(rows, columns, pixels, max_rows, max_cols, full_row, num_pixels):
+    """
+    Routine to build the stage plan for every fixed wave sequence. Each plan is a tuple of stages, each stage a read
+    only array of crystal slots to pulse together. Only crystals with a neo pixel are included, empty stages are kept
+    so the wave timing matches the grid shape
+    :param rows: LIST - Row each crystal slot sits in on the display
+    :param columns: LIST - Column each crystal slot sits in on the display
+    :param pixels: LIST - Neo pixel number for each crystal slot (-1 if no pixel)
+    :param max_rows: INT - Index of the last row on the display
+    :param max_cols: INT - Index of the last column on the display
+    :param full_row: BOOLEAN - Last crystal filled its row
+    :param num_pixels: INT - Number of neo pixels in the chain
+    :return: DICT - Stage plan for each sequence routine name
+    """
+    rows = np.asarray(rows, dtype=int)
+    columns = np.asarray(columns, dtype=int)
+    pixels = np.asarray(pixels, dtype=int)
+    lit = pixels > -1
+
+    # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+    # Directional waves - stage number worked out from each crystal's grid position
+    half_rows = max_rows // 2
+    half_cols = max_cols // 2
+    last_row = max_rows if full_row else max_rows - 1
+
+    stage_numbers = {
+        '__left_wave__': np.abs(rows - half_rows) + columns,
+        '__right_wave__': np.abs(rows - half_rows) + max_cols - columns,
+        '__top_wave__': np.abs(columns - half_cols) + rows,
+        '__bottom_wave__': np.abs(columns - half_cols) + max_rows - rows,
+        '__top_left_wave__': np.maximum(rows, columns),
+        '__top_right_wave__': np.where(rows > (max_cols - columns - 1), rows, max_cols - columns),
+        '__bottom_left_wave__': np.where((last_row - rows) > columns, last_row - rows, columns),
+        '__bottom_right_wave__': np.where((last_row - rows) < (max_cols - columns), max_cols - columns,
+                                          last_row - rows),
+    }
+
+    plans = {}
+    for routine, numbers in stage_numbers.items():
+        # Bottom left wave only sizes its stages from crystals with a neo pixel
+        if routine == '__bottom_left_wave__':
+            length = int(numbers[lit].max(initial=0)) + 1
+        else:
+            length = int(numbers.max(initial=0)) + 1
+        plans[routine] = _group_stages(numbers, lit, length)
+
+    # ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+    # Chain waves - stages follow the neo pixel chain
+    plans['__chain_wave__'] = tuple(_freeze(np.flatnonzero(pixels == neo)) for neo in range(num_pixels))
+    plans['__reverse_chain_wave__'] = tuple(_freeze(np.flatnonzero(pixels == num_pixels - neo))
+                                            for neo in range(num_pixels + 1))
+
+    centre = []
+    lower_pixel = int(num_pixels / 2)
+    upper_pixel = int(num_pixels / 2)
+    while lower_pixel > -1 and upper_pixel <= num_pixels:
+        centre.append(_freeze(np.flatnonzero((pixels == lower_pixel) | (pixels == upper_pixel))))
+        lower_pixel -= 1
+        upper_pixel += 1
+    plans['__centre_chain_wave__'] = tuple(centre)
+
+    return plans
+
+
+def ripple_rings(rows, columns, xs=None, ys=None):
+    """
+    Routine to build the spatial index for ripple sequences - the ring every crystal falls in for a ripple started
+    from each crystal. Grid positions give square rings (the larger of the row & column distance), physical X/Y
+    positions give round rings one crystal spacing wide, so irregular layouts ripple evenly
+    :param rows: LIST - Row each crystal slot sits in on the display
+    :param columns: LIST - Column each crystal slot sits in on the display
+    :param xs: LIST - Physical X position of each crystal slot (None to use the grid)
+    :param ys: LIST - Physical Y position of each crystal slot (None to use the grid)
+    :return: ARRAY - (crystals, crystals) ring number of each crystal slot (column) for a ripple from each slot (row)
+    """
+    if xs is not None and ys is not None:
+        points = np.column_stack([xs, ys]).astype(float)
+        distance = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+
+        # Ring width is the typical gap between neighbouring crystals
+        spacing = 0.0
+        if len(points) > 1:
+            spacing = float(np.median((distance + np.diag(np.full(len(points), np.inf))).min(axis=1)))
+        if not spacing > 0:
+            spacing = 1.0
+        return np.rint(distance / spacing).astype(np.intp)
+
+    rows = np.asarray(rows, dtype=np.intp)
+    columns = np.asarray(columns, dtype=np.intp)
+    return np.maximum(np.abs(rows[:, None] - rows[None, :]), np.abs(columns[:, None] - columns[None, :]))
+
+
+def compile_ripple_plans(rings, pixels):
+    """
+    Routine to build the stage plan for a ripple from every crystal, from the spatial index. Each plan has a stage
+    for every ring out to the furthest crystal, holding the crystals with a neo pixel in that ring (each crystal once,
+    in slot order). Empty rings are kept so the ripple timing follows the layout
+    :param rings: ARRAY - Ring numbers from ripple_rings
+    :param pixels: LIST - Neo pixel number for each crystal slot (-1 if no pixel)
+    :return: TUPLE - Stage plan for a ripple from each crystal slot
+    """
+    lit = np.flatnonzero(np.asarray(pixels, dtype=int) > -1)
+    return tuple(_sorted_stages(origin_rings, lit) for origin_rings in rings[:, lit])
+
+
+def anchor_slot(anchor, rows, columns, pixels):
+    """
+    Routine to find the crystal with a neo pixel nearest to a named point on the grid, for radial patterns
+    :param anchor: STRING - Point name, one of ANCHORS
+    :param rows: LIST - Row each crystal slot sits in on the display
+    :param columns: LIST - Column each crystal slot sits in on the display
+    :param pixels: LIST - Neo pixel number for each crystal slot (-1 if no pixel)
+    :return: INT - Crystal slot (None if no crystal has a neo pixel)
+    """
+    rows = np.asarray(rows, dtype=float)
+    columns = np.asarray(columns, dtype=float)
+    lit = np.flatnonzero(np.asarray(pixels, dtype=int) > -1)
+    if not len(lit):
+        return None
+    row_fraction, column_fraction = ANCHORS[anchor]
+    distance = np.hypot(rows[lit] - row_fraction * rows.max(), columns[lit] - column_fraction * columns.max())
+    return int(lit[np.argmin(distance)])
+
+
+def compile_pattern_plan(ordering, origin, rows, columns, pixels):
+    """
+    Routine to build the stage plan for a pattern from the Patterns table. Axis patterns sweep a straight line across
+    the grid from one side, diagonal patterns sweep from a corner & chain patterns follow the neo pixel chain. Radial
+    patterns use the ripple plans (see compile_ripple_plans) & random patterns are shuffled each time they run
+    :param ordering: STRING - 'axis', 'diagonal' or 'chain'
+    :param origin: STRING/INT - Named origin from ORIGINS, or the crystal slot a chain pattern starts from
+    :param rows: LIST - Row each crystal slot sits in on the display
+    :param columns: LIST - Column each crystal slot sits in on the display
+    :param pixels: LIST - Neo pixel number for each crystal slot (-1 if no pixel)
+    :return: TUPLE - Read only array of crystal slots for each stage
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    columns = np.asarray(columns, dtype=np.intp)
+    pixels = np.asarray(pixels, dtype=np.intp)
+    lit = np.flatnonzero(pixels > -1)
+    last_row = int(rows.max(initial=0))
+    last_column = int(columns.max(initial=0))
+    last_pixel = int(pixels.max(initial=0))
+
+    if ordering == 'axis':
+        stage_numbers = {'left': columns, 'right': last_column - columns,
+                         'top': rows, 'bottom': last_row - rows}[origin]
+    elif ordering == 'diagonal':
+        stage_numbers = {'top left': rows + columns, 'top right': rows + last_column - columns,
+                         'bottom left': last_row - rows + columns,
+                         'bottom right': last_row - rows + last_column - columns}[origin]
+    elif ordering == 'chain':
+        if origin == 'start':
+            stage_numbers = pixels
+        elif origin == 'end':
+            stage_numbers = last_pixel - pixels
+        elif origin == 'centre':
+            stage_numbers = np.abs(pixels - last_pixel // 2)
+        else:
+            stage_numbers = np.abs(pixels - pixels[origin])
+    else:
+        raise ValueError("No stage plan for %s ordering" % ordering)
+    return _sorted_stages(stage_numbers[lit], lit)
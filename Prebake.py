@@ -0,0 +1,144 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import os
+import random
+import hashlib
+import logging
+import multiprocessing
+import multiprocessing.util
+import numpy as np
+import Recording
+
+# Sequences that pick a random start point or order each time they run - several versions of each are baked
+RANDOM_ROUTINES = ('__rain_drop_seq__', '__cracked_seq__', '__random_crystal__')
+
+# Bumped whenever baking changes what is recorded, so recordings cached by an older version are baked again
+BAKE_VERSION = 2
+
+_display = None     # headless display used by each pool worker, see _start_worker
+
+
+def cache_key(display):
+    """
+    Routine to build the key for a display's baked frames - a hash of everything read from the database plus the grid
+    geometry, so any edit to the database or a change of layout bakes a fresh set
+    :param display: OBJ - Display, loaded from the database
+    :return: STRING - Hex digest
+    """
+    geometry = (display.max_rows, display.max_cols, display.full_row, display.num_pixels,
+                [(crystal.row, crystal.column, crystal.pixel) for crystal in display.slots])
+    digest = hashlib.sha256()
+    digest.update(repr(display.data).encode('utf-8'))
+    digest.update(repr(geometry).encode('utf-8'))
+    digest.update(repr((Recording.VERSION, BAKE_VERSION)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def bake_jobs(display, variants):
+    """
+    Routine to list the recordings to bake - one for each enabled sequence & pattern, several for the random sequences
+    and patterns with a random origin or order
+    :param display: OBJ - Display, loaded from the database
+    :param variants: INT - Number of versions to bake of each random sequence
+    :return: LIST - (routine, variant) for each recording
+    """
+    jobs = []
+    for routine in sorted({sequence_row.routine for sequence_row in display.sequences}):
+        count = max(variants, 1) if routine in RANDOM_ROUTINES or routine in display.random_patterns else 1
+        jobs.extend((routine, variant) for variant in range(count))
+    return jobs
+
+
+def _start_worker(database):
+    """
+    Routine run once in each pool process to load its own headless display
+    :param database: STRING - Path to the SQLite database file
+    :return: None
+    """
+    global _display
+    from Main import Display
+    logging.disable(logging.INFO)
+    _display = Display(output='fake', database=database)
+    multiprocessing.util.Finalize(None, _stop_worker, exitpriority=10)
+
+
+def _stop_worker():
+    """
+    Routine run as each pool process exits to stop its display, closing its database watcher & pixel output
+    :return: None
+    """
+    global _display
+    if _display is not None:
+        _display.stop()
+        _display = None
+
+
+def ends_idle(display, path):
+    """
+    Routine to check a recording finishes with every pixel back at its idle glow - a sequence played once hands
+    straight back to the idle display at the end of the recording, so any other last frame shows as a jump
+    :param display: OBJ - Display the recording was made from
+    :param path: STRING - Path to the recording
+    :return: BOOLEAN - Last frame is the idle frame (True for an empty recording)
+    """
+    recording = Recording.FrameRecording(path)
+    try:
+        return not len(recording) or np.array_equal(recording.pixels(len(recording) - 1), display.idle_frame())
+    finally:
+        recording.close()
+
+
+def _bake(job):
+    """
+    Routine run in a pool process to bake one recording. The random module is seeded from the job, so the same
+    variant always bakes the same frames
+    :param job: TUPLE - (routine, variant, path)
+    :return: TUPLE - (routine, path, frames written, recording ends on the idle frame)
+    """
+    routine, variant, path = job
+    random.seed("%s-%d" % (routine, variant))
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    frames = _display.record_sequence(routine, temp_path)
+    idle = ends_idle(_display, temp_path)
+    os.replace(temp_path, path)
+    return routine, path, frames, idle
+
+
+def prebake(database='Crystals.db', cache_dir='bake_cache', variants=4, processes=None):
+    """
+    Routine to bake every enabled sequence into frame recordings, spread over a pool of processes (one per CPU core
+    by default). Recordings already in the cache for the current database & layout are reused
+    :param database: STRING - Path to the SQLite database file
+    :param cache_dir: STRING - Folder holding the baked frames, one sub folder per cache key
+    :param variants: INT - Number of versions to bake of each random sequence
+    :param processes: INT - Number of pool processes (None uses every CPU core)
+    :return: DICT - List of recording paths for each sequence routine
+    """
+    from Main import Display
+    display = Display(output='fake', database=database)
+    key = cache_key(display)
+    folder = os.path.join(cache_dir, key)
+    os.makedirs(folder, exist_ok=True)
+
+    baked = {}
+    missing = []
+    for routine, variant in bake_jobs(display, variants):
+        path = os.path.join(folder, "%s%d.kyb" % (routine.strip('_'), variant))
+        baked.setdefault(routine, []).append(path)
+        if not os.path.exists(path):
+            missing.append((routine, variant, path))
+    display.stop()
+
+    logging.info("Baked frames %s - %d recordings cached, %d to bake", key, sum(map(len, baked.values())) -
+                 len(missing), len(missing))
+    if missing:
+        with multiprocessing.Pool(processes, initializer=_start_worker, initargs=(database,)) as pool:
+            for routine, path, frames, idle in pool.imap_unordered(_bake, missing):
+                logging.info("Baked %s - %d frames", path, frames)
+                if not idle:
+                    logging.warning("Baked %s does not end with every crystal idle - it will jump to idle when played "
+                                    "once", path)
+            # Let the pool processes exit on their own, so each stops its display - leaving the block terminates them
+            pool.close()
+            pool.join()
+    return baked
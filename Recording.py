@@ -0,0 +1,167 @@
+# ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+# Import Statements
+import os
+import struct
+import zlib
+import numpy as np
+
+# File layout - a fixed header followed by fixed size frame records, so a recording can be memory mapped & indexed
+# directly. Each record is the frame time (seconds from the start), the RGBW bytes for every neo pixel & the colour
+# ramp entry shown on every crystal button
+MAGIC = b'KYBF'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIIId')     # magic, version, spare, pixels, buttons, frames, ramp checksum, duration
+
+
+def frame_dtype(num_pixels, num_buttons):
+    """
+    Routine to build the record layout for a recording
+    :param num_pixels: INT - Number of neo pixels in the chain
+    :param num_buttons: INT - Number of crystal buttons
+    :return: DTYPE - numpy structured type for one frame
+    """
+    return np.dtype([('time', '<f8'),
+                     ('pixels', np.uint8, (num_pixels, 4)),
+                     ('buttons', '<u2', (num_buttons,))])
+
+
+def ramp_checksum(ramps):
+    """
+    Routine to fingerprint a colour ramp table - button entries in a recording are only meaningful with the same table
+    :param ramps: OBJ - ColourRamps
+    :return: INT - CRC32 of the table's button colours
+    """
+    return zlib.crc32(ramps.button.tobytes())
+
+
+class FrameRecorder:
+    """
+    Class for writing a frame recording. Frames are appended as they are added, and a frame that matches the one
+    before it is dropped - its time is covered by the previous frame. The header is finished off by close()
+    """
+
+    def __init__(self, path, num_pixels, num_buttons, ramps):
+        """
+        Routine to create the recording file
+        :param path: STRING - Path to write the recording to
+        :param num_pixels: INT - Number of neo pixels in the chain
+        :param num_buttons: INT - Number of crystal buttons
+        :param ramps: OBJ - ColourRamps the button entries refer to
+        """
+        self.path = path
+        self.num_pixels = num_pixels
+        self.num_buttons = num_buttons
+        self.checksum = ramp_checksum(ramps)
+        self.record = np.zeros(1, dtype=frame_dtype(num_pixels, num_buttons))
+        self.last = None
+        self.frames = 0
+        self.duration = 0.0
+        self.file = open(path, 'wb')
+        self.__write_header__()
+
+    def __write_header__(self):
+        """
+        Routine to write the header at the start of the file
+        :return: None
+        """
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, self.num_pixels, self.num_buttons, self.frames,
+                                    self.checksum, self.duration))
+
+    def add(self, time_, pixels, buttons):
+        """
+        Routine to add a frame
+        :param time_: FLOAT - Frame time in seconds from the start of the recording
+        :param pixels: ARRAY - (pixels, 4) uint8 colour values
+        :param buttons: ARRAY - Colour ramp entry shown on each crystal button
+        :return: BOOLEAN - Frame was written (False if it matched the previous frame)
+        """
+        self.duration = time_
+        if self.last is not None and np.array_equal(pixels, self.last[0]) and np.array_equal(buttons, self.last[1]):
+            return False
+
+        self.record['time'] = time_
+        self.record['pixels'][0] = pixels
+        self.record['buttons'][0] = buttons
+        self.last = (np.array(pixels, dtype=np.uint8), np.array(buttons, dtype=np.uint16))
+        self.file.write(self.record.tobytes())
+        self.frames += 1
+        return True
+
+    def close(self):
+        """
+        Routine to fill in the frame count & duration, then close the file
+        :return: None
+        """
+        self.__write_header__()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameRecording:
+    """
+    Class for reading a frame recording. The frames are memory mapped, so only the pages played are read from disk
+    """
+
+    def __init__(self, path):
+        """
+        Routine to open & check a recording
+        :param path: STRING - Path to the recording
+        """
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("%s is not a frame recording" % path)
+        magic, version, _, self.num_pixels, self.num_buttons, count, self.checksum, self.duration = \
+            HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("%s is not a frame recording" % path)
+        if version != VERSION:
+            raise ValueError("%s is recording version %d, expected %d" % (path, version, VERSION))
+
+        self.path = path
+        dtype = frame_dtype(self.num_pixels, self.num_buttons)
+        if count and os.path.getsize(path) < HEADER.size + count * dtype.itemsize:
+            raise ValueError("%s is truncated" % path)
+        self.frames = np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,)) if count \
+            else np.zeros(0, dtype=dtype)
+        self.times = np.array(self.frames['time'])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def index(self, time_):
+        """
+        Routine to find the frame showing at a time
+        :param time_: FLOAT - Time in seconds from the start of the recording
+        :return: INT - Frame number
+        """
+        return max(int(np.searchsorted(self.times, time_, side='right')) - 1, 0)
+
+    def pixels(self, index):
+        """
+        Routine to fetch a frame's neo pixel colours
+        :param index: INT - Frame number
+        :return: ARRAY - (pixels, 4) uint8 colour values (read only view of the file)
+        """
+        return self.frames['pixels'][index]
+
+    def buttons(self, index):
+        """
+        Routine to fetch a frame's button colour entries
+        :param index: INT - Frame number
+        :return: ARRAY - Colour ramp entry for each crystal button (read only view of the file)
+        """
+        return self.frames['buttons'][index]
+
+    def close(self):
+        """
+        Routine to release the memory map - it is unmapped once no frame views are left
+        :return: None
+        """
+        self.frames = self.frames[:0].copy()